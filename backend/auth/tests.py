@@ -1,3 +1,60 @@
-from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from rest_framework.test import APITestCase
+from rest_framework import status
+from locks.models import Lock
+from permissions.models import LockPermission
+from users.models import UserBadgeCode, UserKeypadCode
+from users.utils import update_user_badge_code, update_user_keypad_code
+from .utils import get_user_by_badge_code, get_user_by_keypad_code
 
-# Create your tests here.
+User = get_user_model()
+
+
+class CodeLookupTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='alice', password='pw')
+        self.other = User.objects.create_user(username='bob', password='pw')
+        self.lock = Lock.objects.create(
+            name='Front door', auth_methods=['badge', 'keypad'])
+        LockPermission.objects.create(user=self.user, lock=self.lock)
+
+    def test_keypad_code_resolved_by_fingerprint(self):
+        code = update_user_keypad_code(self.user)
+        update_user_keypad_code(self.other)
+
+        stored = UserKeypadCode.objects.get(user=self.user)
+        self.assertIsNotNone(stored.code_fingerprint)
+        self.assertEqual(get_user_by_keypad_code(code), self.user)
+        self.assertEqual(get_user_by_keypad_code(int(code)), self.user)
+
+    def test_badge_code_resolved_by_fingerprint(self):
+        code = update_user_badge_code(self.user)
+        self.assertEqual(get_user_by_badge_code(code), self.user)
+        self.assertIsNone(get_user_by_badge_code(code + 'x'))
+
+    def test_invalid_keypad_code(self):
+        self.assertIsNone(get_user_by_keypad_code('abc'))
+        self.assertIsNone(get_user_by_keypad_code('000000'))
+
+    def test_legacy_code_gets_fingerprint_on_login(self):
+        # Code créé avant l'index : seul le hash est connu
+        UserBadgeCode.objects.bulk_create([
+            UserBadgeCode(user=self.user, code_hash=make_password('legacy-badge'))
+        ])
+
+        self.assertEqual(get_user_by_badge_code('legacy-badge'), self.user)
+        self.assertIsNotNone(
+            UserBadgeCode.objects.get(user=self.user).code_fingerprint)
+        self.assertEqual(get_user_by_badge_code('legacy-badge'), self.user)
+
+    def test_badge_login_view(self):
+        code = update_user_badge_code(self.user)
+        response = self.client.post(
+            '/auth/badge/', {'code': code, 'lock': self.lock.id_lock}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['user']['username'], 'alice')
+
+        response = self.client.post(
+            '/auth/badge/', {'code': 'nope', 'lock': self.lock.id_lock}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
@@ -1,22 +1,55 @@
 from django.contrib.auth.hashers import check_password
-from users.models import UserKeypadCode, UserBadgeCode
+from users.models import UserKeypadCode, UserBadgeCode, code_fingerprint
+from permissions.access_lists import store_lock_fingerprints
+
+CREDENTIAL_METHODS = {UserBadgeCode: 'badge', UserKeypadCode: 'keypad'}
+
+
+def _get_user_by_code(model, raw_code):
+    """
+    Resolve the owner of a code through its indexed fingerprint, then verify
+    exactly one PBKDF2 hash. Once verified, the raw code fills in the
+    per-lock fingerprints of the locks added since the code was set.
+
+    Rows created before the fingerprint column existed have no fingerprint
+    yet: they are checked one by one as before, and the matching row gets its
+    fingerprint filled in so the next login takes the indexed path.
+    """
+    fingerprint = code_fingerprint(raw_code)
+
+    code = model.objects.select_related("user").filter(
+        code_fingerprint=fingerprint).first()
+    if code is not None:
+        if not code.check_code(raw_code):
+            return None
+    else:
+        for code in model.objects.select_related("user").filter(code_fingerprint__isnull=True):
+            if check_password(raw_code, code.code_hash):
+                code.code_fingerprint = fingerprint
+                code.save(update_fields=["code_fingerprint"])
+                break
+        else:
+            return None
+
+    # Serrures ajoutées depuis que le code a été défini (listes hors ligne)
+    store_lock_fingerprints(code.user_id, CREDENTIAL_METHODS[model], raw_code, only_missing=True)
+    return code.user
+
 
 def get_user_by_keypad_code(raw_code):
-    int_code = int(raw_code)
+    try:
+        int_code = int(raw_code)
+    except (TypeError, ValueError):
+        return None
     if not int_code:
         return None
 
-    for code in UserKeypadCode.objects.select_related("user"):
-        if check_password(int_code, code.code_hash):
-            return code.user
-    return None
+    # Les codes sont générés sur 6 chiffres (voir users.utils)
+    return _get_user_by_code(UserKeypadCode, f"{int_code:06}")
 
 
 def get_user_by_badge_code(raw_code):
     if not raw_code:
         return None
 
-    for code in UserBadgeCode.objects.select_related("user"):
-        if check_password(raw_code, code.code_hash):
-            return code.user
-    return None
+    return _get_user_by_code(UserBadgeCode, str(raw_code))
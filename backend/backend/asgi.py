@@ -3,6 +3,12 @@ ASGI config for backend project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Only the Server-Sent Events stream (/locks/stream/) is served here, by a
+separate process (e.g. `daphne -p 8001 backend.asgi:application`): each
+open stream waits on a queue without holding a thread. The rest of the API
+stays on WSGI (backend.wsgi), where sync views run on as many threads as
+the server has; other paths answer 404 here.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
 """
@@ -13,4 +19,21 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+ASGI_PATHS = ('/locks/stream/',)
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'http' and scope['path'] not in ASGI_PATHS:
+        await send({
+            'type': 'http.response.start',
+            'status': 404,
+            'headers': [(b'content-type', b'application/json')],
+        })
+        await send({
+            'type': 'http.response.body',
+            'body': b'{"error": "Not served by the ASGI application, see backend.wsgi"}',
+        })
+        return
+    await django_application(scope, receive, send)
@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 
 from pathlib import Path
 import os
+from django.core.exceptions import ImproperlyConfigured
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -22,6 +23,10 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 
 SECRET_KEY = os.getenv("DJANGO_SECRET_KEY")
 
+# Clé HMAC des empreintes de badge/keypad (voir users.models.code_fingerprint).
+# Par défaut SECRET_KEY ; la changer invalide l'index des codes existants.
+CREDENTIAL_INDEX_KEY = os.getenv("CREDENTIAL_INDEX_KEY")
+
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = True
 
@@ -80,6 +85,8 @@ TEMPLATES = [
     },
 ]
 
+# L'API est servie en WSGI ; seul le flux /locks/stream/ passe par l'application
+# ASGI, dans un process à part (voir backend/asgi.py)
 WSGI_APPLICATION = 'backend.wsgi.application'
 
 
@@ -98,6 +105,118 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+
+# 'access' : cache des décisions d'accès (permissions.utils). L'invalidation
+# (clé de génération) doit être vue par tous les workers : hors DEBUG, un
+# cache partagé est obligatoire (Redis, ou le cache base de données après
+# `createcachetable`). Le cache en mémoire, propre à chaque process, n'est
+# admis qu'en DEBUG et avec une durée de vie courte, pour qu'un code révoqué
+# ne reste pas accepté par un autre worker.
+ACCESS_CACHE_BACKEND = os.getenv('ACCESS_CACHE_BACKEND') or 'django.core.cache.backends.locmem.LocMemCache'
+ACCESS_CACHE_LOCAL = ACCESS_CACHE_BACKEND.endswith('LocMemCache')
+
+if ACCESS_CACHE_LOCAL and not DEBUG:
+    raise ImproperlyConfigured(
+        "ACCESS_CACHE_BACKEND must be shared between workers outside DEBUG "
+        "(e.g. django.core.cache.backends.redis.RedisCache or "
+        "django.core.cache.backends.db.DatabaseCache)."
+    )
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'access': {
+        'BACKEND': ACCESS_CACHE_BACKEND,
+        'LOCATION': os.getenv('ACCESS_CACHE_LOCATION') or 'access-decisions',
+        'TIMEOUT': int(os.getenv('ACCESS_CACHE_TIMEOUT') or (5 if ACCESS_CACHE_LOCAL else 300)),
+    },
+}
+
+if ACCESS_CACHE_LOCAL:
+    CACHES['access']['OPTIONS'] = {'MAX_ENTRIES': 100000}
+
+
+# Access logs (voir logs.utils.AccessLogWriter)
+# Écriture groupée en arrière-plan ; le fichier de débordement permet de
+# rejouer les logs non écrits après un crash. Les lignes refusées par la base,
+# ou au-delà des limites ci-dessous, partent dans accesslog-deadletter.jsonl.
+ACCESS_LOG_ASYNC = (os.getenv('ACCESS_LOG_ASYNC') or 'True') == 'True'
+ACCESS_LOG_FLUSH_SIZE = int(os.getenv('ACCESS_LOG_FLUSH_SIZE') or 200)
+ACCESS_LOG_FLUSH_INTERVAL = float(os.getenv('ACCESS_LOG_FLUSH_INTERVAL') or 1.0)
+ACCESS_LOG_SPILL_DIR = os.getenv('ACCESS_LOG_SPILL_DIR') or BASE_DIR / 'var' / 'accesslog'
+ACCESS_LOG_MAX_PENDING = int(os.getenv('ACCESS_LOG_MAX_PENDING') or 100000)
+ACCESS_LOG_MAX_RETRIES = int(os.getenv('ACCESS_LOG_MAX_RETRIES') or 100)
+
+# Partitions mensuelles des logs (voir logs.partitioning, commande
+# manage_log_partitions), seule rétention des lignes brutes : les access logs
+# sont archivés après LOG_RETENTION_MONTHS (rien n'est archivé si absent), les
+# mesures de batterie après BATTERY_RAW_RETENTION_MONTHS.
+LOG_PARTITION_MONTHS_AHEAD = int(os.getenv('LOG_PARTITION_MONTHS_AHEAD') or 3)
+LOG_RETENTION_MONTHS = int(os.getenv('LOG_RETENTION_MONTHS') or 0) or None
+BATTERY_RAW_RETENTION_MONTHS = int(os.getenv('BATTERY_RAW_RETENTION_MONTHS') or 3)
+LOG_ARCHIVE_DIR = os.getenv('LOG_ARCHIVE_DIR') or BASE_DIR / 'var' / 'archive'
+
+# Envoi groupé des mesures de batterie (locks.views.LockBatteryLogBatchView)
+BATTERY_BATCH_MAX_SIZE = int(os.getenv('BATTERY_BATCH_MAX_SIZE') or 5000)
+BATTERY_MAX_CLOCK_SKEW = int(os.getenv('BATTERY_MAX_CLOCK_SKEW') or 300) #secondes
+
+# Rétention des agrégats de batterie (commande prune_battery_history), en
+# jours ; None = conservé indéfiniment. Les mesures brutes suivent les
+# partitions (BATTERY_RAW_RETENTION_MONTHS).
+BATTERY_ROLLUP_RETENTION_DAYS = {
+    '1m': int(os.getenv('BATTERY_1M_RETENTION_DAYS') or 30),
+    '1h': int(os.getenv('BATTERY_1H_RETENTION_DAYS') or 730),
+    '1d': None,
+}
+BATTERY_HISTORY_MAX_POINTS = 1000
+
+# Prévision d'épuisement (locks.forecast) : tension considérée comme vide
+# (seuil de la dernière barre), fenêtre d'ajustement, remontée de tension
+# signalant un changement de batterie
+BATTERY_DEPLETION_VOLTAGE = float(os.getenv('BATTERY_DEPLETION_VOLTAGE') or 3.30)
+BATTERY_FORECAST_WINDOW_DAYS = int(os.getenv('BATTERY_FORECAST_WINDOW_DAYS') or 14)
+BATTERY_FORECAST_MIN_SPAN_DAYS = 1
+BATTERY_RECHARGE_JUMP = 0.2 #volts
+
+# Commandes à distance envoyées aux serrures (locks.dispatcher)
+REMOTE_COMMAND_EAGER = (os.getenv('REMOTE_COMMAND_EAGER') or 'False') == 'True'
+REMOTE_COMMAND_WORKERS = int(os.getenv('REMOTE_COMMAND_WORKERS') or 64)
+REMOTE_COMMAND_PER_HOST_LIMIT = int(os.getenv('REMOTE_COMMAND_PER_HOST_LIMIT') or 2)
+REMOTE_COMMAND_TIMEOUT = float(os.getenv('REMOTE_COMMAND_TIMEOUT') or 2.0) #secondes, par tentative
+REMOTE_COMMAND_MAX_ATTEMPTS = int(os.getenv('REMOTE_COMMAND_MAX_ATTEMPTS') or 3)
+REMOTE_COMMAND_BACKOFF = float(os.getenv('REMOTE_COMMAND_BACKOFF') or 0.5) #secondes
+# Attente max d'une commande de groupe avec ?wait : elle bloque un worker,
+# au-delà la vue répond 202 et le client suit le lot (status_url)
+REMOTE_COMMAND_WAIT_TIMEOUT = float(os.getenv('REMOTE_COMMAND_WAIT_TIMEOUT') or 5) #secondes
+# Au-delà, une commande encore en attente a été perdue (process arrêté) : échec
+REMOTE_COMMAND_STALE_AFTER = int(os.getenv('REMOTE_COMMAND_STALE_AFTER') or 300) #secondes
+
+# Heartbeats des serrures (locks.liveness) : écrits par lot toutes les
+# FLUSH_INTERVAL secondes ; une serrure muette depuis TIMEOUT secondes
+# passe en 'disconnected'
+LOCK_HEARTBEAT_ASYNC = (os.getenv('LOCK_HEARTBEAT_ASYNC') or 'True') == 'True'
+LOCK_HEARTBEAT_FLUSH_INTERVAL = float(os.getenv('LOCK_HEARTBEAT_FLUSH_INTERVAL') or 5.0)
+LOCK_HEARTBEAT_TIMEOUT = int(os.getenv('LOCK_HEARTBEAT_TIMEOUT') or 90)
+
+# Flux des événements des serrures (locks.events, /locks/stream/)
+LOCK_EVENT_QUEUE_SIZE = 1000 #événements en attente par client avant "resync"
+LOCK_EVENT_KEEPALIVE = 15 #secondes
+
+# Listes d'accès hors ligne des serrures (permissions.access_lists) :
+# compilées par la commande compile_access_lists (à lancer régulièrement) ;
+# l'historique des retraits est gardé HISTORY_DAYS jours (au-delà, liste
+# complète). Chaque serrure reçoit des clés dérivées pour elle seule des deux
+# clés maîtres ci-dessous ; sans elles, les listes sont désactivées (jamais de
+# repli sur SECRET_KEY).
+ACCESS_LIST_SIGNING_KEY = os.getenv('ACCESS_LIST_SIGNING_KEY')
+ACCESS_LIST_FINGERPRINT_KEY = os.getenv('ACCESS_LIST_FINGERPRINT_KEY')
+ACCESS_LIST_MAX_CLOCK_SKEW = int(os.getenv('ACCESS_LIST_MAX_CLOCK_SKEW') or 300) #secondes
+ACCESS_LIST_HISTORY_DAYS = int(os.getenv('ACCESS_LIST_HISTORY_DAYS') or 30)
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -153,6 +272,13 @@ CORS_ALLOWED_ORIGINS = [
     'http://localhost:3000',
 ]
 
+# En-têtes de pagination lisibles par le frontend (voir logs.views, users.views)
+CORS_EXPOSE_HEADERS = [
+    'Link',
+    'X-Next-Cursor',
+    'X-Total-Count-Estimate',
+]
+
 CSRF_TRUSTED_ORIGINS = [
     'http://localhost:3000',
 ]
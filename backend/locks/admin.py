@@ -1,6 +1,7 @@
 from django.contrib import admin
-from .models import Lock, Lock_Group, LockBatteryLog
+from .models import Lock, Lock_Group, LockBatteryLog, RemoteCommand
 
 admin.site.register(Lock)
 admin.site.register(Lock_Group)
 admin.site.register(LockBatteryLog)
+admin.site.register(RemoteCommand)
@@ -0,0 +1,240 @@
+"""
+Background dispatcher of RemoteCommand (HTTP calls to the ESP32 locks).
+
+Views only create the RemoteCommand row and hand its id to the dispatcher
+once the transaction commits; a thread pool then calls the lock, so a
+slow or offline lock never holds a request worker.
+
+- one requests.Session per lock address, keeping its connections alive
+- at most REMOTE_COMMAND_PER_HOST_LIMIT concurrent calls per lock, and
+  REMOTE_COMMAND_WORKERS in total
+- failed calls (network error or 5xx) are retried up to
+  REMOTE_COMMAND_MAX_ATTEMPTS times, waiting a random delay in
+  [0, REMOTE_COMMAND_BACKOFF * 2^attempt] ("full jitter") between tries
+
+Commands sent to a whole lock group share a batch_id; they are submitted
+together, so the group takes about one round trip as long as it has no
+more locks than workers.
+
+Queued commands only live in the process' thread pool: if the process
+dies (restart, crash) before running or finishing them, their rows stay
+pending or running. fail_stale_commands marks those failed once they are
+REMOTE_COMMAND_STALE_AFTER seconds old; it runs when a process starts its
+pool and periodically through the sweep_remote_commands command. They are
+not sent again: an "open" arriving minutes late is worse than none.
+
+With REMOTE_COMMAND_EAGER the command runs in the calling thread (tests).
+"""
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor, wait
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from .models import RemoteCommand
+
+logger = logging.getLogger(__name__)
+
+# Chemin appelé sur la serrure pour chaque commande (voir le code de l'ESP32)
+COMMAND_PATHS = {
+    'open': '/open',
+    'lockdown': '/lockdown',
+    'ping': '/ping',
+}
+
+
+class RemoteCommandDispatcher:
+    def __init__(self, max_workers, per_host_limit, timeout, max_attempts, backoff):
+        self.max_workers = max_workers
+        self.per_host_limit = per_host_limit
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+        self._sessions = {}
+        self._host_slots = {}
+
+    # --- API ---
+
+    def dispatch(self, command_id):
+        """Run the command in the background once the current transaction commits."""
+        transaction.on_commit(lambda: self.submit(command_id))
+
+    def dispatch_many(self, command_ids):
+        command_ids = list(command_ids)
+        transaction.on_commit(lambda: [self.submit(command_id) for command_id in command_ids])
+
+    def run_many(self, command_ids, timeout):
+        """
+        Submit the commands now and wait for them, at most `timeout`
+        seconds. Their rows must already be committed.
+        """
+        futures = [self.submit(command_id) for command_id in command_ids]
+        wait([future for future in futures if future is not None], timeout=timeout)
+
+    def submit(self, command_id):
+        if settings.REMOTE_COMMAND_EAGER:
+            self.run(command_id)
+            return None
+        return self._get_executor().submit(self._run_in_thread, command_id)
+
+    def run(self, command_id):
+        """Send the command to its lock, retrying, and record the outcome."""
+        command = RemoteCommand.objects.select_related('lock').get(pk=command_id)
+        host = command.lock.remote_address
+        url = f"http://{host}{COMMAND_PATHS[command.command]}"
+
+        command.status = 'running'
+        command.started_at = timezone.now()
+        command.save(update_fields=['status', 'started_at'])
+
+        for attempt in range(1, self.max_attempts + 1):
+            command.attempts = attempt
+            retry = False
+            try:
+                with self._host_slot(host):
+                    started = time.monotonic()
+                    try:
+                        response = self._session(host).get(url, timeout=self.timeout)
+                    finally:
+                        command.latency_ms = (time.monotonic() - started) * 1000
+                command.response_status = response.status_code
+                if response.status_code == 200:
+                    command.status, command.error = 'succeeded', ''
+                else:
+                    # Erreur côté serrure (5xx) : on réessaie ; refus (4xx) : définitif
+                    command.status, command.error = 'failed', "Lock refused connection"
+                    retry = response.status_code >= 500
+            except requests.exceptions.RequestException as e:
+                command.status, command.error = 'failed', f"Failed to reach lock: {e}"
+                retry = True
+
+            if not retry or attempt == self.max_attempts:
+                break
+            command.save(update_fields=['attempts', 'response_status', 'latency_ms', 'error'])
+            time.sleep(random.uniform(0, self.backoff * 2 ** attempt))
+
+        command.finished_at = timezone.now()
+        command.save(update_fields=[
+            'status', 'attempts', 'response_status', 'latency_ms', 'error', 'finished_at'])
+        return command
+
+    # --- Internals ---
+
+    def _run_in_thread(self, command_id):
+        try:
+            self.run(command_id)
+        except Exception:
+            logger.exception("Remote command %s crashed", command_id)
+            RemoteCommand.objects.filter(pk=command_id, finished_at__isnull=True).update(
+                status='failed', error="Dispatcher error", finished_at=timezone.now())
+        finally:
+            close_old_connections()
+
+    def _get_executor(self):
+        with self._lock:
+            # Un pool par process (les threads ne survivent pas à un fork)
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix='remote-command')
+                self._sessions, self._host_slots = {}, {}
+                # Commandes perdues par un process précédent (redémarrage, crash)
+                self._executor.submit(self._fail_stale_in_thread)
+            return self._executor
+
+    @staticmethod
+    def _fail_stale_in_thread():
+        try:
+            count = fail_stale_commands()
+            if count:
+                logger.warning("Marked %d lost remote command(s) as failed", count)
+        except Exception:
+            logger.exception("Could not sweep lost remote commands")
+        finally:
+            close_old_connections()
+
+    def _session(self, host):
+        with self._lock:
+            session = self._sessions.get(host)
+            if session is None:
+                session = requests.Session()
+                # Retries gérés ici, pas par urllib3
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.per_host_limit, max_retries=0)
+                session.mount('http://', adapter)
+                self._sessions[host] = session
+            return session
+
+    def _host_slot(self, host):
+        with self._lock:
+            slot = self._host_slots.get(host)
+            if slot is None:
+                slot = self._host_slots[host] = threading.BoundedSemaphore(self.per_host_limit)
+            return slot
+
+
+def fail_stale_commands(now=None):
+    """
+    Mark failed the commands still pending or running
+    REMOTE_COMMAND_STALE_AFTER seconds after their creation, i.e. lost by
+    a process that stopped. Returns the number of commands marked.
+    """
+    now = now or timezone.now()
+    cutoff = now - timedelta(seconds=settings.REMOTE_COMMAND_STALE_AFTER)
+    return RemoteCommand.objects.filter(
+        status__in=RemoteCommand.UNFINISHED_STATUSES, created_at__lt=cutoff,
+    ).update(status='failed', error="Lost by the dispatcher (process stopped)", finished_at=now)
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_remote_command_dispatcher():
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            _dispatcher = RemoteCommandDispatcher(
+                max_workers=settings.REMOTE_COMMAND_WORKERS,
+                per_host_limit=settings.REMOTE_COMMAND_PER_HOST_LIMIT,
+                timeout=settings.REMOTE_COMMAND_TIMEOUT,
+                max_attempts=settings.REMOTE_COMMAND_MAX_ATTEMPTS,
+                backoff=settings.REMOTE_COMMAND_BACKOFF,
+            )
+        return _dispatcher
+
+
+def send_remote_command(lock, command, user=None):
+    """Create a RemoteCommand for `lock` and dispatch it. Returns the command."""
+    remote_command = RemoteCommand.objects.create(
+        lock=lock,
+        command=command,
+        requested_by=user if user is not None and user.is_authenticated else None,
+    )
+    get_remote_command_dispatcher().dispatch(remote_command.pk)
+    return remote_command
+
+
+def send_remote_commands(locks, command, user=None):
+    """
+    Create one RemoteCommand per lock, sharing a new batch_id, with a
+    single INSERT. Returns (batch_id, commands); dispatching is up to the
+    caller (dispatch_many or run_many).
+    """
+    batch_id = uuid.uuid4()
+    requested_by = user if user is not None and user.is_authenticated else None
+    commands = RemoteCommand.objects.bulk_create([
+        RemoteCommand(lock=lock, command=command, requested_by=requested_by, batch_id=batch_id)
+        for lock in locks
+    ])
+    return batch_id, commands
@@ -0,0 +1,141 @@
+"""
+Lock events (status, battery, access) pushed to dashboards.
+
+Producers call publish_lock_events, which sends the events with
+PostgreSQL's NOTIFY on the `lock_events` channel: they are delivered when
+the surrounding transaction commits (never for a rolled back one), to
+every ASGI process, whichever process produced them.
+
+In each ASGI process, a LockEventBroker holds one extra connection that
+LISTENs on the channel, watched by the event loop (add_reader, no
+thread), and copies each event to the queue of every open stream
+(locks.views.lock_event_stream).
+"""
+import asyncio
+import json
+import logging
+import weakref
+import psycopg2
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "lock_events"
+# NOTIFY refuse les messages de plus de 8000 octets
+MAX_PAYLOAD_SIZE = 7500
+
+
+def publish_lock_events(events):
+    """
+    Publish `events` (dicts with at least "type" and "lock"), packed in as
+    few NOTIFY messages as the payload size limit allows.
+    """
+    if not events:
+        return
+
+    payloads, current, size = [], [], 2
+    for event in events:
+        encoded = json.dumps(event, cls=DjangoJSONEncoder)
+        if current and size + len(encoded) + 1 > MAX_PAYLOAD_SIZE:
+            payloads.append("[" + ",".join(current) + "]")
+            current, size = [], 2
+        current.append(encoded)
+        size += len(encoded) + 1
+    payloads.append("[" + ",".join(current) + "]")
+
+    with connection.cursor() as cursor:
+        for payload in payloads:
+            cursor.execute("SELECT pg_notify(%s, %s)", [CHANNEL, payload])
+
+
+def publish_lock_event(event_type, lock_id, **data):
+    publish_lock_events([{"type": event_type, "lock": lock_id, **data}])
+
+
+class LockEventBroker:
+    """Fans the events LISTENed on CHANNEL out to the subscribed queues."""
+
+    def __init__(self, loop, queue_size):
+        self.loop = loop
+        self.queue_size = queue_size
+        self._subscribers = set()
+        self._listener = None
+        self._starting = asyncio.Lock()
+
+    async def subscribe(self):
+        async with self._starting:
+            if self._listener is None:
+                self._listener = await self.loop.run_in_executor(None, self._connect)
+                self.loop.add_reader(self._listener.fileno(), self._on_notify)
+
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue):
+        self._subscribers.discard(queue)
+        if not self._subscribers:
+            self._close()
+
+    def _connect(self):
+        listener = psycopg2.connect(**connection.get_connection_params())
+        listener.set_session(autocommit=True)
+        with listener.cursor() as cursor:
+            cursor.execute(f"LISTEN {CHANNEL}")
+        return listener
+
+    def _close(self):
+        if self._listener is None:
+            return
+        self.loop.remove_reader(self._listener.fileno())
+        self._listener.close()
+        self._listener = None
+
+    def _on_notify(self):
+        try:
+            self._listener.poll()
+        except psycopg2.Error:
+            # Connexion perdue : on ferme les flux, les clients se reconnectent
+            logger.exception("Lock event listener lost its connection")
+            self._close()
+            for queue in list(self._subscribers):
+                self._push(queue, None)
+            self._subscribers.clear()
+            return
+
+        while self._listener.notifies:
+            notify = self._listener.notifies.pop(0)
+            try:
+                events = json.loads(notify.payload)
+            except ValueError:
+                logger.warning("Ignoring malformed lock event payload")
+                continue
+            for queue in self._subscribers:
+                for event in events:
+                    self._push(queue, event)
+
+    @staticmethod
+    def _push(queue, event):
+        try:
+            queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Client trop lent : il a raté des deltas, il doit tout recharger
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait({"type": "resync"})
+            if event is None:
+                queue.put_nowait(None)
+
+
+# Un broker par boucle d'événements (une seule en production)
+_brokers = weakref.WeakKeyDictionary()
+
+
+def get_lock_event_broker():
+    loop = asyncio.get_running_loop()
+    broker = _brokers.get(loop)
+    if broker is None:
+        broker = _brokers[loop] = LockEventBroker(loop, settings.LOCK_EVENT_QUEUE_SIZE)
+    return broker
@@ -0,0 +1,120 @@
+"""
+Battery depletion forecast.
+
+For every lock, a weighted least-squares line is fitted to its hourly mean
+voltage (LockBatteryRollup, resolution 1h) over the last
+BATTERY_FORECAST_WINDOW_DAYS, and extrapolated down to
+BATTERY_DEPLETION_VOLTAGE. All locks are fitted at once with NumPy: the
+per-lock sums are accumulated with np.bincount, so the cost is linear in
+the number of points whatever the number of locks.
+
+Only the points after the last battery change (voltage rising by more than
+BATTERY_RECHARGE_JUMP between two points) are used. Results are stored on
+LockState by compute_battery_forecasts, run by the
+forecast_battery_depletion command.
+"""
+from datetime import timedelta
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+from .models import LockState, LockBatteryRollup
+
+SECONDS_PER_DAY = 86400
+
+
+def fit_depletion(lock_index, days, voltages, weights, lock_count,
+                  threshold, recharge_jump, min_span_days):
+    """
+    Fit one discharge line per lock.
+
+    `lock_index` (ints in [0, lock_count)), `days` (time relative to now,
+    in days), `voltages` and `weights` are parallel arrays sorted by lock
+    then time. Returns two arrays of length `lock_count`: the discharge
+    rate in V/day (positive when discharging, NaN without enough data) and
+    the days left before reaching `threshold` (NaN when not discharging).
+    """
+    if len(lock_index) == 0:
+        return np.full(lock_count, np.nan), np.full(lock_count, np.nan)
+
+    # Début de segment : nouvelle serrure ou remontée de tension (batterie changée)
+    positions = np.arange(len(lock_index))
+    new_lock = np.r_[True, lock_index[1:] != lock_index[:-1]]
+    jump = np.r_[False, np.diff(voltages) > recharge_jump] & ~new_lock
+    segment_start = np.maximum.accumulate(np.where(new_lock | jump, positions, 0))
+
+    # On ne garde que le dernier segment de chaque serrure
+    last_start = np.zeros(lock_count, dtype=positions.dtype)
+    np.maximum.at(last_start, lock_index, segment_start)
+    keep = segment_start == last_start[lock_index]
+    index, x, y, w = lock_index[keep], days[keep], voltages[keep], weights[keep]
+
+    def total(values):
+        return np.bincount(index, weights=values, minlength=lock_count)
+
+    sw, sx, sy = total(w), total(w * x), total(w * y)
+    sxx, sxy = total(w * x * x), total(w * x * y)
+
+    span = np.zeros(lock_count)
+    np.maximum.at(span, index, x)
+    first = np.full(lock_count, np.inf)
+    np.minimum.at(first, index, x)
+    span = span - first
+
+    denominator = sw * sxx - sx * sx
+    fitted = (sw > 0) & (span >= min_span_days) & (denominator > 0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        slope = np.where(fitted, (sw * sxy - sx * sy) / denominator, np.nan)
+        current = np.where(fitted, (sy - slope * sx) / sw, np.nan)  # tension ajustée à x = 0 (maintenant)
+
+        discharging = fitted & (slope < 0)
+        remaining = np.where(
+            discharging, np.maximum(current - threshold, 0) / -slope, np.nan)
+
+    return -slope, remaining
+
+
+def compute_battery_forecasts(now=None):
+    """
+    Fit every lock and store the result on its LockState. Returns the
+    number of locks with a predicted depletion date.
+    """
+    now = now or timezone.now()
+    since = now - timedelta(days=settings.BATTERY_FORECAST_WINDOW_DAYS)
+
+    rows = list(
+        LockBatteryRollup.objects.filter(resolution='1h', bucket__gte=since)
+        .order_by('lock_id', 'bucket')
+        .values_list('lock_id', 'bucket', 'voltage_sum', 'count')
+    )
+    states = list(LockState.objects.all())
+    positions = {state.lock_id: position for position, state in enumerate(states)}
+    rows = [row for row in rows if row[0] in positions]
+
+    lock_index = np.fromiter((positions[row[0]] for row in rows), dtype=np.int64, count=len(rows))
+    days = np.fromiter(
+        ((row[1] - now).total_seconds() / SECONDS_PER_DAY for row in rows), dtype=float, count=len(rows))
+    counts = np.fromiter((row[3] for row in rows), dtype=float, count=len(rows))
+    voltages = np.fromiter((row[2] for row in rows), dtype=float, count=len(rows)) / np.maximum(counts, 1)
+
+    rates, remaining = fit_depletion(
+        lock_index, days, voltages, counts, len(states),
+        threshold=settings.BATTERY_DEPLETION_VOLTAGE,
+        recharge_jump=settings.BATTERY_RECHARGE_JUMP,
+        min_span_days=settings.BATTERY_FORECAST_MIN_SPAN_DAYS,
+    )
+
+    forecasts = 0
+    for state, rate, days_left in zip(states, rates, remaining):
+        state.battery_discharge_rate = None if np.isnan(rate) else float(rate)
+        state.battery_depletion_at = None
+        if not np.isnan(days_left):
+            state.battery_depletion_at = now + timedelta(days=float(days_left))
+            forecasts += 1
+        state.battery_forecast_at = now
+
+    LockState.objects.bulk_update(
+        states,
+        ['battery_discharge_rate', 'battery_depletion_at', 'battery_forecast_at'],
+        batch_size=1000,
+    )
+    return forecasts
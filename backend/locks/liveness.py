@@ -0,0 +1,181 @@
+"""
+Lock liveness: Lock.status / Lock.last_connexion maintained from heartbeats.
+
+Heartbeats only update an in-memory map (lock id -> last seen) in the
+receiving process. A background thread writes that map every
+LOCK_HEARTBEAT_FLUSH_INTERVAL seconds with a single UPDATE, however many
+heartbeats arrived, and marks disconnected the locks silent for more than
+LOCK_HEARTBEAT_TIMEOUT seconds (also available as the sweep_lock_liveness
+command, for cron).
+"""
+import atexit
+import logging
+import os
+import threading
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.db import connection, close_old_connections
+from django.utils import timezone
+from .models import Lock
+from .events import publish_lock_events
+
+logger = logging.getLogger(__name__)
+
+
+class HeartbeatTracker:
+    def __init__(self, flush_interval, timeout, background=True):
+        self.flush_interval = flush_interval
+        self.timeout = timeout
+        # Sans thread, c'est à l'appelant d'appeler flush() / sweep()
+        self.background = background
+
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._seen = {}
+        self._thread = None
+        self._pid = None
+
+    # --- API ---
+
+    def beat(self, lock_id, at=None):
+        at = at or timezone.now()
+        with self._lock:
+            self._ensure_started()
+            previous = self._seen.get(lock_id)
+            if previous is None or at > previous:
+                self._seen[lock_id] = at
+
+    def flush(self):
+        """Write the buffered heartbeats. Returns the number of locks updated."""
+        with self._flush_lock:
+            with self._lock:
+                seen, self._seen = self._seen, {}
+
+            if not seen:
+                return 0
+
+            try:
+                return write_heartbeats(seen)
+            except Exception:
+                logger.exception("Heartbeat flush failed, %d locks kept", len(seen))
+                with self._lock:
+                    for lock_id, at in seen.items():
+                        if lock_id not in self._seen or at > self._seen[lock_id]:
+                            self._seen[lock_id] = at
+                return 0
+
+    def sweep(self, now=None):
+        return mark_silent_locks_disconnected(self.timeout, now)
+
+    # --- Internals ---
+
+    def _ensure_started(self):
+        # Appelé sous self._lock. Relancé après un fork (pid différent).
+        if self._pid == os.getpid():
+            return
+
+        self._pid = os.getpid()
+        self._seen = {}
+        if self.background:
+            self._thread = threading.Thread(
+                target=self._run, name="heartbeat-flusher", daemon=True)
+            self._thread.start()
+            atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+                self.sweep()
+            except Exception:
+                logger.exception("Lock liveness sweep failed")
+            finally:
+                close_old_connections()
+
+
+def write_heartbeats(seen):
+    """
+    Mark the locks of `seen` ({lock id: last heartbeat}) connected, in one
+    UPDATE. last_connexion never goes back in time (several processes may
+    flush the same lock). Publishes a "status" event for the locks that
+    were not connected.
+    """
+    table = Lock._meta.db_table
+    placeholders = ", ".join(["(%s, %s::timestamptz)"] * len(seen))
+    params = [value for item in seen.items() for value in item]
+
+    with connection.cursor() as cursor:
+        # `previous` est lu avant la mise à jour : ancien statut
+        cursor.execute(
+            f"""
+            UPDATE {table} AS target
+            SET last_connexion = GREATEST(target.last_connexion, seen.at),
+                status = 'connected'
+            FROM (VALUES {placeholders}) AS seen (id, at), {table} AS previous
+            WHERE target.id_lock = seen.id AND previous.id_lock = target.id_lock
+              AND (target.status <> 'connected' OR target.last_connexion IS NULL
+                   OR target.last_connexion < seen.at)
+            RETURNING target.id_lock, previous.status, target.last_connexion
+            """,
+            params,
+        )
+        updated = cursor.fetchall()
+
+    publish_lock_events([
+        {"type": "status", "lock": lock_id, "status": "connected", "last_connexion": last_connexion}
+        for lock_id, previous_status, last_connexion in updated
+        if previous_status != 'connected'
+    ])
+    return len(updated)
+
+
+def mark_silent_locks_disconnected(timeout, now=None):
+    """Locks without heartbeat for `timeout` seconds become disconnected."""
+    cutoff = (now or timezone.now()) - timedelta(seconds=timeout)
+    table = Lock._meta.db_table
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            UPDATE {table}
+            SET status = 'disconnected'
+            WHERE status = 'connected' AND (last_connexion < %s OR last_connexion IS NULL)
+            RETURNING id_lock, last_connexion
+            """,
+            [cutoff],
+        )
+        disconnected = cursor.fetchall()
+
+    publish_lock_events([
+        {"type": "status", "lock": lock_id, "status": "disconnected", "last_connexion": last_connexion}
+        for lock_id, last_connexion in disconnected
+    ])
+    return len(disconnected)
+
+
+_tracker = None
+_tracker_lock = threading.Lock()
+
+
+def get_heartbeat_tracker():
+    global _tracker
+    with _tracker_lock:
+        if _tracker is None:
+            _tracker = HeartbeatTracker(
+                flush_interval=settings.LOCK_HEARTBEAT_FLUSH_INTERVAL,
+                timeout=settings.LOCK_HEARTBEAT_TIMEOUT,
+            )
+        return _tracker
+
+
+def record_heartbeat(lock_id, at=None):
+    """
+    Note that `lock_id` is alive. Buffered with LOCK_HEARTBEAT_ASYNC,
+    written right away otherwise or inside a transaction.
+    """
+    if settings.LOCK_HEARTBEAT_ASYNC and not connection.in_atomic_block:
+        get_heartbeat_tracker().beat(lock_id, at)
+    else:
+        write_heartbeats({lock_id: at or timezone.now()})
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from locks.forecast import compute_battery_forecasts
+
+
+class Command(BaseCommand):
+    help = 'Recalcule la prévision d\'épuisement de la batterie de toutes les serrures'
+
+    def handle(self, *args, **options):
+        count = compute_battery_forecasts()
+        self.stdout.write(self.style.SUCCESS(f'{count} serrure(s) avec une date d\'épuisement prévue'))
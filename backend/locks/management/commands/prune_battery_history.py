@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from locks.utils import prune_battery_history
+
+
+class Command(BaseCommand):
+    help = (
+        'Supprime les agrégats de batterie plus anciens que leur durée de '
+        'rétention (BATTERY_ROLLUP_RETENTION_DAYS) ; les mesures brutes sont '
+        'archivées par manage_log_partitions'
+    )
+
+    def handle(self, *args, **options):
+        deleted = prune_battery_history()
+
+        for name, count in deleted.items():
+            self.stdout.write(self.style.SUCCESS(f'{name} : {count} ligne(s) supprimée(s)'))
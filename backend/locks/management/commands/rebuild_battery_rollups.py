@@ -0,0 +1,31 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from locks.utils import oldest_battery_reading, rebuild_battery_rollups
+
+
+class Command(BaseCommand):
+    help = 'Recalcule les agrégats de batterie (1m, 1h, 1d) depuis les mesures brutes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            help='Ne recalculer que les N derniers jours (par défaut, tout ce '
+                 'qui reste dans les mesures brutes)'
+        )
+
+    def handle(self, *args, **options):
+        since = None
+        if options['days']:
+            since = timezone.now() - timedelta(days=options['days'])
+
+        oldest = oldest_battery_reading()
+        if since is not None and oldest is not None and since < oldest:
+            # Mesures archivées : leurs agrégats sont conservés tels quels
+            self.stdout.write(self.style.WARNING(
+                f'Plus de mesures brutes avant {oldest:%Y-%m-%d %H:%M} : '
+                f'les agrégats antérieurs ne sont pas recalculés'))
+
+        count = rebuild_battery_rollups(since)
+        self.stdout.write(self.style.SUCCESS(f'{count} agrégats de batterie recalculés'))
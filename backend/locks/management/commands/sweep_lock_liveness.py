@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from locks.liveness import mark_silent_locks_disconnected
+
+
+class Command(BaseCommand):
+    help = 'Passe en "disconnected" les serrures sans heartbeat depuis LOCK_HEARTBEAT_TIMEOUT secondes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--timeout',
+            type=int,
+            default=settings.LOCK_HEARTBEAT_TIMEOUT,
+            help='Délai sans heartbeat, en secondes'
+        )
+
+    def handle(self, *args, **options):
+        count = mark_silent_locks_disconnected(options['timeout'])
+        self.stdout.write(self.style.SUCCESS(f'{count} serrure(s) marquée(s) déconnectée(s)'))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from locks.dispatcher import fail_stale_commands
+
+
+class Command(BaseCommand):
+    help = (
+        'Passe en "failed" les commandes à distance encore en attente '
+        'REMOTE_COMMAND_STALE_AFTER secondes après leur création (process arrêté)'
+    )
+
+    def handle(self, *args, **options):
+        count = fail_stale_commands()
+        self.stdout.write(self.style.SUCCESS(f'{count} commande(s) perdue(s) marquée(s) en échec'))
@@ -0,0 +1,14 @@
+from django.db import migrations
+from logs.partitioning import partition_by_month
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('locks', '0004_lock_remote_address'),
+    ]
+
+    operations = [
+        # Pas de retour arrière : les partitions archivées ne reviendraient pas
+        migrations.RunSQL(partition_by_month('locks_lockbatterylog', 'timestamp')),
+    ]
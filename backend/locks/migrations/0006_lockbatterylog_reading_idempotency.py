@@ -0,0 +1,32 @@
+# Generated by Django 6.0 on 2026-10-17 18:55
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('locks', '0005_partition_lockbatterylog'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='lockbatterylog',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        # Doublons éventuels (même serrure, même instant) : on garde le premier
+        migrations.RunSQL(
+            """
+            DELETE FROM locks_lockbatterylog a
+            USING locks_lockbatterylog b
+            WHERE a.lock_id = b.lock_id AND a.timestamp = b.timestamp AND a.id > b.id
+            """,
+            migrations.RunSQL.noop,
+        ),
+        migrations.AddConstraint(
+            model_name='lockbatterylog',
+            constraint=models.UniqueConstraint(fields=('lock', 'timestamp'), name='unique_lock_battery_reading'),
+        ),
+    ]
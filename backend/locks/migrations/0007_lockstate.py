@@ -0,0 +1,39 @@
+# Generated by Django 6.0 on 2026-10-17 18:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# Même barème que locks.utils.battery_bars
+POPULATE_SQL = """
+    INSERT INTO locks_lockstate (lock_id, battery_voltage, battery_current, battery_timestamp, battery_bars)
+    SELECT DISTINCT ON (lock_id) lock_id, voltage, current, timestamp,
+        CASE WHEN voltage >= 4.00 THEN 4
+             WHEN voltage >= 3.75 THEN 3
+             WHEN voltage >= 3.55 THEN 2
+             WHEN voltage >= 3.30 THEN 1
+             ELSE 0 END
+    FROM locks_lockbatterylog
+    ORDER BY lock_id, timestamp DESC, id DESC
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('locks', '0006_lockbatterylog_reading_idempotency'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LockState',
+            fields=[
+                ('lock', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='state', serialize=False, to='locks.lock')),
+                ('battery_voltage', models.FloatField(blank=True, null=True)),
+                ('battery_current', models.FloatField(blank=True, null=True)),
+                ('battery_timestamp', models.DateTimeField(blank=True, null=True)),
+                ('battery_bars', models.PositiveSmallIntegerField(blank=True, null=True)),
+            ],
+        ),
+        migrations.RunSQL(POPULATE_SQL, migrations.RunSQL.noop),
+    ]
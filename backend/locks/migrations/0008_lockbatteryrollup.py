@@ -0,0 +1,49 @@
+# Generated by Django 6.0 on 2026-10-17 19:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+POPULATE_SQL = """
+    INSERT INTO locks_lockbatteryrollup
+        (lock_id, resolution, bucket, count, voltage_min, voltage_max, voltage_sum,
+         current_min, current_max, current_sum)
+    SELECT lock_id, resolution.name,
+           to_timestamp(floor(extract(epoch FROM timestamp) / resolution.seconds) * resolution.seconds),
+           count(*), min(voltage), max(voltage), sum(voltage),
+           min(current), max(current), sum(current)
+    FROM locks_lockbatterylog
+    CROSS JOIN (VALUES ('1m', 60), ('1h', 3600), ('1d', 86400)) AS resolution (name, seconds)
+    GROUP BY 1, 2, 3
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('locks', '0007_lockstate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LockBatteryRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resolution', models.CharField(choices=[('1m', '1 minute'), ('1h', '1 hour'), ('1d', '1 day')], max_length=2)),
+                ('bucket', models.DateTimeField()),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('voltage_min', models.FloatField()),
+                ('voltage_max', models.FloatField()),
+                ('voltage_sum', models.FloatField()),
+                ('current_min', models.FloatField()),
+                ('current_max', models.FloatField()),
+                ('current_sum', models.FloatField()),
+                ('lock', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='locks.lock')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['resolution', 'bucket'], name='locks_lockb_resolut_1ca367_idx')],
+                'constraints': [models.UniqueConstraint(fields=('lock', 'resolution', 'bucket'), name='unique_lock_battery_rollup')],
+            },
+        ),
+        migrations.RunSQL(POPULATE_SQL, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 6.0 on 2026-10-17 19:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('locks', '0008_lockbatteryrollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lockstate',
+            name='battery_depletion_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='lockstate',
+            name='battery_discharge_rate',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='lockstate',
+            name='battery_forecast_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 6.0 on 2026-10-17 19:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('locks', '0010_remotecommand'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='remotecommand',
+            name='batch_id',
+            field=models.UUIDField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='remotecommand',
+            name='latency_ms',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='remotecommand',
+            name='command',
+            field=models.CharField(choices=[('open', 'Open'), ('lockdown', 'Lockdown'), ('ping', 'Ping')], max_length=20),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 6.0 on 2026-10-17 20:12
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('locks', '0011_remotecommand_batch'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='remotecommand',
+            index=models.Index(condition=models.Q(('status__in', ['pending', 'running'])), fields=['created_at'], name='remotecommand_unfinished_idx'),
+        ),
+    ]
@@ -1,4 +1,7 @@
+import uuid
+from django.conf import settings
 from django.db import models
+from django.utils import timezone
 from django.contrib.postgres.fields import ArrayField
 
 
@@ -37,6 +40,28 @@ class Lock(models.Model):
         return self.name
 
 
+class LockState(models.Model):
+    """
+    Dernier état connu d'une serrure, dénormalisé pour que les listes de
+    serrures n'aillent pas lire LockBatteryLog. Tenu à jour à l'ingestion,
+    voir locks.utils.update_battery_states.
+    """
+    lock = models.OneToOneField(Lock, on_delete=models.CASCADE, primary_key=True, related_name='state')
+    battery_voltage = models.FloatField(null=True, blank=True)
+    battery_current = models.FloatField(null=True, blank=True)
+    battery_timestamp = models.DateTimeField(null=True, blank=True) #heure de la dernière mesure
+    battery_bars = models.PositiveSmallIntegerField(null=True, blank=True) #0 à 4, voir locks.utils.battery_bars
+
+    # Prévision d'épuisement de la batterie, calculée par lot (commande
+    # forecast_battery_depletion, voir locks.forecast)
+    battery_discharge_rate = models.FloatField(null=True, blank=True) #V par jour, positif quand la batterie se vide
+    battery_depletion_at = models.DateTimeField(null=True, blank=True, db_index=True) #None si pas de décharge mesurable
+    battery_forecast_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.lock} : {self.battery_voltage} V ({self.battery_timestamp})"
+
+
 class Lock_Group(models.Model):
     id_group = models.AutoField(primary_key=True)
     name = models.CharField(max_length=100)
@@ -47,10 +72,104 @@ class Lock_Group(models.Model):
 
 
 class LockBatteryLog(models.Model):
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Table partitionnée par mois sur timestamp (migration 0005, voir
+    # logs.partitioning) : clé primaire (id, timestamp).
+    timestamp = models.DateTimeField(default=timezone.now) #heure de la mesure côté serrure si fournie
     lock = models.ForeignKey(Lock, on_delete=models.CASCADE)
     voltage = models.FloatField()
     current = models.FloatField()
 
+    class Meta:
+        # Clé d'idempotence de l'ingestion : un renvoi de la même mesure
+        # (même serrure, même heure) est ignoré, voir locks.utils
+        constraints = [
+            models.UniqueConstraint(fields=['lock', 'timestamp'], name='unique_lock_battery_reading')
+        ]
+
     def __str__(self):
         return f"{self.timestamp} - {self.lock} : {self.voltage} V, {self.current} A"
+
+
+class LockBatteryRollup(models.Model):
+    """
+    Mesures de batterie agrégées par serrure et par tranche de temps
+    (1 minute, 1 heure, 1 jour), tenues à jour à l'ingestion : l'historique
+    se lit ici plutôt que dans LockBatteryLog. Voir locks.utils.
+    """
+    RESOLUTION_CHOICES = [
+        ('1m', '1 minute'),
+        ('1h', '1 hour'),
+        ('1d', '1 day'),
+    ]
+
+    lock = models.ForeignKey(Lock, on_delete=models.CASCADE)
+    resolution = models.CharField(max_length=2, choices=RESOLUTION_CHOICES)
+    bucket = models.DateTimeField() #début de la tranche (UTC)
+    count = models.PositiveIntegerField(default=0)
+    voltage_min = models.FloatField()
+    voltage_max = models.FloatField()
+    voltage_sum = models.FloatField() #moyenne = somme / count
+    current_min = models.FloatField()
+    current_max = models.FloatField()
+    current_sum = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['lock', 'resolution', 'bucket'],
+                name='unique_lock_battery_rollup'
+            )
+        ]
+        indexes = [
+            models.Index(fields=['resolution', 'bucket']),
+        ]
+
+    def __str__(self):
+        return f"{self.lock} {self.resolution} {self.bucket} : {self.voltage_min}-{self.voltage_max} V"
+
+
+class RemoteCommand(models.Model):
+    """
+    Commande envoyée à une serrure par le réseau (ex : ouverture à
+    distance). La requête HTTP est faite en arrière-plan par
+    locks.dispatcher ; l'API renvoie l'id pour suivre le statut.
+    """
+    COMMAND_CHOICES = [
+        ('open', 'Open'),
+        ('lockdown', 'Lockdown'),
+        ('ping', 'Ping'),
+    ]
+
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed'),
+    ]
+    UNFINISHED_STATUSES = ['pending', 'running']
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    lock = models.ForeignKey(Lock, on_delete=models.CASCADE, related_name='commands')
+    command = models.CharField(max_length=20, choices=COMMAND_CHOICES)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    response_status = models.PositiveSmallIntegerField(null=True, blank=True) #code HTTP de la serrure
+    latency_ms = models.FloatField(null=True, blank=True) #durée de la dernière tentative
+    batch_id = models.UUIDField(null=True, blank=True, db_index=True) #commande envoyée à tout un groupe
+    error = models.TextField(blank=True)
+    requested_by = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['lock', '-created_at']),
+            # Commandes non terminées, pour locks.dispatcher.fail_stale_commands
+            models.Index(
+                fields=['created_at'], name='remotecommand_unfinished_idx',
+                condition=models.Q(status__in=['pending', 'running'])),
+        ]
+
+    def __str__(self):
+        return f"{self.command} {self.lock} ({self.status})"
@@ -20,37 +20,17 @@ class LockSerializer(serializers.ModelSerializer):
         return list(set(value))
 
     def get_battery_level(self, obj):
-        # On récupère le dernier log
-        if hasattr(obj, 'latest_log') and obj.latest_log:
-            log = obj.latest_log[0]
-        else:
-            log = obj.lockbatterylog_set.order_by('-id').first()
-
-        if log:
-            # --- LOGIQUE DE CALCUL (Voltage Mapping) ---
-            # Basé sur une cellule Li-Ion (Max 4.2V, Nominale 3.7V, Min 3.0V)
-            
-            voltage = log.voltage
-            bars = 0
-            
-            # Seuils ajustés pour la "courbe plate"
-            if voltage >= 4.00:      # 100% - 85% (Chargée à bloc)
-                bars = 4
-            elif voltage >= 3.75:    # 85% - 50% (Début du plateau)
-                bars = 3
-            elif voltage >= 3.55:    # 50% - 20% (Fin du plateau)
-                bars = 2
-            elif voltage >= 3.30:    # 20% - 5% (Chute finale)
-                bars = 1
-            else:                    # < 5% (Danger)
-                bars = 0
+        # Dernière mesure, dénormalisée dans LockState : les vues chargent
+        # l'état avec select_related('state') pour éviter une requête par serrure
+        state = getattr(obj, 'state', None)
 
+        if state and state.battery_timestamp:
             return {
-                "voltage": voltage,
-                "current": log.current,
-                "timestamp": log.timestamp,
-                "bars": bars,
-                "percent_approx": int((bars / 4) * 100)
+                "voltage": state.battery_voltage,
+                "current": state.battery_current,
+                "timestamp": state.battery_timestamp,
+                "bars": state.battery_bars,
+                "percent_approx": int((state.battery_bars / 4) * 100)
             }
         return None
 
@@ -74,3 +54,18 @@ class LockBatteryLogSerializer(serializers.ModelSerializer):
     class Meta:
         model = LockBatteryLog
         fields = ['lock', 'voltage', 'current', 'timestamp']
+        # Horodaté à la réception ; les mesures horodatées par la serrure
+        # passent par l'envoi par lot (battery/batch/)
+        read_only_fields = ['timestamp']
+        validators = []
+
+
+class BatteryReadingSerializer(serializers.Serializer):
+    """
+    Une mesure d'un lot (LockBatteryLogBatchView). La serrure est validée
+    en une requête pour tout le lot, pas ici.
+    """
+    lock = serializers.IntegerField()
+    voltage = serializers.FloatField()
+    current = serializers.FloatField()
+    timestamp = serializers.DateTimeField()
@@ -1,8 +1,27 @@
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase
 from rest_framework.test import APITestCase
 from rest_framework import status
 from django.contrib.auth import get_user_model
-from .models import Lock, Lock_Group
+from django.utils import timezone
+from datetime import timedelta
+import json
+from datetime import datetime, timezone as dt_timezone
+from django.conf import settings
+from django.test import override_settings
+from .models import Lock, Lock_Group, LockBatteryLog, LockState, LockBatteryRollup, RemoteCommand
+from .events import publish_lock_event
+from .liveness import HeartbeatTracker, mark_silent_locks_disconnected
+from .dispatcher import RemoteCommandDispatcher, fail_stale_commands, send_remote_commands
+import asyncio
+import numpy as np
+from asgiref.sync import sync_to_async
+import requests
+import threading
+from unittest import mock
+from .forecast import fit_depletion, compute_battery_forecasts
+from .utils import (
+    battery_bars, rebuild_battery_rollups, prune_battery_history, pick_battery_resolution,
+    update_battery_states)
 
 User = get_user_model()
 
@@ -125,6 +144,26 @@ class LockGroupAPITestCase(APITestCase): #Test sur les groupes de serrures
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(response.data['lock_groups']), 2)
 
+    def test_list_lock_groups_constant_queries(self):
+        self.client.force_authenticate(user=self.staff_user)
+        for i in range(5):
+            group = Lock_Group.objects.create(name=f'Extra {i}')
+            locks = [Lock.objects.create(name=f'Extra lock {i}-{j}') for j in range(3)]
+            group.locks.add(*locks)
+            update_battery_states([(locks[0].id_lock, timezone.now(), 4.1, 0.2)])
+
+        # groupes + serrures (avec leur état)
+        with self.assertNumQueries(2):
+            response = self.client.get(self.groups_url)
+        self.assertEqual(len(response.data['lock_groups']), 7)
+        self.assertEqual(len(response.data['lock_groups'][2]['locks']), 3)
+        self.assertEqual(response.data['lock_groups'][2]['locks'][0]['battery_level']['bars'], 4)
+
+        with self.assertNumQueries(2):
+            response = self.client.get(self.groups_url, {'locks': 'ids'})
+        self.assertEqual(response.data['lock_groups'][0], {
+            'id_group': self.group1.id_group, 'name': 'Group Alpha', 'lock_ids': [self.lock1.id_lock]})
+
     def test_create_lock_group_by_superuser(self):
         self.client.force_authenticate(user=self.superuser)
         data = {'name': 'New Group Gamma'}
@@ -155,6 +194,24 @@ class LockGroupAPITestCase(APITestCase): #Test sur les groupes de serrures
         self.assertEqual(self.group1.locks.count(), 0)
         self.assertNotIn(self.lock1, self.group1.locks.all())
 
+    def test_add_and_remove_locks_report_skipped_and_missing(self):
+        self.client.force_authenticate(user=self.superuser)
+        locks = Lock.objects.bulk_create([Lock(name=f'Bulk {i}') for i in range(50)])
+        lock_ids = [lock.id_lock for lock in locks] + [self.lock1.id_lock, 999999]
+
+        response = self.client.post(self.add_url, {'lock_ids': lock_ids}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['locks_added']), 50)
+        self.assertEqual(response.data['locks_skipped'], ['Lock A'])
+        self.assertEqual(response.data['missing_ids'], [999999])
+        self.assertEqual(self.group1.locks.count(), 51)
+
+        response = self.client.delete(
+            self.remove_url, {'lock_ids': [self.lock1.id_lock, self.lock2.id_lock]}, format='json')
+        self.assertEqual(response.data['locks_removed'], ['Lock A'])
+        self.assertEqual(response.data['locks_skipped'], ['Lock B'])
+        self.assertEqual(self.group1.locks.count(), 50)
+
     def test_delete_lock_group_by_superuser(self):
         self.client.force_authenticate(user=self.superuser)
         response = self.client.delete(self.delete_url)
@@ -176,4 +233,501 @@ class LockGroupAPITestCase(APITestCase): #Test sur les groupes de serrures
         self.assertEqual(remove_response.status_code, status.HTTP_403_FORBIDDEN)
 
         delete_response = self.client.delete(self.delete_url)
-        self.assertEqual(delete_response.status_code, status.HTTP_403_FORBIDDEN)
\ No newline at end of file
+        self.assertEqual(delete_response.status_code, status.HTTP_403_FORBIDDEN)
+
+class LockBatteryBatchTestCase(APITestCase): #Test envoi groupé des mesures de batterie
+    def setUp(self):
+        self.lock = Lock.objects.create(name='Lock 1', description='Porte entrée')
+        self.url = '/locks/battery/batch/'
+        base = timezone.now() - timedelta(minutes=10)
+        self.readings = [
+            {'lock': self.lock.id_lock, 'voltage': 3.9 - i * 0.01, 'current': 0.1,
+             'timestamp': (base + timedelta(seconds=10 * i)).isoformat()}
+            for i in range(5)
+        ]
+
+    def test_batch_is_idempotent(self):
+        response = self.client.post(self.url, self.readings, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['accepted'], 5)
+
+        # Renvoi après une réponse perdue, avec une nouvelle mesure
+        extra = {**self.readings[-1], 'timestamp': timezone.now().isoformat()}
+        response = self.client.post(self.url, self.readings + [extra], format='json')
+        self.assertEqual(response.data['accepted'], 1)
+        self.assertEqual(response.data['duplicates'], 5)
+        self.assertEqual(LockBatteryLog.objects.filter(lock=self.lock).count(), 6)
+
+    def test_ndjson(self):
+        body = "\n".join(json.dumps(reading) for reading in self.readings[:3])
+        response = self.client.post(self.url, body, content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['accepted'], 3)
+
+    def test_invalid_readings_are_rejected_individually(self):
+        future = (timezone.now() + timedelta(days=1)).isoformat()
+        batch = [
+            self.readings[0],
+            {**self.readings[1], 'lock': 999999},
+            {**self.readings[2], 'voltage': 'high'},
+            {**self.readings[3], 'timestamp': future},
+        ]
+        response = self.client.post(self.url, batch, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['accepted'], 1)
+        self.assertEqual([reject['index'] for reject in response.data['rejected']], [1, 2, 3])
+
+        response = self.client.post(self.url, batch[1:], format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            self.client.post(self.url, {'lock': 1}, format='json').status_code,
+            status.HTTP_400_BAD_REQUEST)
+
+    def test_single_reading_endpoint(self):
+        response = self.client.post('/locks/battery/', {
+            'lock': self.lock.id_lock, 'voltage': 3.7, 'current': 0.2}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertIsNotNone(response.data['timestamp'])
+
+
+class LockStateTestCase(APITestCase): #Test état dénormalisé des serrures
+    def setUp(self):
+        self.staff_user = User.objects.create_user(
+            username='staff', email='staff@test.com', password='password', is_staff=True)
+        self.locks = [Lock.objects.create(name=f'Lock {i}') for i in range(3)]
+        self.now = timezone.now()
+
+    def _send(self, lock, voltage, age):
+        return self.client.post('/locks/battery/batch/', [{
+            'lock': lock.id_lock, 'voltage': voltage, 'current': 0.1,
+            'timestamp': (self.now - timedelta(seconds=age)).isoformat(),
+        }], format='json')
+
+    def test_battery_bars(self):
+        self.assertEqual(
+            [battery_bars(v) for v in (4.1, 4.0, 3.8, 3.6, 3.4, 3.1)], [4, 4, 3, 2, 1, 0])
+
+    def test_ingest_keeps_latest_reading(self):
+        self._send(self.locks[0], 3.8, age=60)
+        self._send(self.locks[0], 3.6, age=120)  # arrivée en retard, plus ancienne
+
+        state = LockState.objects.get(lock=self.locks[0])
+        self.assertEqual(state.battery_voltage, 3.8)
+        self.assertEqual(state.battery_bars, 3)
+
+        self.client.post('/locks/battery/', {
+            'lock': self.locks[0].id_lock, 'voltage': 3.4, 'current': 0.2}, format='json')
+        state.refresh_from_db()
+        self.assertEqual(state.battery_voltage, 3.4)
+
+    def test_list_reads_state_without_extra_queries(self):
+        for lock in self.locks[:2]:
+            self._send(lock, 4.1, age=10)
+        self.client.force_authenticate(user=self.staff_user)
+
+        with self.assertNumQueries(1):
+            response = self.client.get('/locks/')
+        levels = {lock['id_lock']: lock['battery_level'] for lock in response.data['locks']}
+        self.assertEqual(levels[self.locks[0].id_lock]['percent_approx'], 100)
+        self.assertIsNone(levels[self.locks[2].id_lock])
+
+
+class LockBatteryHistoryTestCase(APITestCase): #Test agrégats et historique batterie
+    def setUp(self):
+        self.staff_user = User.objects.create_user(
+            username='staff', email='staff@test.com', password='password', is_staff=True)
+        self.lock = Lock.objects.create(name='Lock 1')
+        self.now = timezone.now().replace(minute=0, second=0, microsecond=0) - timedelta(minutes=30)
+        self.url = f'/locks/{self.lock.id_lock}/battery/history/'
+
+    def _send(self, readings):
+        response = self.client.post('/locks/battery/batch/', [
+            {'lock': self.lock.id_lock, 'voltage': voltage, 'current': 0.1,
+             'timestamp': (self.now - age).isoformat()}
+            for voltage, age in readings
+        ], format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def _rollups(self):
+        return set(LockBatteryRollup.objects.values_list(
+            'resolution', 'bucket', 'count', 'voltage_min', 'voltage_max'))
+
+    def test_ingest_updates_rollups(self):
+        self._send([(3.9, timedelta(seconds=5)), (3.7, timedelta(seconds=10))])
+        self._send([(3.8, timedelta(seconds=15)), (4.0, timedelta(hours=2))])
+
+        hour = LockBatteryRollup.objects.get(
+            resolution='1h', bucket=self.now.replace(minute=0))
+        self.assertEqual((hour.count, hour.voltage_min, hour.voltage_max), (3, 3.7, 3.9))
+        self.assertAlmostEqual(hour.voltage_sum / hour.count, 3.8)
+
+        expected = self._rollups()
+        LockBatteryRollup.objects.all().delete()
+        rebuild_battery_rollups()
+        self.assertEqual(self._rollups(), expected)
+
+    def test_rebuild_keeps_rollups_of_archived_readings(self):
+        self._send([(3.9, timedelta(days=200)), (3.8, timedelta(seconds=5))])
+        expected = self._rollups()
+        # Comme après l'archivage de la partition : les agrégats restent
+        LockBatteryLog.objects.filter(timestamp__lt=self.now - timedelta(days=1)).delete()
+
+        rebuild_battery_rollups()
+        rebuild_battery_rollups(since=self.now - timedelta(days=365))
+        self.assertEqual(self._rollups(), expected)
+
+    def test_history_picks_resolution(self):
+        self._send([(3.9 - i * 0.01, timedelta(minutes=i)) for i in range(90)])
+        self.client.force_authenticate(user=self.staff_user)
+
+        response = self.client.get(self.url, {
+            'from': (self.now - timedelta(hours=2)).isoformat(),
+            'to': self.now.isoformat(),
+        })
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['resolution'], '1m')
+        self.assertEqual(len(response.data['points']), 90)
+
+        response = self.client.get(self.url, {
+            'from': (self.now - timedelta(hours=2)).isoformat(),
+            'to': self.now.isoformat(),
+            'max_points': 10,
+        })
+        self.assertEqual(response.data['resolution'], '1h')
+        self.assertEqual(sum(point['count'] for point in response.data['points']), 90)
+
+        self.assertEqual(self.client.get(self.url, {'resolution': '5m'}).status_code, 400)
+
+    def test_pick_resolution_respects_retention(self):
+        now = datetime(2026, 6, 1, tzinfo=dt_timezone.utc)
+        self.assertEqual(pick_battery_resolution(now - timedelta(hours=6), now, 500, now=now), '1m')
+        self.assertEqual(pick_battery_resolution(now - timedelta(days=10), now, 500, now=now), '1h')
+        self.assertEqual(pick_battery_resolution(now - timedelta(days=365), now, 500, now=now), '1d')
+        # Les agrégats 1 minute ne remontent pas si loin
+        self.assertEqual(pick_battery_resolution(
+            now - timedelta(days=60), now - timedelta(days=60, hours=-1), 500, now=now), '1h')
+
+    def test_prune(self):
+        self._send([(3.9, timedelta(days=40)), (3.8, timedelta(days=1))])
+        deleted = prune_battery_history()
+        self.assertNotIn('raw', deleted)
+        self.assertEqual(deleted['1m'], 1)
+        # Les mesures brutes ne partent qu'avec leur partition (manage_log_partitions)
+        self.assertEqual(LockBatteryLog.objects.count(), 2)
+        self.assertTrue(LockBatteryRollup.objects.filter(
+            resolution='1d', bucket__lt=self.now - timedelta(days=39)).exists())
+
+
+class LockBatteryForecastTestCase(APITestCase): #Test prévision d'épuisement
+    def setUp(self):
+        self.staff_user = User.objects.create_user(
+            username='staff', email='staff@test.com', password='password', is_staff=True)
+        self.locks = [Lock.objects.create(name=f'Lock {i}') for i in range(3)]
+        self.now = timezone.now().replace(minute=0, second=0, microsecond=0)
+
+    def _send(self, lock, voltages):
+        # Une mesure par heure, la dernière il y a une heure
+        response = self.client.post('/locks/battery/batch/', [
+            {'lock': lock.id_lock, 'voltage': voltage, 'current': 0.1,
+             'timestamp': (self.now - timedelta(hours=len(voltages) - i)).isoformat()}
+            for i, voltage in enumerate(voltages)
+        ], format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_fit_ignores_points_before_battery_change(self):
+        days = np.array([-4, -3, -2, -1, -3, -2, -1, 0], dtype=float)
+        voltages = np.array([3.5, 3.4, 4.1, 4.0, 3.9, 3.9, 3.9, 3.9])
+        index = np.array([0, 0, 0, 0, 1, 1, 1, 1])
+        rates, remaining = fit_depletion(
+            index, days, voltages, np.ones(8), 3,
+            threshold=3.3, recharge_jump=0.2, min_span_days=1)
+
+        # Serrure 0 : seule la nouvelle batterie compte (4.1 -> 4.0 en un jour)
+        self.assertAlmostEqual(rates[0], 0.1)
+        self.assertAlmostEqual(remaining[0], 6.0)  # 3.9 V maintenant
+        # Serrure 1 : tension stable, serrure 2 : aucune donnée
+        self.assertAlmostEqual(rates[1], 0.0)
+        self.assertTrue(np.isnan(remaining[1]))
+        self.assertTrue(np.isnan(rates[2]) and np.isnan(remaining[2]))
+
+    def test_forecast_endpoint_sorted_by_depletion(self):
+        # 0.24 V/jour et 0.048 V/jour sur deux jours
+        self._send(self.locks[0], [3.80 - 0.01 * i for i in range(48)])
+        self._send(self.locks[1], [3.90 - 0.002 * i for i in range(48)])
+        self._send(self.locks[2], [3.90] * 48)
+        self.assertEqual(compute_battery_forecasts(now=self.now), 2)
+
+        self.client.force_authenticate(user=self.staff_user)
+        response = self.client.get('/locks/battery/forecast/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        forecasts = response.data['forecasts']
+        self.assertEqual(
+            [f['id_lock'] for f in forecasts], [self.locks[0].id_lock, self.locks[1].id_lock])
+        self.assertAlmostEqual(forecasts[0]['discharge_rate_per_day'], 0.24, places=2)
+        self.assertAlmostEqual(forecasts[0]['remaining_days'], (3.33 - 3.30) / 0.24, delta=0.1)
+
+        response = self.client.get('/locks/battery/forecast/', {'within_days': 2})
+        self.assertEqual(len(response.data['forecasts']), 1)
+
+
+class RemoteCommandTestCase(APITestCase): #Test commandes à distance
+    def setUp(self):
+        self.lock = Lock.objects.create(name='Lock 1', remote_address='192.168.1.50')
+        self.dispatcher = RemoteCommandDispatcher(
+            max_workers=2, per_host_limit=1, timeout=1, max_attempts=3, backoff=0)
+
+    def _response(self, status_code):
+        response = requests.Response()
+        response.status_code = status_code
+        return response
+
+    @override_settings(REMOTE_COMMAND_EAGER=True)
+    def test_remote_open_returns_job_id(self):
+        with mock.patch('requests.Session.get', return_value=self._response(200)) as get:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(f'/locks/{self.lock.id_lock}/remote-open/')
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        get.assert_called_once_with('http://192.168.1.50/open', timeout=2.0)
+
+        response = self.client.get(f"/locks/commands/{response.data['job_id']}/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['status'], 'succeeded')
+        self.assertEqual(response.data['attempts'], 1)
+
+    def test_remote_open_without_address(self):
+        lock = Lock.objects.create(name='Lock 2')
+        response = self.client.post(f'/locks/{lock.id_lock}/remote-open/')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(RemoteCommand.objects.exists())
+
+    def test_retries_network_errors(self):
+        command = RemoteCommand.objects.create(lock=self.lock, command='open')
+        side_effect = [requests.exceptions.ConnectTimeout(), requests.exceptions.ConnectionError(), self._response(200)]
+        with mock.patch('requests.Session.get', side_effect=side_effect):
+            command = self.dispatcher.run(command.pk)
+
+        self.assertEqual((command.status, command.attempts), ('succeeded', 3))
+        self.assertIsNotNone(command.finished_at)
+
+    def test_gives_up(self):
+        command = RemoteCommand.objects.create(lock=self.lock, command='open')
+        with mock.patch('requests.Session.get', return_value=self._response(403)) as get:
+            command = self.dispatcher.run(command.pk)
+        self.assertEqual((command.status, command.attempts, command.response_status), ('failed', 1, 403))
+        self.assertEqual(get.call_count, 1)
+
+        command = RemoteCommand.objects.create(lock=self.lock, command='open')
+        with mock.patch('requests.Session.get', side_effect=requests.exceptions.ConnectionError('down')):
+            command = self.dispatcher.run(command.pk)
+        self.assertEqual((command.status, command.attempts), ('failed', 3))
+        self.assertIn('down', command.error)
+
+    def test_lost_commands_marked_failed(self):
+        now = timezone.now()
+        lost = [RemoteCommand.objects.create(lock=self.lock, command='open', status=status_)
+                for status_ in ('pending', 'running', 'succeeded')]
+        recent = RemoteCommand.objects.create(lock=self.lock, command='open')
+        RemoteCommand.objects.filter(pk__in=[c.pk for c in lost]).update(
+            created_at=now - timedelta(minutes=10))
+
+        self.assertEqual(fail_stale_commands(now=now), 2)
+        statuses = dict(RemoteCommand.objects.values_list('pk', 'status'))
+        self.assertEqual(
+            [statuses[c.pk] for c in lost + [recent]], ['failed', 'failed', 'succeeded', 'pending'])
+        self.assertTrue(RemoteCommand.objects.get(pk=lost[0].pk).finished_at)
+
+
+class LockGroupCommandTestCase(APITestCase): #Test commandes de groupe
+    def setUp(self):
+        self.staff_user = User.objects.create_user(
+            username='staff', email='staff@test.com', password='password', is_staff=True)
+        self.group = Lock_Group.objects.create(name='Bâtiment A')
+        self.locks = [
+            Lock.objects.create(name=f'Lock {i}', remote_address=f'10.0.0.{i}' if i else None)
+            for i in range(3)
+        ]
+        self.group.locks.add(*self.locks)
+        self.url = f'/locks/groups/{self.group.id_group}/command/'
+        self.client.force_authenticate(user=self.staff_user)
+
+    def _response(self, status_code):
+        response = requests.Response()
+        response.status_code = status_code
+        return response
+
+    @override_settings(REMOTE_COMMAND_EAGER=True)
+    def test_wait_returns_results(self):
+        def get(url, timeout):
+            return self._response(200 if url.startswith('http://10.0.0.1/') else 403)
+
+        with mock.patch('requests.Session.get', side_effect=get):
+            response = self.client.post(self.url, {'command': 'lockdown', 'wait': True}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['counts']['succeeded'], 1)
+        self.assertEqual(response.data['counts']['failed'], 1)
+        self.assertEqual(response.data['skipped'], [self.locks[0].id_lock])
+        self.assertTrue(response.data['done'])
+        self.assertIsNotNone(response.data['latency_ms'])
+
+    def test_wait_timeout_returns_status_url(self):
+        # Serrures qui ne répondent pas avant REMOTE_COMMAND_WAIT_TIMEOUT
+        with mock.patch.object(RemoteCommandDispatcher, 'run_many') as run_many:
+            response = self.client.post(self.url, {'command': 'lockdown', 'wait': True}, format='json')
+
+        self.assertEqual(run_many.call_args.kwargs['timeout'], settings.REMOTE_COMMAND_WAIT_TIMEOUT)
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertFalse(response.data['done'])
+        self.assertEqual(response.data['counts']['pending'], 2)
+        self.assertTrue(response.data['status_url'].endswith(
+            f"/locks/commands/batches/{response.data['batch_id']}/"))
+
+    @override_settings(REMOTE_COMMAND_EAGER=True)
+    def test_queued_batch(self):
+        with mock.patch('requests.Session.get', return_value=self._response(200)):
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(self.url, {'command': 'ping'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+
+        response = self.client.get(f"/locks/commands/batches/{response.data['batch_id']}/")
+        self.assertEqual(response.data['counts']['succeeded'], 2)
+        self.assertEqual(
+            {result['command'] for result in response.data['results']}, {'ping'})
+
+    def test_invalid_requests(self):
+        self.assertEqual(
+            self.client.post(self.url, {'command': 'explode'}, format='json').status_code,
+            status.HTTP_400_BAD_REQUEST)
+        self.client.force_authenticate(user=User.objects.create_user(username='user'))
+        self.assertEqual(
+            self.client.post(self.url, {'command': 'open'}, format='json').status_code,
+            status.HTTP_403_FORBIDDEN)
+
+
+class LockGroupCommandConcurrencyTestCase(TransactionTestCase): #Les serrures sont appelées en parallèle
+    def test_fan_out_takes_one_round_trip(self):
+        locks = [Lock.objects.create(name=f'Lock {i}', remote_address=f'10.0.1.{i}') for i in range(20)]
+        dispatcher = RemoteCommandDispatcher(
+            max_workers=32, per_host_limit=1, timeout=1, max_attempts=1, backoff=0)
+
+        # Chaque appel attend que les 20 soient en cours : en série, la barrière
+        # expire et les commandes échouent (pas de mesure de temps, fiable en CI)
+        all_in_flight = threading.Barrier(len(locks), timeout=10)
+
+        def get(url, timeout):
+            try:
+                all_in_flight.wait()
+            except threading.BrokenBarrierError:
+                raise requests.exceptions.ConnectionError("calls not concurrent")
+            response = requests.Response()
+            response.status_code = 200
+            return response
+
+        batch_id, commands = send_remote_commands(locks, 'lockdown')
+        with mock.patch('requests.Session.get', side_effect=get):
+            dispatcher.run_many([c.pk for c in commands], timeout=30)
+
+        self.assertEqual(
+            RemoteCommand.objects.filter(batch_id=batch_id, status='succeeded').count(), 20)
+
+
+class LockLivenessTestCase(APITestCase): #Test heartbeats et déconnexion
+    def setUp(self):
+        self.locks = [Lock.objects.create(name=f'Lock {i}') for i in range(3)]
+        self.tracker = HeartbeatTracker(flush_interval=60, timeout=90, background=False)
+        self.now = timezone.now()
+
+    def test_tracker_coalesces_heartbeats(self):
+        for seconds in (30, 10, 20):
+            self.tracker.beat(self.locks[0].id_lock, self.now - timedelta(seconds=seconds))
+        self.tracker.beat(self.locks[1].id_lock, self.now)
+
+        # Un UPDATE pour toutes les serrures, un NOTIFY pour les événements
+        with self.assertNumQueries(2):
+            self.assertEqual(self.tracker.flush(), 2)
+
+        self.locks[0].refresh_from_db()
+        self.assertEqual(self.locks[0].status, 'connected')
+        self.assertEqual(self.locks[0].last_connexion, self.now - timedelta(seconds=10))
+
+        # Un heartbeat plus ancien ne recule pas last_connexion
+        self.tracker.beat(self.locks[0].id_lock, self.now - timedelta(seconds=50))
+        self.assertEqual(self.tracker.flush(), 0)
+
+    def test_sweep_marks_silent_locks_disconnected(self):
+        self.tracker.beat(self.locks[0].id_lock, self.now - timedelta(seconds=120))
+        self.tracker.beat(self.locks[1].id_lock, self.now - timedelta(seconds=30))
+        self.tracker.flush()
+
+        self.assertEqual(self.tracker.sweep(self.now), 1)
+        statuses = dict(Lock.objects.values_list('id_lock', 'status'))
+        self.assertEqual(statuses[self.locks[0].id_lock], 'disconnected')
+        self.assertEqual(statuses[self.locks[1].id_lock], 'connected')
+
+    def test_heartbeat_endpoint(self):
+        response = self.client.post('/locks/heartbeat/', {'lock': self.locks[2].id_lock}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.locks[2].refresh_from_db()
+        self.assertEqual(self.locks[2].status, 'connected')
+        self.assertEqual(
+            self.client.post('/locks/heartbeat/', {'lock': 'x'}, format='json').status_code,
+            status.HTTP_400_BAD_REQUEST)
+
+    def test_battery_readings_count_as_heartbeats(self):
+        self.client.post('/locks/battery/', {
+            'lock': self.locks[0].id_lock, 'voltage': 3.9, 'current': 0.1}, format='json')
+        self.locks[0].refresh_from_db()
+        self.assertEqual(self.locks[0].status, 'connected')
+        self.assertEqual(mark_silent_locks_disconnected(90), 0)
+
+
+class LockEventStreamTestCase(TransactionTestCase): #Flux SSE (NOTIFY n'est délivré qu'au commit)
+    async def _next_event(self, stream):
+        chunk = await asyncio.wait_for(anext(stream), timeout=5)
+        return chunk.decode() if isinstance(chunk, bytes) else chunk
+
+    async def test_stream_receives_published_events(self):
+        staff = await User.objects.acreate(username='staff', is_staff=True)
+        lock = await Lock.objects.acreate(name='Lock 1')
+        await self.async_client.aforce_login(staff)
+
+        response = await self.async_client.get(f'/locks/stream/?locks={lock.id_lock}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = aiter(response.streaming_content)
+        self.assertTrue((await self._next_event(stream)).startswith('retry:'))
+
+        # Événement d'une autre serrure filtré, puis heartbeat de la serrure suivie
+        await sync_to_async(publish_lock_event)('status', lock.id_lock + 1, status='connected')
+        with override_settings(LOCK_HEARTBEAT_ASYNC=False):
+            await sync_to_async(self.client.post)(
+                '/locks/heartbeat/', {'lock': lock.id_lock}, content_type='application/json')
+        event = await self._next_event(stream)
+        self.assertTrue(event.startswith('event: status\n'))
+        data = json.loads(event.split('data: ', 1)[1])
+        self.assertEqual((data['lock'], data['status']), (lock.id_lock, 'connected'))
+        await stream.aclose()
+
+    async def test_stream_requires_staff(self):
+        response = await self.async_client.get('/locks/stream/')
+        self.assertEqual(response.status_code, 403)
+
+    def test_stream_refused_under_wsgi(self):
+        staff = User.objects.create_user(username='staff', is_staff=True)
+        self.client.force_login(staff)
+        self.assertEqual(self.client.get('/locks/stream/').status_code, 404)
+
+    async def test_asgi_application_only_serves_stream(self):
+        from backend.asgi import application
+        sent = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {'type': 'http', 'method': 'GET', 'path': '/locks/', 'query_string': b'', 'headers': []}
+        await application(scope, receive, send)
+        self.assertEqual(sent[0]['status'], 404)
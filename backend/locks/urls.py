@@ -8,7 +8,15 @@ from .views import (
     DeleteLockGroupView,
     ReservableLocksView,
     LockBatteryLogView,
-    RemoteOpenLockView
+    LockHeartbeatView,
+    LockBatteryLogBatchView,
+    LockBatteryHistoryView,
+    LockBatteryForecastView,
+    RemoteOpenLockView,
+    RemoteCommandStatusView,
+    LockGroupCommandView,
+    RemoteCommandBatchView,
+    lock_event_stream,
 )
 
 urlpatterns = [
@@ -23,6 +31,15 @@ urlpatterns = [
          RemoveLockFromGroupView.as_view(), name='remove_locks_from_group'),
     path('groups/<int:group_id>/delete/',
          DeleteLockGroupView.as_view(), name='delete-lock-group'),
+    path('groups/<int:group_id>/command/',
+         LockGroupCommandView.as_view(), name='lock_group_command'),
+    path('stream/', lock_event_stream, name='lock_event_stream'),
+    path('heartbeat/', LockHeartbeatView.as_view(), name='lock_heartbeat'),
     path('battery/', LockBatteryLogView.as_view(), name='lock_battery_log'),
+    path('battery/batch/', LockBatteryLogBatchView.as_view(), name='lock_battery_log_batch'),
+    path('battery/forecast/', LockBatteryForecastView.as_view(), name='lock_battery_forecast'),
+    path('<int:lock_id>/battery/history/', LockBatteryHistoryView.as_view(), name='lock_battery_history'),
     path('<int:lock_id>/remote-open/', RemoteOpenLockView.as_view(), name='remote_open_lock'),
+    path('commands/batches/<uuid:batch_id>/', RemoteCommandBatchView.as_view(), name='remote_command_batch'),
+    path('commands/<uuid:command_id>/', RemoteCommandStatusView.as_view(), name='remote_command_status'),
 ]
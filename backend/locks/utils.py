@@ -0,0 +1,286 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Min
+from django.utils import timezone
+from .models import Lock, LockBatteryLog, LockState, LockBatteryRollup
+from .events import publish_lock_events
+
+# Durée des tranches de LockBatteryRollup, de la plus fine à la plus grossière
+BATTERY_RESOLUTIONS = {
+    '1m': timedelta(minutes=1),
+    '1h': timedelta(hours=1),
+    '1d': timedelta(days=1),
+}
+
+# Cellule Li-Ion (max 4.2 V, nominale 3.7 V, min 3.0 V) : seuils ajustés
+# pour la "courbe plate", du plus haut au plus bas
+BATTERY_BAR_THRESHOLDS = [
+    (4.00, 4),  # 100% - 85% (Chargée à bloc)
+    (3.75, 3),  # 85% - 50% (Début du plateau)
+    (3.55, 2),  # 50% - 20% (Fin du plateau)
+    (3.30, 1),  # 20% - 5% (Chute finale)
+]
+
+
+def battery_bars(voltage):
+    """Number of battery bars (0 to 4) shown for `voltage`."""
+    for threshold, bars in BATTERY_BAR_THRESHOLDS:
+        if voltage >= threshold:
+            return bars
+    return 0  # < 5% (Danger)
+
+
+def record_battery_readings(readings):
+    """
+    Insert battery readings (dicts with lock_id, timestamp, voltage and
+    current) in a single statement. A reading whose (lock, timestamp)
+    already exists is skipped, so a device can resend a batch safely.
+
+    Returns the readings actually inserted, as (lock_id, timestamp,
+    voltage, current) tuples, after adding them to the LockState and the
+    rollups of their locks.
+    """
+    if not readings:
+        return []
+
+    table = LockBatteryLog._meta.db_table
+    columns = {
+        "lock_id": "int[]",
+        "timestamp": "timestamptz[]",
+        "voltage": "float8[]",
+        "current": "float8[]",
+    }
+
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                INSERT INTO {table} (lock_id, timestamp, voltage, current)
+                SELECT * FROM unnest({", ".join(f"%s::{cast}" for cast in columns.values())})
+                ON CONFLICT (lock_id, timestamp) DO NOTHING
+                RETURNING lock_id, timestamp, voltage, current
+                """,
+                [[reading[column] for reading in readings] for column in columns],
+            )
+            inserted = cursor.fetchall()
+
+        latest = update_battery_states(inserted)
+        add_to_battery_rollups(inserted)
+        # Même forme que LockSerializer.battery_level
+        publish_lock_events([
+            {
+                "type": "battery",
+                "lock": lock_id,
+                "voltage": voltage,
+                "current": current,
+                "timestamp": timestamp,
+                "bars": battery_bars(voltage),
+                "percent_approx": int((battery_bars(voltage) / 4) * 100),
+            }
+            for lock_id, (timestamp, voltage, current) in latest.items()
+        ])
+    return inserted
+
+
+def update_battery_states(readings):
+    """
+    Copy the latest of `readings` ((lock_id, timestamp, voltage, current)
+    tuples) of each lock to its LockState, unless the state already holds
+    a more recent reading (readings may arrive out of order). Returns the
+    latest reading per lock, {lock_id: (timestamp, voltage, current)}.
+    """
+    latest = {}
+    for lock_id, timestamp, voltage, current in readings:
+        if lock_id not in latest or timestamp >= latest[lock_id][0]:
+            latest[lock_id] = (timestamp, voltage, current)
+    if not latest:
+        return latest
+
+    table = LockState._meta.db_table
+    placeholders = ", ".join(["(%s, %s, %s, %s, %s)"] * len(latest))
+    params = []
+    for lock_id, (timestamp, voltage, current) in latest.items():
+        params.extend([lock_id, voltage, current, timestamp, battery_bars(voltage)])
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            INSERT INTO {table} AS state
+                (lock_id, battery_voltage, battery_current, battery_timestamp, battery_bars)
+            VALUES {placeholders}
+            ON CONFLICT (lock_id) DO UPDATE SET
+                battery_voltage = EXCLUDED.battery_voltage,
+                battery_current = EXCLUDED.battery_current,
+                battery_timestamp = EXCLUDED.battery_timestamp,
+                battery_bars = EXCLUDED.battery_bars
+            WHERE state.battery_timestamp IS NULL
+               OR state.battery_timestamp <= EXCLUDED.battery_timestamp
+            """,
+            params,
+        )
+    return latest
+
+
+def battery_bucket(timestamp, resolution):
+    """Start of the `resolution` bucket containing `timestamp` (UTC)."""
+    seconds = int(BATTERY_RESOLUTIONS[resolution].total_seconds())
+    epoch = int(timestamp.timestamp()) // seconds * seconds
+    return datetime.fromtimestamp(epoch, tz=dt_timezone.utc)
+
+
+def add_to_battery_rollups(readings):
+    """
+    Add `readings` ((lock_id, timestamp, voltage, current) tuples) to the
+    rollups of every resolution, with one INSERT ... ON CONFLICT. The batch
+    is aggregated first: a statement cannot update the same row twice.
+    """
+    aggregates = {}
+    for lock_id, timestamp, voltage, current in readings:
+        for resolution in BATTERY_RESOLUTIONS:
+            key = (lock_id, resolution, battery_bucket(timestamp, resolution))
+            aggregate = aggregates.get(key)
+            if aggregate is None:
+                aggregates[key] = [1, voltage, voltage, voltage, current, current, current]
+            else:
+                aggregate[0] += 1
+                aggregate[1] = min(aggregate[1], voltage)
+                aggregate[2] = max(aggregate[2], voltage)
+                aggregate[3] += voltage
+                aggregate[4] = min(aggregate[4], current)
+                aggregate[5] = max(aggregate[5], current)
+                aggregate[6] += current
+    if not aggregates:
+        return
+
+    table = LockBatteryRollup._meta.db_table
+    placeholders = ", ".join(["(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)"] * len(aggregates))
+    params = [value for key, aggregate in aggregates.items() for value in (*key, *aggregate)]
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            INSERT INTO {table} AS rollup
+                (lock_id, resolution, bucket, count, voltage_min, voltage_max, voltage_sum,
+                 current_min, current_max, current_sum)
+            VALUES {placeholders}
+            ON CONFLICT (lock_id, resolution, bucket) DO UPDATE SET
+                count = rollup.count + EXCLUDED.count,
+                voltage_min = LEAST(rollup.voltage_min, EXCLUDED.voltage_min),
+                voltage_max = GREATEST(rollup.voltage_max, EXCLUDED.voltage_max),
+                voltage_sum = rollup.voltage_sum + EXCLUDED.voltage_sum,
+                current_min = LEAST(rollup.current_min, EXCLUDED.current_min),
+                current_max = GREATEST(rollup.current_max, EXCLUDED.current_max),
+                current_sum = rollup.current_sum + EXCLUDED.current_sum
+            """,
+            params,
+        )
+
+
+def oldest_battery_reading():
+    """Timestamp of the oldest raw LockBatteryLog row (None if there is none)."""
+    return LockBatteryLog.objects.aggregate(oldest=Min('timestamp'))['oldest']
+
+
+def rebuild_battery_rollups(since=None):
+    """
+    Recompute the rollups from the raw LockBatteryLog rows, entirely or
+    from the day containing `since`. Only the range still present in
+    LockBatteryLog is deleted and recomputed: the rollups of readings
+    already archived (BATTERY_RAW_RETENTION_MONTHS) are kept. Returns the
+    number of rollup rows written.
+    """
+    oldest = oldest_battery_reading()
+    if oldest is None:
+        return 0
+    # Début de la tranche la plus grossière, pour ne pas la tronquer
+    params = [battery_bucket(oldest if since is None else max(since, oldest), '1d')]
+
+    rollup_table = LockBatteryRollup._meta.db_table
+    log_table = LockBatteryLog._meta.db_table
+
+    values = ", ".join(
+        f"('{name}', {int(duration.total_seconds())})"
+        for name, duration in BATTERY_RESOLUTIONS.items()
+    )
+
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {rollup_table} WHERE bucket >= %s", params)
+            cursor.execute(
+                f"""
+                INSERT INTO {rollup_table}
+                    (lock_id, resolution, bucket, count, voltage_min, voltage_max, voltage_sum,
+                     current_min, current_max, current_sum)
+                SELECT lock_id, resolution.name,
+                       to_timestamp(floor(extract(epoch FROM timestamp) / resolution.seconds) * resolution.seconds),
+                       count(*), min(voltage), max(voltage), sum(voltage),
+                       min(current), max(current), sum(current)
+                FROM {log_table}
+                CROSS JOIN (VALUES {values}) AS resolution (name, seconds)
+                WHERE timestamp >= %s
+                GROUP BY 1, 2, 3
+                """,
+                params,
+            )
+            return cursor.rowcount
+
+
+def prune_battery_history(now=None):
+    """
+    Delete the rollups older than their BATTERY_ROLLUP_RETENTION_DAYS.
+    The raw readings are archived by partition (manage_log_partitions,
+    BATTERY_RAW_RETENTION_MONTHS). Returns {resolution: deleted rows}.
+    """
+    now = now or timezone.now()
+    deleted = {}
+
+    for resolution, days in settings.BATTERY_ROLLUP_RETENTION_DAYS.items():
+        if days:
+            cutoff = now - timedelta(days=days)
+            deleted[resolution], _ = LockBatteryRollup.objects.filter(
+                resolution=resolution, bucket__lt=cutoff).delete()
+
+    return deleted
+
+
+def pick_battery_resolution(start, end, max_points, now=None):
+    """
+    Finest resolution giving at most `max_points` buckets over [start, end]
+    and still kept (retention) at `start`. Falls back to the coarsest.
+    """
+    now = now or timezone.now()
+    for resolution, duration in BATTERY_RESOLUTIONS.items():
+        days = settings.BATTERY_ROLLUP_RETENTION_DAYS.get(resolution)
+        if days and start < now - timedelta(days=days):
+            continue
+        if (end - start) / duration <= max_points:
+            return resolution
+    return list(BATTERY_RESOLUTIONS)[-1]
+
+
+def update_group_locks(group, lock_ids, add=True):
+    """
+    Add (or remove) the locks `lock_ids` to (from) lock group `group` in
+    one statement, whatever their number; the m2m_changed signals still
+    fire once. Returns (changed, skipped, missing): the (id, name)
+    changed, the (id, name) already in (or not in) the group, and the ids
+    matching no lock.
+    """
+    requested = set(lock_ids)
+    names = dict(Lock.objects.filter(id_lock__in=requested).values_list("id_lock", "name"))
+    members = set(group.locks.filter(id_lock__in=names).values_list("id_lock", flat=True))
+    changed = set(names) - members if add else members
+
+    if changed:
+        with transaction.atomic():
+            if add:
+                group.locks.add(*changed)
+            else:
+                group.locks.remove(*changed)
+
+    return (
+        sorted((lock_id, names[lock_id]) for lock_id in changed),
+        sorted((lock_id, names[lock_id]) for lock_id in set(names) - changed),
+        sorted(requested - set(names)),
+    )
@@ -1,12 +1,79 @@
+import asyncio
+import json
+from collections import defaultdict
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.parsers import JSONParser
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from datetime import timedelta
 from django.shortcuts import get_object_or_404
 from django.db.models import Prefetch
-from .models import Lock, Lock_Group, LockBatteryLog
-from .serializers import LockSerializer, LockGroupSerializer, AddLocksToGroupSerializer, LockBatteryLogSerializer
-import requests # N'oublie pas d'importer requests en haut du fichier
+from django.utils.dateparse import parse_datetime
+from .models import Lock, Lock_Group, LockBatteryRollup, LockState, RemoteCommand
+from .serializers import LockSerializer, LockGroupSerializer, AddLocksToGroupSerializer, LockBatteryLogSerializer, BatteryReadingSerializer
+from .parsers import NDJSONParser
+from .dispatcher import send_remote_command, send_remote_commands, get_remote_command_dispatcher
+from .liveness import record_heartbeat
+from .events import get_lock_event_broker
+from .utils import (
+    record_battery_readings, pick_battery_resolution, update_group_locks, BATTERY_RESOLUTIONS)
+
+
+def remote_command_data(command):
+    return {
+        "id": command.pk,
+        "lock": command.lock_id,
+        "command": command.command,
+        "status": command.status,
+        "attempts": command.attempts,
+        "response_status": command.response_status,
+        "latency_ms": command.latency_ms,
+        "error": command.error,
+        "created_at": command.created_at,
+        "started_at": command.started_at,
+        "finished_at": command.finished_at,
+    }
+
+
+def remote_command_batch_data(batch_id):
+    """Per-lock results and aggregate counts/latencies of a group command."""
+    commands = list(
+        RemoteCommand.objects.filter(batch_id=batch_id).select_related('lock').order_by('lock_id')
+    )
+    counts = {status_name: 0 for status_name, _ in RemoteCommand.STATUS_CHOICES}
+    for command in commands:
+        counts[command.status] += 1
+
+    latencies = sorted(c.latency_ms for c in commands if c.latency_ms is not None)
+    started = [c.started_at for c in commands if c.started_at]
+    finished = [c.finished_at for c in commands if c.finished_at]
+    done = bool(commands) and len(finished) == len(commands)
+
+    return {
+        "batch_id": batch_id,
+        "command": commands[0].command if commands else None,
+        "total": len(commands),
+        "counts": counts,
+        "done": done,
+        "latency_ms": {
+            "min": latencies[0],
+            "avg": sum(latencies) / len(latencies),
+            "p95": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+            "max": latencies[-1],
+        } if latencies else None,
+        # Durée de bout en bout du groupe : premier départ -> dernière réponse
+        "elapsed_ms": (max(finished) - min(started)).total_seconds() * 1000 if done and started else None,
+        "results": [
+            {**remote_command_data(command), "lock_name": command.lock.name}
+            for command in commands
+        ],
+    }
 
 
 class LocksView(APIView):
@@ -17,13 +84,7 @@ class LocksView(APIView):
         if not user.is_staff:
             return Response({"error": "Unauthorized"}, status=status.HTTP_403_FORBIDDEN)
 
-        latest_log_prefetch = Prefetch(
-            'lockbatterylog_set',
-            queryset=LockBatteryLog.objects.order_by('-id'),
-            to_attr='latest_log'
-        )
-
-        locks = Lock.objects.all().prefetch_related(latest_log_prefetch)
+        locks = Lock.objects.all().select_related('state')
 
         return Response({"locks": LockSerializer(locks, many=True).data}, status=status.HTTP_200_OK)
 
@@ -78,6 +139,10 @@ class LocksView(APIView):
 class LockGroupsView(APIView):
     """GET: Liste les groupes de serrures
        POST: Crée un nouveau groupe de serrures
+
+    The listing takes two queries whatever the number of groups and locks
+    (groups, then their locks with their state). With `?locks=ids`, each
+    group only lists the ids of its locks, read from the membership table.
     """
     permission_classes = [IsAuthenticated]
 
@@ -86,7 +151,23 @@ class LockGroupsView(APIView):
         if not user.is_staff:
             return Response({"error": "Unauthorized to view lock groups"}, status=status.HTTP_403_FORBIDDEN)
 
-        groups = Lock_Group.objects.all()
+        if request.query_params.get('locks') == 'ids':
+            groups = list(Lock_Group.objects.order_by('id_group').values('id_group', 'name'))
+            lock_ids = defaultdict(list)
+            memberships = Lock_Group.locks.through.objects.filter(
+                lock_group_id__in=[group['id_group'] for group in groups]
+            ).order_by('lock_id').values_list('lock_group_id', 'lock_id')
+            for group_id, lock_id in memberships:
+                lock_ids[group_id].append(lock_id)
+            return Response({
+                "lock_groups": [
+                    {**group, "lock_ids": lock_ids[group['id_group']]} for group in groups
+                ]
+            }, status=status.HTTP_200_OK)
+
+        groups = Lock_Group.objects.order_by('id_group').prefetch_related(
+            Prefetch('locks', queryset=Lock.objects.select_related('state').order_by('id_lock'))
+        )
         serializer = LockGroupSerializer(groups, many=True)
         return Response({"lock_groups": serializer.data}, status=status.HTTP_200_OK)
 
@@ -119,19 +200,19 @@ class AddLocksToGroupView(APIView):
         serializer = AddLocksToGroupSerializer(data=request.data)
 
         if serializer.is_valid():
-            lock_ids = serializer.validated_data['lock_ids']
-            locks = Lock.objects.filter(id_lock__in=lock_ids)
+            added, skipped, missing = update_group_locks(
+                group, serializer.validated_data['lock_ids'])
 
-            if not locks.exists():
+            if not (added or skipped):
                 return Response({"error": "Aucune serrure trouvée avec ces IDs"}, status=status.HTTP_404_NOT_FOUND)
 
-            for lock in locks:
-                group.locks.add(lock)
-
             return Response({
-                "message": f"{locks.count()} serrure(s) ajoutée(s) au groupe '{group.name}'.",
+                "message": f"{len(added)} serrure(s) ajoutée(s) au groupe '{group.name}'.",
                 "group": group.name,
-                "locks_added": [lock.name for lock in locks]
+                "locks_added": [name for _, name in added],
+                # Déjà dans le groupe / IDs inconnus
+                "locks_skipped": [name for _, name in skipped],
+                "missing_ids": missing,
             }, status=status.HTTP_200_OK)
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -147,7 +228,7 @@ class GroupLocksView(APIView):
             return Response({"error": "Unauthorized to view group locks"}, status=status.HTTP_403_FORBIDDEN)
 
         group = get_object_or_404(Lock_Group, id_group=group_id)
-        locks = group.locks.all()
+        locks = group.locks.all().select_related('state')
         serializer = LockSerializer(locks, many=True)
         return Response({
             "group": group.name,
@@ -169,19 +250,19 @@ class RemoveLockFromGroupView(APIView):
         serializer = AddLocksToGroupSerializer(data=request.data)
 
         if serializer.is_valid():
-            lock_ids = serializer.validated_data['lock_ids']
-            locks = Lock.objects.filter(id_lock__in=lock_ids)
+            removed, skipped, missing = update_group_locks(
+                group, serializer.validated_data['lock_ids'], add=False)
 
-            if not locks.exists():
+            if not (removed or skipped):
                 return Response({"error": "Aucune serrure trouvée avec ces IDs"}, status=status.HTTP_404_NOT_FOUND)
 
-            for lock in locks:
-                group.locks.remove(lock)
-
             return Response({
-                "message": f"{locks.count()} serrure(s) retirée(s) du groupe '{group.name}'.",
+                "message": f"{len(removed)} serrure(s) retirée(s) du groupe '{group.name}'.",
                 "group": group.name,
-                "locks_removed": [lock.name for lock in locks]
+                "locks_removed": [name for _, name in removed],
+                # Pas dans le groupe / IDs inconnus
+                "locks_skipped": [name for _, name in skipped],
+                "missing_ids": missing,
             }, status=status.HTTP_200_OK)
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -215,7 +296,7 @@ class ReservableLocksView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        reservable_locks = Lock.objects.filter(is_reservable=True)
+        reservable_locks = Lock.objects.filter(is_reservable=True).select_related('state')
 
         serializer = LockSerializer(reservable_locks, many=True)
 
@@ -227,30 +308,361 @@ class LockBatteryLogView(APIView):
         serializer = LockBatteryLogSerializer(data=request.data)
 
         if serializer.is_valid():
-            serializer.save()
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
+            # Même chemin que l'envoi groupé (état et agrégats de la serrure)
+            data = serializer.validated_data
+            timestamp = timezone.now()
+            record_battery_readings([{
+                "lock_id": data["lock"].id_lock,
+                "timestamp": timestamp,
+                "voltage": data["voltage"],
+                "current": data["current"],
+            }])
+            record_heartbeat(data["lock"].id_lock, timestamp)
+            return Response({**serializer.data, "timestamp": timestamp}, status=status.HTTP_201_CREATED)
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
-    
+
+
+class LockHeartbeatView(APIView):
+    """
+    POST: Signal de vie d'une serrure, {"lock": id}. Ne fait qu'une écriture
+    en mémoire : status et last_connexion sont mis à jour par lot, voir
+    locks.liveness.
+    """
+
+    def post(self, request):
+        try:
+            lock_id = int(request.data.get("lock"))
+        except (TypeError, ValueError):
+            return Response({"error": "Missing or invalid lock"}, status=status.HTTP_400_BAD_REQUEST)
+
+        record_heartbeat(lock_id)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class LockBatteryLogBatchView(APIView):
+    """
+    POST: Envoi groupé de mesures de batterie, en JSON (liste) ou NDJSON
+    (une mesure par ligne) : {"lock", "voltage", "current", "timestamp"}.
+
+    The timestamp is the one measured by the lock and, with the lock, it is
+    the idempotency key: resending a batch after a lost response does not
+    duplicate anything. Invalid readings are rejected one by one, the
+    others are still recorded.
+    """
+    parser_classes = [JSONParser, NDJSONParser]
+
+    def post(self, request):
+        items = request.data
+        if not isinstance(items, list):
+            return Response({"error": "Expected a list of readings"}, status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > settings.BATTERY_BATCH_MAX_SIZE:
+            return Response(
+                {"error": f"Too many readings, at most {settings.BATTERY_BATCH_MAX_SIZE} per batch"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        # Une mesure trop dans le futur vient d'une horloge non synchronisée
+        latest_allowed = timezone.now() + timedelta(seconds=settings.BATTERY_MAX_CLOCK_SKEW)
+        valid, rejected = [], []
+        for index, item in enumerate(items):
+            serializer = BatteryReadingSerializer(data=item)
+            if not serializer.is_valid():
+                rejected.append({"index": index, "errors": serializer.errors})
+            elif serializer.validated_data["timestamp"] > latest_allowed:
+                rejected.append({"index": index, "errors": {"timestamp": ["Timestamp is in the future."]}})
+            else:
+                valid.append((index, serializer.validated_data))
+
+        known_locks = set(Lock.objects.filter(
+            id_lock__in={data["lock"] for _, data in valid}
+        ).values_list("id_lock", flat=True))
+
+        readings = []
+        for index, data in valid:
+            if data["lock"] not in known_locks:
+                rejected.append({"index": index, "errors": {"lock": ["Lock not found."]}})
+                continue
+            readings.append({
+                "lock_id": data["lock"],
+                "timestamp": data["timestamp"],
+                "voltage": data["voltage"],
+                "current": data["current"],
+            })
+
+        if rejected and not readings:
+            return Response({"error": "No valid reading", "rejected": rejected}, status=status.HTTP_400_BAD_REQUEST)
+
+        inserted = record_battery_readings(readings)
+        # Une serrure qui envoie des mesures est vivante
+        for lock_id in {reading["lock_id"] for reading in readings}:
+            record_heartbeat(lock_id)
+        rejected.sort(key=lambda reject: reject["index"])
+        return Response({
+            "accepted": len(inserted),
+            "duplicates": len(readings) - len(inserted),
+            "rejected": rejected,
+        }, status=status.HTTP_201_CREATED)
+
+
+class LockBatteryHistoryView(APIView):
+    """
+    GET: Historique de batterie d'une serrure, lu dans les agrégats.
+
+    - from / to: ISO 8601 bounds (default: the last 24 hours)
+    - max_points: upper bound on the number of points (default 500)
+    - resolution: 1m, 1h or 1d; by default the finest one giving at most
+      max_points points and still kept for that range
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, lock_id):
+        if not request.user.is_staff:
+            return Response({"error": "Unauthorized"}, status=status.HTTP_403_FORBIDDEN)
+        lock = get_object_or_404(Lock, id_lock=lock_id)
+        params = request.query_params
+
+        bounds = {}
+        for param in ("from", "to"):
+            if params.get(param):
+                bounds[param] = parse_datetime(params[param])
+                if bounds[param] is None:
+                    return Response({"error": f"Invalid {param} datetime, expected ISO 8601"}, status=status.HTTP_400_BAD_REQUEST)
+        end = bounds.get("to") or timezone.now()
+        start = bounds.get("from") or end - timedelta(days=1)
+        if start >= end:
+            return Response({"error": "from must be before to"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            max_points = min(int(params.get("max_points", 500)), settings.BATTERY_HISTORY_MAX_POINTS)
+        except ValueError:
+            return Response({"error": "Invalid max_points"}, status=status.HTTP_400_BAD_REQUEST)
+        if max_points < 1:
+            return Response({"error": "Invalid max_points"}, status=status.HTTP_400_BAD_REQUEST)
+
+        resolution = params.get("resolution") or pick_battery_resolution(start, end, max_points)
+        if resolution not in BATTERY_RESOLUTIONS:
+            return Response({"error": "Invalid resolution, expected 1m, 1h or 1d"}, status=status.HTTP_400_BAD_REQUEST)
+
+        rollups = LockBatteryRollup.objects.filter(
+            lock=lock,
+            resolution=resolution,
+            bucket__gte=start - BATTERY_RESOLUTIONS[resolution],
+            bucket__lte=end,
+        ).order_by("-bucket")[:max_points]
+
+        points = [
+            {
+                "timestamp": rollup.bucket,
+                "count": rollup.count,
+                "voltage_min": rollup.voltage_min,
+                "voltage_max": rollup.voltage_max,
+                "voltage_avg": rollup.voltage_sum / rollup.count,
+                "current_min": rollup.current_min,
+                "current_max": rollup.current_max,
+                "current_avg": rollup.current_sum / rollup.count,
+            }
+            for rollup in reversed(rollups)
+        ]
+
+        return Response({
+            "lock": lock.id_lock,
+            "resolution": resolution,
+            "from": start,
+            "to": end,
+            "points": points,
+        }, status=status.HTTP_200_OK)
+
+
+class LockBatteryForecastView(APIView):
+    """
+    GET: Serrures triées par date prévue d'épuisement de la batterie (la
+    plus proche d'abord), pour planifier les tournées de maintenance.
+    Lit la prévision calculée par la commande forecast_battery_depletion.
+
+    - within_days: only the locks expected to be empty within N days
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        if not request.user.is_staff:
+            return Response({"error": "Unauthorized"}, status=status.HTTP_403_FORBIDDEN)
+
+        now = timezone.now()
+        states = LockState.objects.filter(
+            battery_depletion_at__isnull=False
+        ).select_related('lock').order_by('battery_depletion_at')
+
+        within_days = request.query_params.get("within_days")
+        if within_days:
+            try:
+                states = states.filter(battery_depletion_at__lte=now + timedelta(days=float(within_days)))
+            except ValueError:
+                return Response({"error": "Invalid within_days"}, status=status.HTTP_400_BAD_REQUEST)
+
+        forecasts = [
+            {
+                "id_lock": state.lock_id,
+                "name": state.lock.name,
+                "voltage": state.battery_voltage,
+                "bars": state.battery_bars,
+                "discharge_rate_per_day": state.battery_discharge_rate,
+                "depletion_at": state.battery_depletion_at,
+                "remaining_days": max((state.battery_depletion_at - now).total_seconds() / 86400, 0),
+                "forecast_at": state.battery_forecast_at,
+            }
+            for state in states
+        ]
+        return Response({"forecasts": forecasts}, status=status.HTTP_200_OK)
+
+
 class RemoteOpenLockView(APIView):
+    """
+    POST: Ouverture à distance. La serrure est appelée en arrière-plan
+    (locks.dispatcher) : la réponse (202) donne l'id de la commande, dont
+    le statut se suit sur /locks/commands/<id>/.
+    """
     def post(self, request, lock_id):
-        # Seuls les admins/staff peuvent ouvrir à distance
         lock = get_object_or_404(Lock, id_lock=lock_id)
 
         if not lock.remote_address:
             return Response({"error": "No IP address configured for this lock"}, status=status.HTTP_400_BAD_REQUEST)
 
-        # On tente d'appeler l'IP de la serrure (Exemple: http://192.168.1.50/open)
-        # Adapte l'URL "/open" selon le code de ton ESP32
+        command = send_remote_command(lock, 'open', request.user)
+        return Response({
+            "message": f"Open command queued for {lock.remote_address}",
+            "job_id": command.pk,
+            "status_url": request.build_absolute_uri(f"/locks/commands/{command.pk}/"),
+        }, status=status.HTTP_202_ACCEPTED)
+
+
+class LockGroupCommandView(APIView):
+    """
+    POST: Envoie une commande (open, lockdown, ping) à toutes les serrures
+    d'un groupe en parallèle. Body : {"command": ..., "wait": false}.
+
+    Without wait, answers 202 with the batch id (follow it on
+    /locks/commands/batches/<id>/). With wait=true, the request waits at
+    most REMOTE_COMMAND_WAIT_TIMEOUT seconds (5 by default, enough for one
+    round trip to healthy locks): 200 with the per-lock results and the
+    aggregate latency if every lock replied, otherwise 202 with the
+    results so far and the status URL.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, group_id):
+        if not request.user.is_staff:
+            return Response({"error": "Unauthorized to command lock groups"}, status=status.HTTP_403_FORBIDDEN)
+
+        group = get_object_or_404(Lock_Group, id_group=group_id)
+        command = request.data.get("command")
+        if command not in dict(RemoteCommand.COMMAND_CHOICES):
+            return Response({"error": "Invalid command, expected open, lockdown or ping"}, status=status.HTTP_400_BAD_REQUEST)
+
+        locks = list(group.locks.all())
+        reachable = [lock for lock in locks if lock.remote_address]
+        skipped = [lock.id_lock for lock in locks if not lock.remote_address]
+        if not reachable:
+            return Response({"error": "No lock with an IP address in this group"}, status=status.HTTP_400_BAD_REQUEST)
+
+        batch_id, commands = send_remote_commands(reachable, command, request.user)
+        dispatcher = get_remote_command_dispatcher()
+        command_ids = [c.pk for c in commands]
+
+        status_url = request.build_absolute_uri(f"/locks/commands/batches/{batch_id}/")
+
+        if str(request.data.get("wait", "")).lower() in ("true", "1"):
+            dispatcher.run_many(command_ids, timeout=settings.REMOTE_COMMAND_WAIT_TIMEOUT)
+            data = remote_command_batch_data(batch_id)
+            # Pas fini à temps : le client suit le lot comme sans wait
+            return Response({
+                **data,
+                "skipped": skipped,
+                "status_url": status_url,
+            }, status=status.HTTP_200_OK if data["done"] else status.HTTP_202_ACCEPTED)
+
+        dispatcher.dispatch_many(command_ids)
+        return Response({
+            "message": f"{command} queued for {len(commands)} lock(s) of group '{group.name}'",
+            "batch_id": batch_id,
+            "total": len(commands),
+            "skipped": skipped,
+            "status_url": status_url,
+        }, status=status.HTTP_202_ACCEPTED)
+
+
+class RemoteCommandBatchView(APIView):
+    """GET: Avancement et résultats d'une commande de groupe"""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, batch_id):
+        if not request.user.is_staff:
+            return Response({"error": "Unauthorized"}, status=status.HTTP_403_FORBIDDEN)
+
+        data = remote_command_batch_data(batch_id)
+        if not data["total"]:
+            return Response({"error": "Batch not found"}, status=status.HTTP_404_NOT_FOUND)
+        return Response(data, status=status.HTTP_200_OK)
+
+
+class RemoteCommandStatusView(APIView):
+    """GET: Statut d'une commande à distance"""
+
+    def get(self, request, command_id):
+        command = get_object_or_404(RemoteCommand, pk=command_id)
+        return Response(remote_command_data(command), status=status.HTTP_200_OK)
+
+
+async def lock_event_stream(request):
+    """
+    GET: Flux Server-Sent Events des changements des serrures, à la place
+    du polling de /locks/ : événements "status", "battery" et "access"
+    (voir locks.events), et "resync" quand le client a pris trop de retard
+    et doit recharger la liste complète.
+
+    - locks: comma-separated lock ids to follow (all by default)
+
+    Served by the ASGI application only (backend/asgi.py, separate
+    process): each open stream only waits on its queue, it holds no
+    thread. Under WSGI the stream would hold a worker forever, so it is
+    refused there.
+    """
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse({"error": "Event stream served by the ASGI application"}, status=404)
+
+    user = await request.auser()
+    if not user.is_staff:
+        return JsonResponse({"error": "Unauthorized"}, status=403)
+
+    lock_ids = None
+    if request.GET.get("locks"):
         try:
-            esp_url = f"http://{lock.remote_address}/open" 
-            # Timeout court (2s) pour ne pas bloquer le serveur si la serrure est éteinte
-            response = requests.get(esp_url, timeout=2) 
-            
-            if response.status_code == 200:
-                return Response({"message": f"Signal sent to {lock.remote_address}"}, status=status.HTTP_200_OK)
-            else:
-                return Response({"error": "Lock refused connection"}, status=status.HTTP_502_BAD_GATEWAY)
-                
-        except requests.exceptions.RequestException as e:
-            return Response({"error": f"Failed to reach lock: {str(e)}"}, status=status.HTTP_504_GATEWAY_TIMEOUT)
+            lock_ids = {int(lock_id) for lock_id in request.GET["locks"].split(",")}
+        except ValueError:
+            return JsonResponse({"error": "Invalid locks, expected comma-separated ids"}, status=400)
+
+    broker = get_lock_event_broker()
+    queue = await broker.subscribe()
+
+    async def stream():
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=settings.LOCK_EVENT_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+
+                if event is None:
+                    return
+                if lock_ids is not None and event["type"] != "resync" and event.get("lock") not in lock_ids:
+                    continue
+                yield f"event: {event['type']}\ndata: {json.dumps(event, cls=DjangoJSONEncoder)}\n\n"
+        finally:
+            broker.unsubscribe(queue)
+
+    response = StreamingHttpResponse(stream(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
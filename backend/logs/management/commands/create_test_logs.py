@@ -1,8 +1,9 @@
 from django.core.management.base import BaseCommand
 from django.contrib.auth import get_user_model
-from logs.models import AccessLog
+from django.utils import timezone
+from logs.utils import write_access_logs
 from locks.models import Lock
-from datetime import datetime, timedelta
+from datetime import timedelta
 import random
 
 User = get_user_model()
@@ -55,6 +56,7 @@ class Command(BaseCommand):
         methods = ['badge', 'keypad']
         results = ['success', 'failed']
 
+        entries = []
         for i in range(count):
             lock = random.choice(locks)
             method = random.choice(methods)
@@ -64,17 +66,18 @@ class Command(BaseCommand):
             if random.random() < 0.8:
                 result = 'success'
 
-            log = AccessLog.objects.create(
-                method=method,
-                user=user if result == 'success' else None,
-                failed_code='123456' if result == 'failed' and method == 'keypad' else None,
-                lock_id=str(lock.id_lock),
-                lock_name=lock.name,
-                result=result,
-            )
+            entries.append({
+                "method": method,
+                "user_id": user.pk if result == 'success' else None,
+                "failed_code": '123456' if result == 'failed' and method == 'keypad' else None,
+                "lock_id": str(lock.id_lock),
+                "lock_name": lock.name,
+                "result": result,
+                # Dates étalées dans le temps
+                "timestamp": timezone.now() - timedelta(hours=random.randint(0, 72)),
+            })
 
-            # Modifier la date pour avoir des logs étalés dans le temps
-            log.timestamp = datetime.now() - timedelta(hours=random.randint(0, 72))
-            log.save()
+        # Passe par le writer pour tenir les statistiques à jour
+        write_access_logs(entries)
 
         self.stdout.write(self.style.SUCCESS(f'{count} logs créés avec succès!'))
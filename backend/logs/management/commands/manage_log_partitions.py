@@ -0,0 +1,56 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from logs.models import AccessLog
+from locks.models import LockBatteryLog
+from logs.partitioning import ensure_partitions, expired_partitions, archive_partition
+
+# (modèle, colonne de partition, réglage de rétention en mois)
+PARTITIONED_MODELS = [
+    (AccessLog, 'timestamp', 'LOG_RETENTION_MONTHS'),
+    (LockBatteryLog, 'timestamp', 'BATTERY_RAW_RETENTION_MONTHS'),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        'Crée les partitions mensuelles à venir des logs et archive '
+        '(CSV gzip) puis supprime celles qui dépassent la rétention'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--months-ahead',
+            type=int,
+            default=settings.LOG_PARTITION_MONTHS_AHEAD,
+            help='Nombre de mois futurs à partitionner à l\'avance'
+        )
+        parser.add_argument(
+            '--retain-months',
+            type=int,
+            help='Nombre de mois conservés en base (mois courant inclus) pour '
+                 'toutes les tables ; par défaut LOG_RETENTION_MONTHS et '
+                 'BATTERY_RAW_RETENTION_MONTHS'
+        )
+        parser.add_argument(
+            '--archive-dir',
+            default=settings.LOG_ARCHIVE_DIR,
+            help='Dossier des archives des partitions supprimées'
+        )
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+
+        for model, column, retention_setting in PARTITIONED_MODELS:
+            table = model._meta.db_table
+            retain_months = options['retain_months'] or getattr(settings, retention_setting)
+
+            for name in ensure_partitions(table, column, now, options['months_ahead']):
+                self.stdout.write(self.style.SUCCESS(f'Partition créée : {name}'))
+
+            if not retain_months:
+                continue
+
+            for name, _ in expired_partitions(table, now, retain_months):
+                path = archive_partition(table, name, options['archive_dir'])
+                self.stdout.write(self.style.SUCCESS(f'Partition archivée : {name} -> {path}'))
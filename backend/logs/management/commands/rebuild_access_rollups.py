@@ -0,0 +1,31 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from logs.utils import oldest_access_log, rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = 'Recalcule les statistiques horaires des logs d\'accès depuis les logs bruts'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--hours',
+            type=int,
+            help='Ne recalculer que les N dernières heures (par défaut, tout ce '
+                 'qui reste dans les logs bruts)'
+        )
+
+    def handle(self, *args, **options):
+        since = None
+        if options['hours']:
+            since = timezone.now() - timedelta(hours=options['hours'])
+
+        oldest = oldest_access_log()
+        if since is not None and oldest is not None and since < oldest:
+            # Partitions archivées : leurs statistiques sont conservées telles quelles
+            self.stdout.write(self.style.WARNING(
+                f'Plus de logs bruts avant {oldest:%Y-%m-%d %H:%M} : '
+                f'les statistiques antérieures ne sont pas recalculées'))
+
+        count = rebuild_rollups(since)
+        self.stdout.write(self.style.SUCCESS(f'{count} lignes de statistiques recalculées'))
@@ -0,0 +1,38 @@
+# Generated by Django 6.0 on 2026-10-17 18:45
+
+from django.conf import settings
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Index créés sans bloquer les écritures sur une table déjà volumineuse
+    atomic = False
+
+    dependencies = [
+        ('logs', '0002_alter_accesslog_timestamp'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='accesslog',
+            index=models.Index(fields=['-timestamp', '-id'], name='logs_access_timesta_e531b3_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='accesslog',
+            index=models.Index(fields=['lock_id', '-timestamp', '-id'], name='logs_access_lock_id_98b97a_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='accesslog',
+            index=models.Index(fields=['user', '-timestamp', '-id'], name='logs_access_user_id_adb64b_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='accesslog',
+            index=models.Index(fields=['failed_code', '-timestamp', '-id'], name='logs_access_failed__d85fa9_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='accesslog',
+            index=models.Index(fields=['result', '-timestamp', '-id'], name='logs_access_result_7ca2f6_idx'),
+        ),
+    ]
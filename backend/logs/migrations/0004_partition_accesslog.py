@@ -0,0 +1,14 @@
+from django.db import migrations
+from logs.partitioning import partition_by_month
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logs', '0003_accesslog_logs_access_timesta_e531b3_idx_and_more'),
+    ]
+
+    operations = [
+        # Pas de retour arrière : les partitions archivées ne reviendraient pas
+        migrations.RunSQL(partition_by_month('logs_accesslog', 'timestamp')),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 6.0 on 2026-10-17 18:52
+
+from django.db import migrations, models
+
+
+POPULATE_SQL = """
+    INSERT INTO logs_accesslogrollup (lock_id, bucket, method, result, count)
+    SELECT lock_id, date_trunc('hour', timestamp AT TIME ZONE 'UTC') AT TIME ZONE 'UTC',
+           method, result, count(*)
+    FROM logs_accesslog
+    GROUP BY 1, 2, 3, 4
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logs', '0004_partition_accesslog'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccessLogRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('lock_id', models.CharField(max_length=64)),
+                ('bucket', models.DateTimeField()),
+                ('method', models.CharField(choices=[('keypad', 'Keypad'), ('badge', 'Badge')], max_length=10)),
+                ('result', models.CharField(max_length=16)),
+                ('count', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['bucket'], name='logs_access_bucket_d3eb06_idx')],
+                'constraints': [models.UniqueConstraint(fields=('lock_id', 'bucket', 'method', 'result'), name='unique_access_log_rollup')],
+            },
+        ),
+        migrations.RunSQL(POPULATE_SQL, migrations.RunSQL.noop),
+    ]
@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.auth import get_user_model
+from django.utils import timezone
 
 class AccessLog(models.Model):
     METHOD_CHOICES = [
@@ -12,4 +13,45 @@ class AccessLog(models.Model):
     failed_code = models.CharField(max_length=128, blank=True, null=True)  # code saisi ou badge si échec
     lock_id = models.CharField(max_length=64) #id lock
     lock_name = models.CharField(max_length=256, blank=True) #nom lock
-    timestamp = models.DateTimeField(auto_now_add=True) #date en temps réel
\ No newline at end of file
+    timestamp = models.DateTimeField(default=timezone.now) #date de la tentative (pas de l'écriture, voir logs.utils)
+
+    class Meta:
+        # Table partitionnée par mois sur timestamp (migration 0004, voir
+        # logs.partitioning) : clé primaire (id, timestamp), et les index se
+        # créent avec AddIndex, pas AddIndexConcurrently.
+        # Toutes les listes sont triées par (timestamp, id) décroissants,
+        # voir la pagination par curseur de logs.views
+        indexes = [
+            models.Index(fields=['-timestamp', '-id']),
+            models.Index(fields=['lock_id', '-timestamp', '-id']),
+            models.Index(fields=['user', '-timestamp', '-id']),
+            models.Index(fields=['failed_code', '-timestamp', '-id']),
+            models.Index(fields=['result', '-timestamp', '-id']),
+        ]
+
+
+class AccessLogRollup(models.Model):
+    """
+    Nombre de tentatives par serrure, heure, méthode et résultat.
+    Tenu à jour par logs.utils.write_access_logs, reconstruit par la
+    commande rebuild_access_rollups ; lu par /logs/stats/.
+    """
+    lock_id = models.CharField(max_length=64)
+    bucket = models.DateTimeField() #début de l'heure (UTC)
+    method = models.CharField(max_length=10, choices=AccessLog.METHOD_CHOICES)
+    result = models.CharField(max_length=16)
+    count = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['lock_id', 'bucket', 'method', 'result'],
+                name='unique_access_log_rollup'
+            )
+        ]
+        indexes = [
+            models.Index(fields=['bucket']),
+        ]
+
+    def __str__(self):
+        return f"{self.bucket} - {self.lock_id} {self.method} {self.result} : {self.count}"
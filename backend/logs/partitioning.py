@@ -0,0 +1,200 @@
+"""
+Monthly range partitioning of the append-only log tables (AccessLog and
+LockBatteryLog) on PostgreSQL.
+
+The tables are converted by migrations (logs 0004, locks 0005, both with
+partition_by_month): each one is PARTITION BY RANGE on its timestamp, with
+one partition per month named <table>_pYYYYMM and a <table>_default
+partition catching rows outside them.
+The manage_log_partitions command uses these helpers to create partitions
+ahead of time and to archive then drop the ones past the retention period;
+this is the only retention mechanism of the raw rows of both tables.
+"""
+import gzip
+import os
+import re
+from datetime import datetime, timezone as dt_timezone
+from pathlib import Path
+from django.db import connection, transaction
+
+
+def month_start(value):
+    """First instant (UTC) of the month containing `value`."""
+    value = value.astimezone(dt_timezone.utc)
+    return datetime(value.year, value.month, 1, tzinfo=dt_timezone.utc)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return datetime(index // 12, index % 12 + 1, 1, tzinfo=dt_timezone.utc)
+
+
+def partition_name(table, month):
+    return f"{table}_p{month:%Y%m}"
+
+
+def partition_by_month(table, column, months_ahead=3):
+    """
+    SQL converting `table` into a table partitioned by month on `column`,
+    keeping its rows, indexes, foreign keys and id sequence (for RunSQL).
+
+    PostgreSQL requires the partition key in the primary key, which becomes
+    (id, column); identity columns are not supported on partitioned tables
+    before PostgreSQL 17, so id gets a plain sequence default instead.
+    """
+    return f"""
+DO $$
+DECLARE
+    index_defs text[];
+    fk_defs text[];
+    legacy_max_id bigint;
+    month timestamp;
+    last_month timestamp;
+    stmt text;
+BEGIN
+    SELECT coalesce(array_agg(pg_get_indexdef(indexrelid)), '{{}}') INTO index_defs
+    FROM pg_index WHERE indrelid = '{table}'::regclass AND NOT indisprimary;
+
+    SELECT coalesce(array_agg(format('ALTER TABLE {table} ADD CONSTRAINT %I %s',
+                                     conname, pg_get_constraintdef(oid))), '{{}}') INTO fk_defs
+    FROM pg_constraint WHERE conrelid = '{table}'::regclass AND contype = 'f';
+
+    ALTER TABLE {table} RENAME TO {table}_legacy;
+
+    CREATE TABLE {table} (LIKE {table}_legacy INCLUDING DEFAULTS INCLUDING CONSTRAINTS)
+        PARTITION BY RANGE ("{column}");
+    CREATE TABLE {table}_default PARTITION OF {table} DEFAULT;
+
+    -- Une partition par mois (UTC) depuis la plus ancienne ligne
+    SELECT date_trunc('month', coalesce(min("{column}"), now()) AT TIME ZONE 'UTC'),
+           date_trunc('month', now() AT TIME ZONE 'UTC') + interval '{months_ahead} months',
+           max(id)
+    INTO month, last_month, legacy_max_id
+    FROM {table}_legacy;
+
+    WHILE month <= last_month LOOP
+        EXECUTE format('CREATE TABLE %I PARTITION OF {table} FOR VALUES FROM (%L) TO (%L)',
+                       '{table}_p' || to_char(month, 'YYYYMM'),
+                       month AT TIME ZONE 'UTC',
+                       (month + interval '1 month') AT TIME ZONE 'UTC');
+        month := month + interval '1 month';
+    END LOOP;
+
+    INSERT INTO {table} SELECT * FROM {table}_legacy;
+    DROP TABLE {table}_legacy;
+    ALTER TABLE {table} ADD PRIMARY KEY (id, "{column}");
+
+    CREATE SEQUENCE {table}_id_seq OWNED BY {table}.id;
+    ALTER TABLE {table} ALTER COLUMN id SET DEFAULT nextval('{table}_id_seq');
+    PERFORM setval('{table}_id_seq', coalesce(legacy_max_id, 0) + 1, false);
+
+    FOREACH stmt IN ARRAY index_defs || fk_defs LOOP
+        EXECUTE stmt;
+    END LOOP;
+END $$;
+"""
+
+
+def list_partitions(table):
+    """Monthly partitions of `table`, as a sorted list of (name, month)."""
+    pattern = re.compile(rf"^{re.escape(table)}_p(\d{{4}})(\d{{2}})$")
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT child.relname
+            FROM pg_inherits
+            JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+            JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            WHERE parent.relname = %s
+            """,
+            [table],
+        )
+        names = [row[0] for row in cursor.fetchall()]
+
+    partitions = []
+    for name in names:
+        match = pattern.match(name)
+        if match:
+            month = datetime(int(match.group(1)), int(match.group(2)), 1, tzinfo=dt_timezone.utc)
+            partitions.append((name, month))
+    return sorted(partitions, key=lambda partition: partition[1])
+
+
+def create_month_partition(table, column, month):
+    """
+    Create the partition of `table` for `month`. Rows of that month that
+    already landed in the default partition are moved into it, otherwise
+    PostgreSQL would refuse to attach it.
+    """
+    qn = connection.ops.quote_name
+    name = partition_name(table, month)
+    upper = add_months(month, 1)
+
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE TABLE {qn(name)} (LIKE {qn(table)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+            cursor.execute(
+                f"""
+                WITH moved AS (
+                    DELETE FROM {qn(table + '_default')}
+                    WHERE {qn(column)} >= %s AND {qn(column)} < %s
+                    RETURNING *
+                )
+                INSERT INTO {qn(name)} SELECT * FROM moved
+                """,
+                [month, upper],
+            )
+            cursor.execute(
+                f"ALTER TABLE {qn(table)} ATTACH PARTITION {qn(name)} FOR VALUES FROM (%s) TO (%s)",
+                [month, upper],
+            )
+    return name
+
+
+def ensure_partitions(table, column, now, months_ahead):
+    """Create the missing partitions from the current month to `months_ahead`."""
+    existing = {month for _, month in list_partitions(table)}
+    current = month_start(now)
+
+    created = []
+    for offset in range(months_ahead + 1):
+        month = add_months(current, offset)
+        if month not in existing:
+            created.append(create_month_partition(table, column, month))
+    return created
+
+
+def archive_partition(table, name, archive_dir):
+    """
+    Detach partition `name` from `table`, dump it to <archive_dir>/<name>.csv.gz
+    and drop it. Everything happens in one transaction: if the dump fails,
+    the partition stays attached.
+    """
+    qn = connection.ops.quote_name
+    archive_dir = Path(archive_dir)
+    archive_dir.mkdir(parents=True, exist_ok=True)
+    path = archive_dir / f"{name}.csv.gz"
+    tmp_path = archive_dir / f"{name}.csv.gz.tmp"
+
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            # Les FK de Django sont DEFERRABLE : vérifier maintenant celles des
+            # lignes écrites plus tôt dans la transaction, sinon DROP refuse.
+            cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+            cursor.execute(f"ALTER TABLE {qn(table)} DETACH PARTITION {qn(name)}")
+            with gzip.open(tmp_path, "wb") as archive:
+                cursor.copy_expert(f"COPY {qn(name)} TO STDOUT WITH CSV HEADER", archive)
+            os.replace(tmp_path, path)
+            cursor.execute(f"DROP TABLE {qn(name)}")
+    return path
+
+
+def expired_partitions(table, now, retain_months):
+    """Partitions entirely older than the last `retain_months` months."""
+    cutoff = add_months(month_start(now), -(retain_months - 1))
+    return [
+        (name, month) for name, month in list_partitions(table)
+        if add_months(month, 1) <= cutoff
+    ]
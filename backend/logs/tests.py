@@ -1,3 +1,338 @@
-from django.test import TestCase
+import csv
+import gzip
+import json
+import os
+import tempfile
+from datetime import datetime, timedelta, timezone as dt_timezone
+from pathlib import Path
+from django.contrib.auth import get_user_model
+from unittest.mock import patch
+from django.db import OperationalError, connection
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .models import AccessLog, AccessLogRollup
+from .partitioning import list_partitions, ensure_partitions, expired_partitions, archive_partition
+from .utils import AccessLogWriter, create_access_log, write_access_logs, rebuild_rollups
 
-# Create your tests here.
+User = get_user_model()
+
+
+class AccessLogWriterTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='writer_user')
+        self.spill_dir = Path(tempfile.mkdtemp())
+        self.writer = AccessLogWriter(
+            flush_size=10, flush_interval=60, spill_dir=self.spill_dir, background=False)
+
+    def _entry(self, **kwargs):
+        entry = {
+            "method": "badge",
+            "user_id": self.user.pk,
+            "failed_code": "",
+            "lock_id": "1",
+            "lock_name": "Door",
+            "result": "success",
+            "timestamp": timezone.now(),
+        }
+        entry.update(kwargs)
+        return entry
+
+    def test_flush_writes_batch_and_clears_spill(self):
+        first = self._entry()
+        self.writer.submit(first)
+        self.writer.submit(self._entry(result="failed", user_id=None))
+
+        spill = list(self.spill_dir.glob("*.jsonl"))
+        self.assertEqual(len(spill), 1)
+        self.assertEqual(len(spill[0].read_text().splitlines()), 2)
+
+        self.assertEqual(self.writer.flush(), 2)
+        self.assertEqual(AccessLog.objects.count(), 2)
+        # L'heure de la tentative est conservée, pas celle de l'écriture
+        self.assertTrue(AccessLog.objects.filter(timestamp=first["timestamp"]).exists())
+        self.assertEqual(spill[0].read_text(), "")
+        self.assertEqual(list(self.spill_dir.glob("*.inflight")), [])
+
+    def test_recovers_spill_file_of_dead_process(self):
+        orphan = self.spill_dir / "accesslog-999999999.jsonl"
+        entry = self._entry()
+        orphan.write_text(json.dumps(
+            {**entry, "timestamp": entry["timestamp"].isoformat()}) + "\n")
+
+        self.writer.submit(self._entry(lock_id="2"))
+        self.assertFalse(orphan.exists())
+        self.assertEqual(self.writer.flush(), 2)
+        self.assertEqual(
+            sorted(AccessLog.objects.values_list("lock_id", flat=True)), ["1", "2"])
+
+    def _dead_letters(self):
+        path = self.spill_dir / AccessLogWriter.DEAD_LETTER
+        return path.read_text().splitlines() if path.exists() else []
+
+    def test_rejected_batch_is_retried_row_by_row(self):
+        deleted = User.objects.create_user(username='deleted_user')
+        self.writer.submit(self._entry(user_id=deleted.pk))
+        self.writer.submit(self._entry(lock_id="2"))
+        self.writer.submit(self._entry(lock_id="3", method="x" * 20))
+        deleted.delete()
+
+        # La FK est différée : on la vérifie à l'insertion, comme au commit hors test
+        with connection.cursor() as cursor:
+            cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+        self.assertEqual(self.writer.flush(), 2)
+
+        self.assertEqual(
+            sorted(AccessLog.objects.values_list("lock_id", "user_id")),
+            [("1", None), ("2", self.user.pk)])
+        dead = self._dead_letters()
+        self.assertEqual(len(dead), 1)
+        self.assertEqual(json.loads(dead[0])["lock_id"], "3")
+        # Rien ne reste en file : le flush suivant n'est pas bloqué
+        self.writer.submit(self._entry(lock_id="4"))
+        self.assertEqual(self.writer.flush(), 1)
+
+    def test_failing_flush_is_retried_a_bounded_number_of_times(self):
+        writer = AccessLogWriter(
+            flush_size=10, flush_interval=60, spill_dir=self.spill_dir, background=False,
+            max_pending=2, max_retries=2)
+        for lock_id in "123":
+            writer.submit(self._entry(lock_id=lock_id))
+
+        with patch("logs.utils.write_access_logs", side_effect=OperationalError("down")):
+            self.assertEqual(writer.flush(), 0)
+            # File bornée à 2 entrées : la plus ancienne part en dead-letter
+            self.assertEqual([json.loads(line)["lock_id"] for line in self._dead_letters()], ["1"])
+            spill = self.spill_dir / f"accesslog-{os.getpid()}.jsonl"
+            self.assertEqual(len(spill.read_text().splitlines()), 2)
+
+            self.assertEqual(writer.flush(), 0)
+        self.assertEqual(
+            [json.loads(line)["lock_id"] for line in self._dead_letters()], ["1", "2", "3"])
+        self.assertEqual(spill.read_text(), "")
+        self.assertEqual(writer.flush(), 0)
+
+    @override_settings(ACCESS_LOG_ASYNC=True)
+    def test_create_access_log_in_transaction_is_synchronous(self):
+        create_access_log(
+            method="keypad",
+            user=None,
+            failed_code="123456",
+            lock_id="3",
+            lock_name="Back door",
+            result="failed",
+        )
+        self.assertTrue(AccessLog.objects.filter(lock_id="3").exists())
+
+
+class AccessLogListViewTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='log_user')
+        base = timezone.now()
+        self.logs = AccessLog.objects.bulk_create([
+            AccessLog(
+                method='badge' if i % 2 else 'keypad',
+                user=self.user if i % 3 else None,
+                failed_code='' if i % 3 else '999999',
+                lock_id='1' if i < 5 else '2',
+                lock_name='Door',
+                result='success' if i % 3 else 'failed',
+                # Deux logs par seconde pour tester le départage par id
+                timestamp=base - timedelta(seconds=i // 2),
+            )
+            for i in range(10)
+        ])
+
+    def test_cursor_pagination_walks_every_log_once(self):
+        seen = []
+        response = self.client.get('/logs/accesslogs/', {'limit': 3})
+        while True:
+            self.assertEqual(response.status_code, 200)
+            seen.extend(log['id'] for log in response.json())
+            cursor = response.headers.get('X-Next-Cursor')
+            if not cursor:
+                break
+            response = self.client.get('/logs/accesslogs/', {'limit': 3, 'cursor': cursor})
+
+        expected = [log.id for log in sorted(
+            self.logs, key=lambda log: (log.timestamp, log.id), reverse=True)]
+        self.assertEqual(seen, expected)
+
+    def test_filters(self):
+        response = self.client.get('/logs/accesslogs/', {
+            'lock_id': '1', 'result': 'success', 'method': 'badge'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 1)
+        self.assertIn('X-Total-Count-Estimate', response.headers)
+
+        since = (self.logs[3].timestamp).isoformat()
+        response = self.client.get('/logs/accesslogs/', {'from': since})
+        self.assertEqual(len(response.json()), 4)
+
+    def test_invalid_parameters(self):
+        self.assertEqual(
+            self.client.get('/logs/accesslogs/', {'cursor': 'nope'}).status_code, 400)
+        self.assertEqual(
+            self.client.get('/logs/accesslogs/', {'from': 'yesterday'}).status_code, 400)
+
+    def _export(self, params):
+        admin = User.objects.create_user(username='auditor', is_staff=True)
+        self.client.force_login(admin)
+        response = self.client.get('/logs/accesslogs/export/', params)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_export_requires_staff(self):
+        self.assertEqual(self.client.get('/logs/accesslogs/export/').status_code, 403)
+
+    def test_export_gzipped_csv(self):
+        response = self._export({'lock_id': '2'})
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        rows = list(csv.reader(
+            gzip.decompress(b''.join(response.streaming_content)).decode().splitlines()))
+
+        self.assertEqual(rows[0][:2], ['id', 'timestamp'])
+        expected = sorted(
+            (log for log in self.logs if log.lock_id == '2'),
+            key=lambda log: (log.timestamp, log.id))
+        self.assertEqual([int(row[0]) for row in rows[1:]], [log.id for log in expected])
+
+    def test_export_ndjson(self):
+        response = self._export({'type': 'ndjson', 'gzip': 'false', 'result': 'failed'})
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        entries = [json.loads(line) for line in lines]
+        self.assertEqual(len(entries), 4)
+        self.assertTrue(all(entry['result'] == 'failed' and entry['user'] is None for entry in entries))
+
+
+class AccessLogStatsTests(TestCase):
+    def setUp(self):
+        # Un lundi, 10h UTC
+        self.monday = datetime(2026, 3, 2, 10, 0, tzinfo=dt_timezone.utc)
+        entry = {"user_id": None, "failed_code": "", "lock_name": "Door"}
+        write_access_logs([
+            {**entry, "lock_id": "1", "method": "badge", "result": "success",
+             "timestamp": self.monday + timedelta(minutes=5)},
+            {**entry, "lock_id": "1", "method": "badge", "result": "success",
+             "timestamp": self.monday + timedelta(minutes=50)},
+            {**entry, "lock_id": "1", "method": "keypad", "result": "failed",
+             "timestamp": self.monday + timedelta(hours=1)},
+        ])
+        write_access_logs([
+            {**entry, "lock_id": "2", "method": "badge", "result": "success",
+             "timestamp": self.monday + timedelta(days=1, minutes=1)},
+            {**entry, "lock_id": "1", "method": "badge", "result": "success",
+             "timestamp": self.monday + timedelta(minutes=30)},
+        ])
+        admin = User.objects.create_user(username='stats_admin', is_staff=True)
+        self.client.force_login(admin)
+
+    def _rollups(self):
+        return set(AccessLogRollup.objects.values_list("lock_id", "bucket", "method", "result", "count"))
+
+    def test_writer_increments_rollups(self):
+        self.assertIn(("1", self.monday, "badge", "success", 3), self._rollups())
+        self.assertEqual(AccessLogRollup.objects.count(), 3)
+
+    def test_rebuild_matches_incremental_rollups(self):
+        expected = self._rollups()
+        AccessLogRollup.objects.update(count=0)
+        self.assertEqual(rebuild_rollups(), 3)
+        self.assertEqual(self._rollups(), expected)
+
+    def test_rebuild_keeps_rollups_of_archived_logs(self):
+        expected = self._rollups()
+        # Comme après l'archivage d'une partition : les statistiques restent
+        AccessLog.objects.filter(timestamp__lt=self.monday + timedelta(hours=1)).delete()
+        self.assertEqual(rebuild_rollups(), 2)
+        self.assertEqual(rebuild_rollups(since=self.monday - timedelta(days=30)), 2)
+        self.assertEqual(self._rollups(), expected)
+
+        AccessLog.objects.all().delete()
+        self.assertEqual(rebuild_rollups(), 0)
+        self.assertEqual(self._rollups(), expected)
+
+    def test_trend(self):
+        response = self.client.get('/logs/stats/', {
+            'from': self.monday.isoformat(),
+            'to': (self.monday + timedelta(days=2)).isoformat(),
+            'interval': 'day',
+        })
+        self.assertEqual(response.status_code, 200)
+        series = response.json()['series']
+        self.assertEqual(
+            [(point['success'], point['failed']) for point in series], [(3, 1), (1, 0)])
+
+        response = self.client.get('/logs/stats/', {
+            'from': self.monday.isoformat(), 'lock_id': '1'})
+        self.assertEqual([point['total'] for point in response.json()['series']], [3, 1])
+
+    def test_heatmap(self):
+        response = self.client.get('/logs/stats/', {
+            'view': 'heatmap', 'from': self.monday.isoformat(), 'result': 'success'})
+        self.assertEqual(response.status_code, 200)
+        heatmap = response.json()['heatmap']
+        self.assertEqual(heatmap[0][10], 3)
+        self.assertEqual(heatmap[1][10], 1)
+        self.assertEqual(response.json()['total'], 4)
+
+    def test_mid_hour_from_counts_first_bucket(self):
+        # Le créneau de 10h contient les accès de 10h30 et 10h50, dans la fenêtre
+        response = self.client.get('/logs/stats/', {
+            'from': (self.monday + timedelta(minutes=20)).isoformat(),
+            'to': (self.monday + timedelta(hours=1, minutes=30)).isoformat(),
+        })
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(parse_datetime(data['from']), self.monday)
+        self.assertEqual(parse_datetime(data['to']), self.monday + timedelta(hours=1))
+        self.assertEqual([point['total'] for point in data['series']], [3, 1])
+
+    def test_invalid_parameters(self):
+        self.assertEqual(self.client.get('/logs/stats/', {'interval': 'week'}).status_code, 400)
+        self.assertEqual(self.client.get('/logs/stats/', {'view': 'pie'}).status_code, 400)
+        response = self.client.get('/logs/stats/', {'from': '2026-13-01T00:00:00'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {"error": "Invalid from datetime, expected ISO 8601."})
+
+
+class AccessLogPartitionTests(TestCase):
+    table = AccessLog._meta.db_table
+
+    def _log(self, timestamp, lock_id="1"):
+        return AccessLog.objects.create(
+            method="badge", result="success", lock_id=lock_id, timestamp=timestamp)
+
+    def test_ensure_partitions_moves_rows_out_of_default(self):
+        now = datetime(2031, 4, 15, tzinfo=dt_timezone.utc)
+        log = self._log(datetime(2031, 5, 2, tzinfo=dt_timezone.utc))
+
+        created = ensure_partitions(self.table, "timestamp", now, months_ahead=1)
+
+        self.assertEqual(created, [f"{self.table}_p203104", f"{self.table}_p203105"])
+        self.assertEqual(ensure_partitions(self.table, "timestamp", now, months_ahead=1), [])
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT id FROM {self.table}_p203105")
+            self.assertEqual(cursor.fetchall(), [(log.id,)])
+            cursor.execute(f"SELECT count(*) FROM {self.table}_default")
+            self.assertEqual(cursor.fetchone()[0], 0)
+
+    def test_archive_expired_partition(self):
+        month = datetime(2031, 4, 1, tzinfo=dt_timezone.utc)
+        ensure_partitions(self.table, "timestamp", month, months_ahead=1)
+        self._log(month + timedelta(days=3), lock_id="old")
+        self._log(month + timedelta(days=40), lock_id="kept")
+
+        expired = expired_partitions(self.table, datetime(2031, 5, 20, tzinfo=dt_timezone.utc), 1)
+        self.assertIn((f"{self.table}_p203104", month), expired)
+        self.assertNotIn(f"{self.table}_p203105", [name for name, _ in expired])
+
+        archive_dir = Path(tempfile.mkdtemp())
+        path = archive_partition(self.table, f"{self.table}_p203104", archive_dir)
+
+        self.assertNotIn(month, [m for _, m in list_partitions(self.table)])
+        self.assertEqual(list(AccessLog.objects.values_list("lock_id", flat=True)), ["kept"])
+        with gzip.open(path, "rt") as archive:
+            lines = archive.read().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertIn("old", lines[1])
@@ -1,6 +1,8 @@
 from django.urls import path
-from .views import AccessLogListView
+from .views import AccessLogListView, AccessLogExportView, AccessLogStatsView
 
 urlpatterns = [
     path("accesslogs/", AccessLogListView.as_view(), name="accesslog-list"),
+    path("accesslogs/export/", AccessLogExportView.as_view(), name="accesslog-export"),
+    path("stats/", AccessLogStatsView.as_view(), name="accesslog-stats"),
 ]
@@ -1,10 +1,424 @@
-from .models import AccessLog
+import atexit
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import Counter
+from datetime import timezone as dt_timezone
+from pathlib import Path
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import DataError, IntegrityError, connection, close_old_connections, transaction
+from django.db.models import Min
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from locks.events import publish_lock_events
+from .models import AccessLog, AccessLogRollup
+
+logger = logging.getLogger(__name__)
+
+
+class AccessLogWriter:
+    """
+    Buffered AccessLog pipeline.
+
+    Entries are queued in memory and written with bulk_create by a
+    background thread, every `flush_size` entries or `flush_interval`
+    seconds. Each entry is first appended to a per-process spill file; a
+    writer starting on the same spill directory replays the files left by
+    dead processes, so a crash between the request and the flush does not
+    lose logs (delivery is at-least-once).
+
+    A batch the database rejects (e.g. its user was deleted meanwhile) is
+    retried row by row, with the user of deleted accounts set to null; the
+    rows still rejected go to the dead-letter file (DEAD_LETTER, same JSON
+    lines as the spill files) instead of blocking the queue. A batch failing
+    for another reason (database unreachable...) is kept for the next flush,
+    at most `max_retries` consecutive times, and at most `max_pending`
+    entries are kept: beyond that, the oldest go to the dead-letter file.
+    """
+
+    SPILL_PATTERN = re.compile(r"^accesslog-(\d+)\.(jsonl|inflight|recovering-[\d-]+)$")
+    DEAD_LETTER = "accesslog-deadletter.jsonl"
+
+    def __init__(self, flush_size, flush_interval, spill_dir, background=True,
+                 max_pending=100000, max_retries=100):
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.spill_dir = Path(spill_dir)
+        self.max_pending = max_pending
+        self.max_retries = max_retries
+        # Sans thread, c'est à l'appelant d'appeler flush()
+        self.background = background
+
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._pending = []
+        self._thread = None
+        self._spill = None
+        self._pid = None
+        self._failures = 0
+
+    # --- API ---
+
+    def submit(self, entry):
+        with self._lock:
+            self._ensure_started()
+            self._spill.write(self._dump(entry))
+            self._spill.flush()
+            self._pending.append(entry)
+            full = len(self._pending) >= self.flush_size
+
+        if full:
+            self._wakeup.set()
+
+    def flush(self):
+        """Write every pending entry. Returns the number of rows written."""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, []
+                inflight = self._rotate_spill()
+
+            if not batch:
+                return 0
+
+            try:
+                written = self._write(batch)
+            except Exception:
+                self._failures += 1
+                if self._failures < self.max_retries:
+                    logger.exception("Access log flush failed, %d entries kept", len(batch))
+                    self._requeue(batch, inflight)
+                    return 0
+                logger.exception(
+                    "Access log flush failed %d times, %d entries dead-lettered",
+                    self._failures, len(batch))
+                self._dead_letter(batch)
+                written = 0
+
+            self._failures = 0
+            if inflight is not None:
+                inflight.unlink(missing_ok=True)
+            return written
+
+    # --- Internals ---
+
+    def _ensure_started(self):
+        # Appelé sous self._lock. Relancé après un fork (pid différent).
+        if self._pid == os.getpid():
+            return
+
+        self._pid = os.getpid()
+        self.spill_dir.mkdir(parents=True, exist_ok=True)
+        self._pending, claimed = self._recover()
+
+        self._spill = open(self._spill_path(), "a", encoding="utf-8")
+        for entry in self._pending:
+            self._spill.write(self._dump(entry))
+        self._spill.flush()
+        for path in claimed:
+            path.unlink()
+
+        if self._pending:
+            logger.info("Recovered %d access log entries", len(self._pending))
+            self._wakeup.set()
+
+        if self.background:
+            self._thread = threading.Thread(
+                target=self._run, name="accesslog-writer", daemon=True)
+            self._thread.start()
+            atexit.register(self.flush)
+
+    def _spill_path(self, suffix="jsonl"):
+        return self.spill_dir / f"accesslog-{self._pid}.{suffix}"
+
+    def _rotate_spill(self):
+        """Move the current spill file aside while its entries are written."""
+        path = self._spill_path()
+        if self._spill is None or not path.exists() or path.stat().st_size == 0:
+            return None
+
+        self._spill.close()
+        inflight = self._spill_path("inflight")
+        os.replace(path, inflight)
+        self._spill = open(path, "a", encoding="utf-8")
+        return inflight
+
+    def _write(self, batch):
+        """
+        Write `batch`, row by row if the database rejects it as a whole.
+        Returns the number of rows written.
+        """
+        try:
+            write_access_logs(batch)
+            return len(batch)
+        except (IntegrityError, DataError):
+            logger.warning("Access log batch of %d entries rejected, retrying row by row", len(batch))
+
+        written, rejected = 0, []
+        for entry in _without_deleted_users(batch):
+            try:
+                write_access_logs([entry])
+                written += 1
+            except (IntegrityError, DataError) as e:
+                logger.error("Access log entry rejected (%s): %r", e, entry)
+                rejected.append(entry)
+
+        self._dead_letter(rejected)
+        return written
+
+    def _requeue(self, batch, inflight):
+        """
+        Put a failed batch back in front of the queue, keeping at most
+        max_pending entries, and rewrite the spill file to match the queue.
+        """
+        with self._lock:
+            pending = batch + self._pending
+            overflow = max(len(pending) - self.max_pending, 0)
+            dropped, self._pending = pending[:overflow], pending[overflow:]
+
+            # Le fichier de débordement contient exactement la file en mémoire
+            self._spill.close()
+            path = self._spill_path()
+            rewritten = self._spill_path("rewrite")
+            with open(rewritten, "w", encoding="utf-8") as spill:
+                spill.writelines(self._dump(entry) for entry in self._pending)
+            os.replace(rewritten, path)
+            self._spill = open(path, "a", encoding="utf-8")
+            if inflight is not None:
+                inflight.unlink(missing_ok=True)
+
+        if dropped:
+            logger.error("Access log queue full, %d oldest entries dead-lettered", len(dropped))
+            self._dead_letter(dropped)
+
+    def _dead_letter(self, entries):
+        """Append `entries` to the dead-letter file, never replayed automatically."""
+        if not entries:
+            return
+        with open(self.spill_dir / self.DEAD_LETTER, "a", encoding="utf-8") as dead_letter:
+            dead_letter.writelines(self._dump(entry) for entry in entries)
+
+    def _recover(self):
+        """
+        Adopt the spill files of processes that are no longer running
+        (including a previous process that had our pid). Returns the
+        recovered entries and the claimed files, to delete once the entries
+        are in our own spill file.
+        """
+        entries, claimed = [], []
+
+        for path in sorted(self.spill_dir.iterdir()):
+            match = self.SPILL_PATTERN.match(path.name)
+            if not match:
+                continue
+
+            pid = int(match.group(1))
+            if pid != self._pid and self._is_alive(pid):
+                continue
+
+            # Le rename fait office de verrou entre process concurrents
+            target = self._spill_path(f"recovering-{time.time_ns()}-{len(claimed)}")
+            try:
+                os.replace(path, target)
+            except FileNotFoundError:
+                continue
+            claimed.append(target)
+
+            for line in target.read_text(encoding="utf-8").splitlines():
+                if not line.strip():
+                    continue
+                try:
+                    entries.append(self._load(line))
+                except (ValueError, KeyError):
+                    logger.warning("Skipping corrupt access log spill line: %r", line)
+
+        return entries, claimed
+
+    @staticmethod
+    def _is_alive(pid):
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            return True
+        return True
+
+    @staticmethod
+    def _dump(entry):
+        return json.dumps({**entry, "timestamp": entry["timestamp"].isoformat()}) + "\n"
+
+    @staticmethod
+    def _load(line):
+        entry = json.loads(line)
+        entry["timestamp"] = parse_datetime(entry["timestamp"])
+        return entry
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            finally:
+                close_old_connections()
+
+
+def _without_deleted_users(entries):
+    """`entries` with the user of accounts deleted since the attempt set to null."""
+    user_ids = {entry["user_id"] for entry in entries if entry["user_id"] is not None}
+    existing = set(
+        get_user_model().objects.filter(pk__in=user_ids).values_list("pk", flat=True))
+    return [
+        {**entry, "user_id": None}
+        if entry["user_id"] is not None and entry["user_id"] not in existing else entry
+        for entry in entries
+    ]
+
+
+def write_access_logs(entries):
+    """
+    Insert a batch of access log entries (dicts of AccessLog fields), add
+    them to the hourly rollups and publish them as "access" lock events,
+    in the same transaction.
+    """
+    with transaction.atomic():
+        AccessLog.objects.bulk_create(
+            [AccessLog(**entry) for entry in entries], batch_size=500)
+        add_to_rollups(entries)
+        publish_lock_events([
+            {
+                "type": "access",
+                "lock": int(entry["lock_id"]) if str(entry["lock_id"]).isdigit() else entry["lock_id"],
+                "lock_name": entry["lock_name"],
+                "method": entry["method"],
+                "result": entry["result"],
+                "user_id": entry["user_id"],
+                "timestamp": entry["timestamp"],
+            }
+            for entry in entries
+        ])
+
+
+def rollup_bucket(timestamp):
+    """Start of the UTC hour containing `timestamp`."""
+    return timestamp.astimezone(dt_timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+def add_to_rollups(entries):
+    """
+    Increment the AccessLogRollup counters of a batch of entries, with one
+    INSERT ... ON CONFLICT per batch (bulk_create cannot increment).
+    """
+    counts = Counter(
+        (str(entry["lock_id"]), rollup_bucket(entry["timestamp"]), entry["method"], entry["result"])
+        for entry in entries
+    )
+    if not counts:
+        return
+
+    table = AccessLogRollup._meta.db_table
+    rows = [(*key, count) for key, count in counts.items()]
+    placeholders = ", ".join(["(%s, %s, %s, %s, %s)"] * len(rows))
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            INSERT INTO {table} (lock_id, bucket, method, result, count)
+            VALUES {placeholders}
+            ON CONFLICT (lock_id, bucket, method, result)
+            DO UPDATE SET count = {table}.count + EXCLUDED.count
+            """,
+            [value for row in rows for value in row],
+        )
+
+
+def oldest_access_log():
+    """Timestamp of the oldest AccessLog row (None if there is none)."""
+    return AccessLog.objects.aggregate(oldest=Min("timestamp"))["oldest"]
+
+
+def rebuild_rollups(since=None):
+    """
+    Recompute the rollups from the raw AccessLog rows, entirely or from the
+    hour containing `since`. Only the range still present in AccessLog is
+    deleted and recomputed: the rollups of archived partitions (see
+    logs.partitioning) are kept. Returns the number of rollup rows written.
+    """
+    oldest = oldest_access_log()
+    if oldest is None:
+        return 0
+    params = [rollup_bucket(oldest if since is None else max(since, oldest))]
+
+    rollup_table = AccessLogRollup._meta.db_table
+    log_table = AccessLog._meta.db_table
+
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {rollup_table} WHERE bucket >= %s", params)
+            cursor.execute(
+                f"""
+                INSERT INTO {rollup_table} (lock_id, bucket, method, result, count)
+                SELECT lock_id, date_trunc('hour', timestamp AT TIME ZONE 'UTC') AT TIME ZONE 'UTC',
+                       method, result, count(*)
+                FROM {log_table}
+                WHERE timestamp >= %s
+                GROUP BY 1, 2, 3, 4
+                """,
+                params,
+            )
+            return cursor.rowcount
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_access_log_writer():
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = AccessLogWriter(
+                flush_size=settings.ACCESS_LOG_FLUSH_SIZE,
+                flush_interval=settings.ACCESS_LOG_FLUSH_INTERVAL,
+                spill_dir=settings.ACCESS_LOG_SPILL_DIR,
+                max_pending=settings.ACCESS_LOG_MAX_PENDING,
+                max_retries=settings.ACCESS_LOG_MAX_RETRIES,
+            )
+        return _writer
+
+
 def create_access_log(method, user, failed_code, lock_id, lock_name, result):
-    AccessLog.objects.create(
-    method=method,
-    user=user,
-    failed_code=failed_code,
-    lock_id=lock_id,
-    lock_name=lock_name,
-    result=result,
-    )
\ No newline at end of file
+    """
+    Record an access attempt. With ACCESS_LOG_ASYNC the row is queued and
+    written in the background; inside a transaction it is written right
+    away so it commits (or rolls back) with the surrounding changes.
+    """
+    entry = {
+        "method": method,
+        "user_id": user.pk if user else None,
+        "failed_code": failed_code,
+        "lock_id": lock_id,
+        "lock_name": lock_name,
+        "result": result,
+        "timestamp": timezone.now(),
+    }
+
+    if settings.ACCESS_LOG_ASYNC and not connection.in_atomic_block:
+        get_access_log_writer().submit(entry)
+    else:
+        write_access_logs([entry])
+
+
+def estimate_count(queryset):
+    """
+    Row count of `queryset` as estimated by the PostgreSQL planner
+    (EXPLAIN, no scan): constant cost however large the table is.
+    """
+    plan = json.loads(queryset.order_by().explain(format="json"))
+    return int(plan[0]["Plan"]["Plan Rows"])
@@ -1,41 +1,144 @@
+import base64
+import csv
+import io
+import json
+import zlib
+from django.http import StreamingHttpResponse
 from django.shortcuts import render
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAdminUser, AllowAny
-from django.db.models import Q  
+from datetime import timedelta, timezone as dt_timezone
+from django.db.models import Q, Sum
+from django.db.models.functions import Trunc, ExtractHour, ExtractIsoWeekDay
+from django.utils import timezone
 from django.contrib.auth import get_user_model
-from .models import AccessLog
+from django.utils.dateparse import parse_datetime
+from .models import AccessLog, AccessLogRollup
+from .utils import estimate_count, rollup_bucket
 
 User = get_user_model()
 
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+STATS_DEFAULT_DAYS = 7
+STATS_INTERVALS = ("hour", "day")
+
+EXPORT_CHUNK_SIZE = 2000
+EXPORT_FIELDS = ["id", "timestamp", "method", "user", "failed_code", "lock_id", "lock_name", "result"]
+EXPORT_CONTENT_TYPES = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+}
+
+
+def encode_cursor(log):
+    raw = json.dumps([log.timestamp.isoformat(), log.id])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        timestamp, log_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        timestamp = parse_datetime(timestamp)
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor.")
+    if timestamp is None or not isinstance(log_id, int):
+        raise ValueError("Invalid cursor.")
+    return timestamp, log_id
+
+
+def filter_access_logs(params):
+    """
+    Build the AccessLog queryset matching the query parameters shared by
+    the list and export endpoints. Raises ValueError on invalid input.
+
+    - user_id: logs of a user (successes, and failures logged with their username)
+    - lock_id: logs of a lock
+    - from / to: ISO 8601 datetimes bounding the timestamp (inclusive)
+    - result: 'success' or 'failed'
+    - method: 'badge' or 'keypad'
+    """
+    user_id = params.get("user_id")
+    lock_id = params.get("lock_id")
+
+    logs = AccessLog.objects.all()
+
+    if user_id:
+        try:
+            user_obj = User.objects.get(id=user_id)
+            logs = logs.filter(
+                Q(user__id=user_id) | Q(failed_code=user_obj.username)
+            )
+        except User.DoesNotExist:
+            logs = logs.filter(user__id=user_id)
+        except ValueError:
+            raise ValueError("Invalid user_id format.")
+
+    if lock_id:
+        logs = logs.filter(lock_id=lock_id)
+
+    for param, lookup in (("from", "timestamp__gte"), ("to", "timestamp__lte")):
+        value = params.get(param)
+        if value:
+            parsed = parse_datetime(value)
+            if parsed is None:
+                raise ValueError(f"Invalid {param} datetime, expected ISO 8601.")
+            logs = logs.filter(**{lookup: parsed})
+
+    result = params.get("result")
+    if result:
+        logs = logs.filter(result=result)
+
+    method = params.get("method")
+    if method:
+        if method not in dict(AccessLog.METHOD_CHOICES):
+            raise ValueError("Invalid method.")
+        logs = logs.filter(method=method)
+
+    return logs
+
+
 class AccessLogListView(APIView):
-    permission_classes = [AllowAny] 
+    """
+    GET: Logs d'accès, du plus récent au plus ancien.
 
-    def get(self, request):
-        user_id = request.query_params.get("user_id")
-        lock_id = request.query_params.get("lock_id")
+    Paginated by keyset over (timestamp, id): pass the X-Next-Cursor header
+    of a response as `cursor` to get the next page, and `limit` to change
+    the page size. X-Total-Count-Estimate gives the planner's row estimate
+    for the filters, without counting.
+    """
+    permission_classes = [AllowAny]
 
-        logs = AccessLog.objects.all()
+    def get(self, request):
+        try:
+            logs = filter_access_logs(request.query_params)
+            limit = min(int(request.query_params.get("limit", DEFAULT_PAGE_SIZE)), MAX_PAGE_SIZE)
+            if limit < 1:
+                raise ValueError("Invalid limit.")
 
-        if user_id:
-            try:
-                user_obj = User.objects.get(id=user_id)
-                logs = logs.filter(
-                    Q(user__id=user_id) | Q(failed_code=user_obj.username)
+            cursor = request.query_params.get("cursor")
+            if cursor:
+                timestamp, log_id = decode_cursor(cursor)
+                # timestamp__lte borne le parcours de l'index, le OR départage les égalités
+                page = logs.filter(timestamp__lte=timestamp).filter(
+                    Q(timestamp__lt=timestamp) | Q(id__lt=log_id)
                 )
-            except User.DoesNotExist:
-                logs = logs.filter(user__id=user_id)
-            except ValueError:
-                return Response({"error": "Invalid user_id format."}, status=400)
+            else:
+                page = logs
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
 
-        if lock_id:
-            try:
-                logs = logs.filter(lock_id=lock_id)
-            except ValueError:
-                return Response({"error": "Invalid lock_id format."}, status=400)
+        page = list(
+            page.select_related("user").order_by("-timestamp", "-id")[:limit + 1]
+        )
+        has_next = len(page) > limit
+        page = page[:limit]
 
         data = [
             {
+                "id": log.id,
                 "timestamp": log.timestamp,
                 "method": log.method,
                 "user": log.user.username if log.user else None,
@@ -44,7 +147,181 @@ class AccessLogListView(APIView):
                 "lock_name": log.lock_name,
                 "result": log.result,
             }
-            for log in logs.order_by("-timestamp")[:100] 
+            for log in page
         ]
-        
-        return Response(data)
\ No newline at end of file
+
+        response = Response(data)
+        response["X-Total-Count-Estimate"] = estimate_count(logs)
+        if has_next:
+            next_cursor = encode_cursor(page[-1])
+            params = request.query_params.copy()
+            params["cursor"] = next_cursor
+            response["X-Next-Cursor"] = next_cursor
+            response["Link"] = f'<{request.build_absolute_uri(request.path)}?{params.urlencode()}>; rel="next"'
+
+        return response
+
+
+def _export_rows(logs):
+    # values_list + iterator : curseur côté serveur, aucune instance de modèle
+    return logs.order_by("timestamp", "id").values_list(
+        "id", "timestamp", "method", "user__username", "failed_code",
+        "lock_id", "lock_name", "result",
+    ).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+
+def _csv_chunks(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_FIELDS)
+
+    for count, row in enumerate(rows, 1):
+        writer.writerow((row[0], row[1].isoformat(), *row[2:]))
+        if count % EXPORT_CHUNK_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def _ndjson_chunks(rows):
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(
+            dict(zip(EXPORT_FIELDS, (row[0], row[1].isoformat(), *row[2:])))
+        ))
+        if len(lines) >= EXPORT_CHUNK_SIZE:
+            yield "\n".join(lines) + "\n"
+            lines = []
+    if lines:
+        yield "\n".join(lines) + "\n"
+
+
+def _gzip_chunks(chunks):
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode())
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+class AccessLogExportView(APIView):
+    """
+    GET: Export complet des logs d'accès, du plus ancien au plus récent.
+
+    Same filters as the list (user_id, lock_id, from, to, result, method).
+    `type` is 'csv' (default) or 'ndjson'; the body is gzipped unless
+    `gzip=false`. Rows are streamed from a server-side cursor, so memory
+    use does not depend on the size of the export.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        # Pas `format` : DRF l'utilise pour choisir le renderer
+        export_type = request.query_params.get("type", "csv")
+        if export_type not in EXPORT_CONTENT_TYPES:
+            return Response({"error": "Invalid type, expected csv or ndjson."}, status=400)
+        compress = request.query_params.get("gzip", "true").lower() != "false"
+
+        try:
+            logs = filter_access_logs(request.query_params)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+
+        rows = _export_rows(logs)
+        chunks = _csv_chunks(rows) if export_type == "csv" else _ndjson_chunks(rows)
+        filename = f"accesslogs.{export_type}"
+
+        if compress:
+            response = StreamingHttpResponse(
+                _gzip_chunks(chunks), content_type="application/gzip")
+            filename += ".gz"
+        else:
+            response = StreamingHttpResponse(
+                (chunk.encode() for chunk in chunks),
+                content_type=f"{EXPORT_CONTENT_TYPES[export_type]}; charset=utf-8",
+            )
+
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
+        return response
+
+
+class AccessLogStatsView(APIView):
+    """
+    GET: Statistiques des tentatives d'accès, lues dans les rollups horaires.
+
+    - lock_id, method, result: filters
+    - from / to: ISO 8601 bounds (default: the last 7 days), floored to the
+      hour (the rounded bounds are returned)
+    - view=trend (default): success/failed counts per `interval` (hour or day)
+    - view=heatmap: 7x24 matrix of counts, ISO weekday (Monday first) x UTC hour
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        params = request.query_params
+        view = params.get("view", "trend")
+        interval = params.get("interval", "hour")
+        if view not in ("trend", "heatmap"):
+            return Response({"error": "Invalid view, expected trend or heatmap."}, status=400)
+        if interval not in STATS_INTERVALS:
+            return Response({"error": "Invalid interval, expected hour or day."}, status=400)
+
+        bounds = {}
+        for param in ("from", "to"):
+            value = params.get(param)
+            if value:
+                try:
+                    bounds[param] = parse_datetime(value)
+                except (ValueError, TypeError):
+                    # Bien formée mais impossible (ex. mois 13)
+                    bounds[param] = None
+                if bounds[param] is None:
+                    return Response({"error": f"Invalid {param} datetime, expected ISO 8601."}, status=400)
+                if timezone.is_naive(bounds[param]):
+                    bounds[param] = timezone.make_aware(bounds[param])
+        end = bounds.get("to") or timezone.now()
+        start = bounds.get("from") or end - timedelta(days=STATS_DEFAULT_DAYS)
+        # Arrondis à l'heure : l'heure entamée de `from` est comptée en entier
+        start, end = rollup_bucket(start), rollup_bucket(end)
+
+        rollups = AccessLogRollup.objects.filter(bucket__gte=start, bucket__lte=end)
+        for param in ("lock_id", "method", "result"):
+            if params.get(param):
+                rollups = rollups.filter(**{param: params[param]})
+
+        if view == "heatmap":
+            cells = rollups.values(
+                weekday=ExtractIsoWeekDay("bucket", tzinfo=dt_timezone.utc),
+                hour=ExtractHour("bucket", tzinfo=dt_timezone.utc),
+            ).annotate(total=Sum("count")).order_by()
+
+            heatmap = [[0] * 24 for _ in range(7)]
+            for cell in cells:
+                heatmap[cell["weekday"] - 1][cell["hour"]] = cell["total"]
+            return Response({
+                "from": start,
+                "to": end,
+                "heatmap": heatmap,
+                "total": sum(map(sum, heatmap)),
+            })
+
+        periods = rollups.values(
+            "result",
+            period=Trunc("bucket", interval, tzinfo=dt_timezone.utc),
+        ).annotate(total=Sum("count")).order_by("period")
+
+        series = {}
+        for row in periods:
+            point = series.setdefault(
+                row["period"], {"bucket": row["period"], "success": 0, "failed": 0, "total": 0})
+            point[row["result"]] = point.get(row["result"], 0) + row["total"]
+            point["total"] += row["total"]
+
+        return Response({
+            "from": start,
+            "to": end,
+            "interval": interval,
+            "series": list(series.values()),
+        })
@@ -0,0 +1,325 @@
+"""
+Offline access lists: the badge/keypad credentials each lock accepts,
+synced to the lock so a swipe can be decided without calling the server.
+
+compile_access_lists flattens EffectiveLockAccess (one entry per
+credential fingerprint and validity window, for the auth methods enabled
+on the lock) and diffs it against the lock's current list: every change
+bumps the list version, and entries are never updated, only marked
+removed at a version. A lock knowing version N therefore only downloads
+the entries added or removed since N (build_bundle). Lists are compiled by
+the compile_access_lists command (run periodically), never by the sync
+request itself.
+
+Bundle format (big endian), signed with the lock's key (lock_signing_key):
+
+    header   4s I I I B I I   b"TAL1", lock id, from version, to version,
+                              flags (1 = full list), added count, removed count
+    entries  B 16s I I        method (1 = badge, 2 = keypad), first 16 bytes
+                              of the fingerprint, start / end as epoch
+                              seconds (0 = unbounded); added entries first
+    trailer  32s              HMAC-SHA256 of everything before it
+
+A full bundle replaces the lock's list; it is sent when the lock has no
+version yet, or when the deltas it needs were pruned
+(prune_access_list_history).
+
+Each lock is provisioned with two keys derived for it alone, and never
+with a server-wide secret:
+
+- lock_signing_key (from ACCESS_LIST_SIGNING_KEY): checks the bundles, and
+  signs the sync requests (request_signature), so a lock only gets its own
+  list;
+- lock_fingerprint_key (from ACCESS_LIST_FINGERPRINT_KEY): the lock
+  fingerprints a swiped code with lock_fingerprint. The fingerprints of a
+  lock are useless against another lock or the server's index
+  (CREDENTIAL_INDEX_KEY).
+
+Per-lock fingerprints need the raw code, so they are stored when a code is
+set (LockCredentialFingerprint, see permissions.signals); a lock added
+later gets a user's fingerprint at the user's next successful login (or
+when the code is rotated). Without both keys set, offline access lists are
+disabled: there is no fallback to SECRET_KEY.
+"""
+import hashlib
+import hmac
+import struct
+from collections import defaultdict
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection, transaction
+from django.db.models import OuterRef, Q, Subquery
+from django.utils import timezone
+from locks.models import Lock
+from .models import (
+    EffectiveLockAccess, LockAccessList, LockAccessListEntry, LockCredentialFingerprint)
+
+MAGIC = b"TAL1"
+HEADER = struct.Struct(">4sIIIBII")
+ENTRY = struct.Struct(">B16sII")
+FLAG_FULL = 1
+METHOD_CODES = {'badge': 1, 'keypad': 2}
+
+
+def access_lists_enabled():
+    return bool(settings.ACCESS_LIST_SIGNING_KEY and settings.ACCESS_LIST_FINGERPRINT_KEY)
+
+
+def _lock_key(setting, lock_id):
+    master = getattr(settings, setting)
+    if not master:
+        raise ImproperlyConfigured(f"{setting} is not set, offline access lists are disabled")
+    return hmac.new(master.encode(), f"lock:{lock_id}".encode(), hashlib.sha256).digest()
+
+
+def lock_signing_key(lock_id):
+    """Key the bundles and sync requests of `lock_id` are signed with (provisioned on the lock)."""
+    return _lock_key('ACCESS_LIST_SIGNING_KEY', lock_id)
+
+
+def lock_fingerprint_key(lock_id):
+    """Key `lock_id` fingerprints codes with (provisioned on the lock)."""
+    return _lock_key('ACCESS_LIST_FINGERPRINT_KEY', lock_id)
+
+
+def lock_fingerprint(lock_id, raw_code):
+    return hmac.new(lock_fingerprint_key(lock_id), str(raw_code).encode(), hashlib.sha256).hexdigest()
+
+
+def store_lock_fingerprints(user_id, method, raw_code, only_missing=False):
+    """
+    Store the fingerprints of a user's new code for every lock, replacing
+    those of the previous code, or only for the locks that have none yet
+    (only_missing). No-op when the access lists are disabled. Returns the
+    number of fingerprints written.
+    """
+    if not access_lists_enabled():
+        return 0
+
+    locks = Lock.objects.all()
+    if only_missing:
+        locks = locks.exclude(id_lock__in=LockCredentialFingerprint.objects.filter(
+            user_id=user_id, method=method).values('lock_id'))
+    lock_ids = list(locks.values_list('id_lock', flat=True))
+
+    LockCredentialFingerprint.objects.bulk_create(
+        [
+            LockCredentialFingerprint(
+                lock_id=lock_id, user_id=user_id, method=method,
+                fingerprint=lock_fingerprint(lock_id, raw_code))
+            for lock_id in lock_ids
+        ],
+        update_conflicts=True,
+        unique_fields=['lock', 'user', 'method'],
+        update_fields=['fingerprint'],
+        batch_size=1000,
+    )
+    return len(lock_ids)
+
+
+def request_signature(lock_id, since, timestamp):
+    """
+    Signature a lock sends with its sync request: hex HMAC-SHA256, with its
+    signing key, of "<lock id>:<since>:<epoch seconds>".
+    """
+    message = f"{lock_id}:{since}:{timestamp}".encode()
+    return hmac.new(lock_signing_key(lock_id), message, hashlib.sha256).hexdigest()
+
+
+def verify_request(lock_id, since, timestamp, signature, now=None):
+    """
+    Whether a sync request comes from lock `lock_id`: valid signature and
+    timestamp within ACCESS_LIST_MAX_CLOCK_SKEW seconds of now.
+    """
+    now = now or timezone.now()
+    try:
+        timestamp = int(timestamp)
+    except (TypeError, ValueError):
+        return False
+    if abs(now.timestamp() - timestamp) > settings.ACCESS_LIST_MAX_CLOCK_SKEW:
+        return False
+    return hmac.compare_digest(request_signature(lock_id, since, timestamp), str(signature or ""))
+
+
+def _desired_entries(locks, now):
+    """
+    {lock id: set of (method, fingerprint, start_date, end_date)} the locks
+    should accept, with one query per table whatever the number of locks.
+    """
+    desired = {lock.pk: set() for lock in locks}
+    methods = {lock.pk: set(lock.auth_methods) & set(METHOD_CODES) for lock in locks}
+
+    accesses = list(
+        EffectiveLockAccess.objects.filter(lock_id__in=desired)
+        .filter(Q(end_date__isnull=True) | Q(end_date__gte=now))
+        .values_list('lock_id', 'user_id', 'start_date', 'end_date')
+        .distinct()
+    )
+
+    # Empreintes par serrure ; codes sans empreinte pour une serrure : ignorés
+    # jusqu'au prochain login (ou à la régénération du code)
+    fingerprints = {}
+    for lock_id, user_id, method, fingerprint in LockCredentialFingerprint.objects.filter(
+        lock_id__in=desired, user_id__in={access[1] for access in accesses}
+    ).values_list('lock_id', 'user_id', 'method', 'fingerprint'):
+        fingerprints[lock_id, user_id, method] = fingerprint
+
+    for lock_id, user_id, start_date, end_date in accesses:
+        for method in methods[lock_id]:
+            fingerprint = fingerprints.get((lock_id, user_id, method))
+            if fingerprint:
+                desired[lock_id].add((method, fingerprint, start_date, end_date))
+    return desired
+
+
+def compile_access_lists(locks=None, now=None):
+    """
+    Bring the access lists of `locks` (all locks by default) up to date.
+    Returns the number of lists whose version changed.
+    """
+    now = now or timezone.now()
+    locks = list(Lock.objects.all() if locks is None else locks)
+    if not locks:
+        return 0
+
+    with transaction.atomic():
+        LockAccessList.objects.bulk_create(
+            [LockAccessList(lock_id=lock.pk) for lock in locks], ignore_conflicts=True)
+        # Verrou par liste : deux compilations concurrentes ne se marchent pas dessus
+        lists = {
+            access_list.lock_id: access_list
+            for access_list in LockAccessList.objects.select_for_update()
+            .filter(lock_id__in=[lock.pk for lock in locks]).order_by('lock_id')
+        }
+
+        desired = _desired_entries(locks, now)
+
+        removed_ids = []
+        current = defaultdict(set)
+        active = LockAccessListEntry.objects.filter(
+            lock_id__in=lists, removed_version__isnull=True
+        ).values_list('id', 'lock_id', 'method', 'fingerprint', 'start_date', 'end_date')
+        for entry_id, lock_id, *key in active:
+            key = tuple(key)
+            if key in desired[lock_id]:
+                current[lock_id].add(key)
+            else:
+                removed_ids.append((entry_id, lock_id))
+
+        changed = set(lock_id for _, lock_id in removed_ids)
+        added = []
+        for lock_id, keys in desired.items():
+            new_keys = keys - current[lock_id]
+            if new_keys:
+                changed.add(lock_id)
+            added.extend((lock_id, key) for key in new_keys)
+
+        for lock_id in changed:
+            lists[lock_id].version += 1
+        for access_list in lists.values():
+            access_list.compiled_at = now
+        LockAccessList.objects.bulk_update(
+            list(lists.values()), ['version', 'compiled_at'], batch_size=1000)
+
+        if removed_ids:
+            LockAccessListEntry.objects.filter(
+                id__in=[entry_id for entry_id, _ in removed_ids]
+            ).update(
+                # Version de la liste de chaque entrée, déjà incrémentée
+                removed_version=Subquery(
+                    LockAccessList.objects.filter(lock_id=OuterRef('lock_id')).values('version')[:1]),
+                removed_at=now,
+            )
+
+        LockAccessListEntry.objects.bulk_create([
+            LockAccessListEntry(
+                lock_id=lock_id,
+                method=method,
+                fingerprint=fingerprint,
+                start_date=start_date,
+                end_date=end_date,
+                added_version=lists[lock_id].version,
+            )
+            for lock_id, (method, fingerprint, start_date, end_date) in added
+        ], batch_size=1000)
+
+    return len(changed)
+
+
+def _epoch(value):
+    return int(value.timestamp()) if value is not None else 0
+
+
+def _pack_entries(entries):
+    return b"".join(
+        ENTRY.pack(
+            METHOD_CODES[method],
+            bytes.fromhex(fingerprint)[:16],
+            _epoch(start_date),
+            _epoch(end_date),
+        )
+        for method, fingerprint, start_date, end_date in entries
+    )
+
+
+def build_bundle(access_list, since):
+    """
+    Signed bundle bringing a lock from version `since` to the current
+    version of `access_list`: a delta when possible, the full list
+    otherwise.
+    """
+    entries = LockAccessListEntry.objects.filter(lock_id=access_list.lock_id)
+    fields = ('method', 'fingerprint', 'start_date', 'end_date')
+
+    full = since <= 0 or since > access_list.version or since < access_list.pruned_version
+    if full:
+        added = list(entries.filter(removed_version__isnull=True).values_list(*fields))
+        removed = []
+    else:
+        added = list(
+            entries.filter(added_version__gt=since, removed_version__isnull=True).values_list(*fields))
+        # Ajoutées puis retirées après `since` : la serrure ne les a jamais eues
+        removed = list(
+            entries.filter(removed_version__gt=since, added_version__lte=since).values_list(*fields))
+
+    body = HEADER.pack(
+        MAGIC,
+        access_list.lock_id,
+        0 if full else since,
+        access_list.version,
+        FLAG_FULL if full else 0,
+        len(added),
+        len(removed),
+    ) + _pack_entries(added) + _pack_entries(removed)
+
+    signature = hmac.new(lock_signing_key(access_list.lock_id), body, hashlib.sha256).digest()
+    return body + signature
+
+
+def prune_access_list_history(older_than):
+    """
+    Delete the entries removed before `older_than`. Locks still on a
+    version older than the pruned removals get a full bundle next time.
+    Returns the number of entries deleted.
+    """
+    entries_table = LockAccessListEntry._meta.db_table
+    lists_table = LockAccessList._meta.db_table
+
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                UPDATE {lists_table} AS list
+                SET pruned_version = GREATEST(list.pruned_version, pruned.version)
+                FROM (
+                    SELECT lock_id, MAX(removed_version) AS version
+                    FROM {entries_table}
+                    WHERE removed_at < %s
+                    GROUP BY lock_id
+                ) AS pruned
+                WHERE list.lock_id = pruned.lock_id
+                """,
+                [older_than],
+            )
+        deleted, _ = LockAccessListEntry.objects.filter(removed_at__lt=older_than).delete()
+    return deleted
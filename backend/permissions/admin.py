@@ -1,4 +1,21 @@
 from django.contrib import admin
-from .models import LockPermission
+from .models import LockPermission, EffectiveLockAccess
 
 admin.site.register(LockPermission)
+
+
+class EffectiveLockAccessAdmin(admin.ModelAdmin):
+    # Lecture seule : la table est maintenue à partir des LockPermission
+    list_display = ('user', 'lock', 'start_date', 'end_date', 'permission')
+    list_filter = ('lock',)
+    search_fields = ('user__username', 'lock__name')
+    list_select_related = ('user', 'lock', 'permission')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+admin.site.register(EffectiveLockAccess, EffectiveLockAccessAdmin)
@@ -0,0 +1,21 @@
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from permissions.access_lists import compile_access_lists, prune_access_list_history
+
+
+class Command(BaseCommand):
+    help = 'Recompile les listes d\'accès hors ligne des serrures et purge leur historique'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--history-days', type=int, default=settings.ACCESS_LIST_HISTORY_DAYS,
+            help='Jours d\'historique des retraits conservés')
+
+    def handle(self, *args, **options):
+        changed = compile_access_lists()
+        pruned = prune_access_list_history(
+            timezone.now() - timedelta(days=options['history_days']))
+        self.stdout.write(self.style.SUCCESS(
+            f'{changed} liste(s) modifiée(s), {pruned} entrée(s) purgée(s).'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+from permissions.utils import rebuild_effective_access
+
+
+class Command(BaseCommand):
+    help = 'Reconstruit la table EffectiveLockAccess à partir des LockPermission'
+
+    def handle(self, *args, **options):
+        created = rebuild_effective_access()
+        self.stdout.write(self.style.SUCCESS(
+            f'{created} accès effectif(s) reconstruit(s).'))
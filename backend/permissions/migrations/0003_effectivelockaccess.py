@@ -0,0 +1,56 @@
+# Generated by Django 6.0 on 2026-10-17 18:40
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+POPULATE_EFFECTIVE_ACCESS = """
+    INSERT INTO permissions_effectivelockaccess (permission_id, user_id, lock_id, start_date, end_date)
+    SELECT p.id, p.user_id, p.lock_id, p.start_date, p.end_date
+    FROM permissions_lockpermission p
+    WHERE p.user_id IS NOT NULL AND p.lock_id IS NOT NULL
+    UNION ALL
+    SELECT p.id, p.user_id, gl.lock_id, p.start_date, p.end_date
+    FROM permissions_lockpermission p
+    JOIN locks_lock_group_locks gl ON gl.lock_group_id = p.lock_group_id
+    WHERE p.user_id IS NOT NULL
+    UNION ALL
+    SELECT p.id, ug.user_id, p.lock_id, p.start_date, p.end_date
+    FROM permissions_lockpermission p
+    JOIN auth_user_groups ug ON ug.group_id = p.group_id
+    WHERE p.lock_id IS NOT NULL
+    UNION ALL
+    SELECT p.id, ug.user_id, gl.lock_id, p.start_date, p.end_date
+    FROM permissions_lockpermission p
+    JOIN auth_user_groups ug ON ug.group_id = p.group_id
+    JOIN locks_lock_group_locks gl ON gl.lock_group_id = p.lock_group_id
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('locks', '0004_lock_remote_address'),
+        ('permissions', '0002_alter_lockpermission_unique_together'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EffectiveLockAccess',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start_date', models.DateTimeField(blank=True, default=None, null=True)),
+                ('end_date', models.DateTimeField(blank=True, default=None, null=True)),
+                ('lock', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='effective_accesses', to='locks.lock')),
+                ('permission', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='effective_accesses', to='permissions.lockpermission')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='effective_lock_accesses', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'lock'], name='permissions_user_id_6ac8fb_idx')],
+                'constraints': [models.UniqueConstraint(fields=('permission', 'user', 'lock'), name='unique_effective_lock_access')],
+            },
+        ),
+        migrations.RunSQL(POPULATE_EFFECTIVE_ACCESS, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 6.0 on 2026-10-17 19:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('locks', '0011_remotecommand_batch'),
+        ('permissions', '0003_effectivelockaccess'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LockAccessList',
+            fields=[
+                ('lock', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='access_list', serialize=False, to='locks.lock')),
+                ('version', models.PositiveIntegerField(default=0)),
+                ('pruned_version', models.PositiveIntegerField(default=0)),
+                ('compiled_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='LockAccessListEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('method', models.CharField(choices=[('badge', 'Badge'), ('keypad', 'Keypad')], max_length=10)),
+                ('fingerprint', models.CharField(max_length=64)),
+                ('start_date', models.DateTimeField(blank=True, default=None, null=True)),
+                ('end_date', models.DateTimeField(blank=True, default=None, null=True)),
+                ('added_version', models.PositiveIntegerField()),
+                ('removed_version', models.PositiveIntegerField(blank=True, null=True)),
+                ('removed_at', models.DateTimeField(blank=True, null=True)),
+                ('lock', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='access_list_entries', to='locks.lock')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['lock', 'added_version'], name='permissions_lock_id_f7aa7c_idx'), models.Index(fields=['lock', 'removed_version'], name='permissions_lock_id_3057b9_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('removed_version__isnull', True)), fields=('lock', 'method', 'fingerprint', 'start_date', 'end_date'), name='unique_active_access_list_entry', nulls_distinct=False)],
+            },
+        ),
+    ]
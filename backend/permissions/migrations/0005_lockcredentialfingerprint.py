@@ -0,0 +1,30 @@
+# Generated by Django 6.0 on 2026-10-17 20:22
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('locks', '0012_remotecommand_unfinished_idx'),
+        ('permissions', '0004_lockaccesslist_lockaccesslistentry'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LockCredentialFingerprint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('method', models.CharField(choices=[('badge', 'Badge'), ('keypad', 'Keypad')], max_length=10)),
+                ('fingerprint', models.CharField(max_length=64)),
+                ('lock', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='credential_fingerprints', to='locks.lock')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lock_fingerprints', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('lock', 'user', 'method'), name='unique_lock_credential_fingerprint')],
+            },
+        ),
+    ]
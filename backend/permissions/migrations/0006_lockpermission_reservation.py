@@ -0,0 +1,37 @@
+# Generated by Django 6.0 on 2026-10-17 20:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# Permissions déjà accordées par une réservation approuvée : même utilisateur,
+# même serrure, même fenêtre que la réservation. LockPermission.clean interdit
+# deux fenêtres qui se chevauchent, donc au plus une permission par réservation.
+LINK_RESERVATION_PERMISSIONS = """
+    UPDATE permissions_lockpermission AS permission
+    SET reservation_id = reservation.id
+    FROM reservations_reservation AS reservation
+    WHERE reservation.status = 'approved'
+      AND permission.reservation_id IS NULL
+      AND permission.user_id = reservation.user_id
+      AND permission.lock_id = reservation.lock_id
+      AND permission.start_date = lower(reservation.period)
+      AND permission.end_date = upper(reservation.period)
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('permissions', '0005_lockcredentialfingerprint'),
+        ('reservations', '0003_reservation_series'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lockpermission',
+            name='reservation',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='permissions', to='reservations.reservation'),
+        ),
+        migrations.RunSQL(LINK_RESERVATION_PERMISSIONS, migrations.RunSQL.noop),
+    ]
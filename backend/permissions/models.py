@@ -54,6 +54,17 @@ class LockPermission(models.Model):
     start_date = models.DateTimeField(blank=True, null=True, default=None)
     end_date = models.DateTimeField(blank=True, null=True, default=None)
 
+    # Réservation approuvée qui a créé la permission (None : donnée à la main).
+    # Refuser la réservation supprime cette permission-là, et elle seule.
+    reservation = models.ForeignKey(
+        'reservations.Reservation',
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        editable=False,
+        related_name='permissions'
+    )
+
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -142,3 +153,142 @@ class LockPermission(models.Model):
         target = self.lock.name if self.lock else f"LockGroup: {
             self.lock_group.name}"
         return f"{subject} -> {target}"
+
+
+class EffectiveLockAccess(models.Model):
+    """
+    Flattened view of LockPermission: one row per (permission, user, lock),
+    with user groups and lock groups already expanded.
+
+    Kept in sync by permissions.signals and rebuilt from scratch by the
+    rebuild_effective_access command, so access checks and "who can open
+    this door" queries are single indexed lookups.
+    """
+    permission = models.ForeignKey(
+        LockPermission,
+        on_delete=models.CASCADE,
+        related_name='effective_accesses'
+    )
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='effective_lock_accesses'
+    )
+    lock = models.ForeignKey(
+        Lock,
+        on_delete=models.CASCADE,
+        related_name='effective_accesses'
+    )
+
+    start_date = models.DateTimeField(blank=True, null=True, default=None)
+    end_date = models.DateTimeField(blank=True, null=True, default=None)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'lock']),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['permission', 'user', 'lock'],
+                name='unique_effective_lock_access'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.user} -> {self.lock}"
+
+
+class LockAccessList(models.Model):
+    """
+    Versioned list of the credentials a lock accepts, synced to the lock so
+    it can decide offline (see permissions.access_lists).
+    """
+    lock = models.OneToOneField(
+        Lock,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='access_list'
+    )
+    # Incrémentée à chaque compilation qui change la liste
+    version = models.PositiveIntegerField(default=0)
+    # Les deltas depuis une version antérieure ne sont plus disponibles
+    pruned_version = models.PositiveIntegerField(default=0)
+    compiled_at = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return f"{self.lock} v{self.version}"
+
+
+class LockAccessListEntry(models.Model):
+    """
+    One credential accepted by a lock during a window, present in its
+    access list from `added_version` until `removed_version` (excluded).
+    """
+    METHODS = [
+        ('badge', 'Badge'),
+        ('keypad', 'Keypad'),
+    ]
+
+    lock = models.ForeignKey(
+        Lock,
+        on_delete=models.CASCADE,
+        related_name='access_list_entries'
+    )
+    method = models.CharField(max_length=10, choices=METHODS)
+    # LockCredentialFingerprint.fingerprint du code pour cette serrure
+    fingerprint = models.CharField(max_length=64)
+    start_date = models.DateTimeField(blank=True, null=True, default=None)
+    end_date = models.DateTimeField(blank=True, null=True, default=None)
+
+    added_version = models.PositiveIntegerField()
+    removed_version = models.PositiveIntegerField(blank=True, null=True)
+    removed_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['lock', 'added_version']),
+            models.Index(fields=['lock', 'removed_version']),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['lock', 'method', 'fingerprint', 'start_date', 'end_date'],
+                condition=Q(removed_version__isnull=True),
+                nulls_distinct=False,
+                name='unique_active_access_list_entry'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.lock} {self.method} {self.fingerprint[:8]}"
+
+
+class LockCredentialFingerprint(models.Model):
+    """
+    Fingerprint of a user's badge or keypad code under the key of one lock
+    (permissions.access_lists.lock_fingerprint). Computed when the raw code
+    is known: when it is set, and at its next successful login for the
+    locks added since.
+    """
+    lock = models.ForeignKey(
+        Lock,
+        on_delete=models.CASCADE,
+        related_name='credential_fingerprints'
+    )
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='lock_fingerprints'
+    )
+    method = models.CharField(max_length=10, choices=LockAccessListEntry.METHODS)
+    fingerprint = models.CharField(max_length=64)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['lock', 'user', 'method'],
+                name='unique_lock_credential_fingerprint'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.lock} {self.method} {self.user}"
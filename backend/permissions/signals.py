@@ -0,0 +1,115 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+from locks.models import Lock_Group
+from users.models import UserBadgeCode, UserKeypadCode
+from .access_lists import store_lock_fingerprints
+from .models import LockPermission, EffectiveLockAccess, LockCredentialFingerprint
+from .utils import (
+    invalidate_access_cache,
+    refresh_effective_access_for_permissions,
+    grant_group_memberships,
+    revoke_group_memberships,
+    grant_lock_group_memberships,
+    revoke_lock_group_memberships,
+)
+
+
+CREDENTIAL_METHODS = {UserBadgeCode: 'badge', UserKeypadCode: 'keypad'}
+
+
+def _invalidate():
+    # Une fois maintenant pour ce process, une fois au commit pour que les
+    # autres workers ne remettent pas en cache l'état d'avant la transaction.
+    invalidate_access_cache()
+    transaction.on_commit(invalidate_access_cache)
+
+
+@receiver(post_save, sender=LockPermission)
+def lock_permission_saved(sender, instance, **kwargs):
+    refresh_effective_access_for_permissions([instance])
+    _invalidate()
+
+
+@receiver(post_delete, sender=LockPermission)
+def lock_permission_deleted(sender, **kwargs):
+    # Les lignes EffectiveLockAccess partent en cascade
+    _invalidate()
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def user_groups_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    user.groups.add(...) arrive avec reverse=False (instance = user),
+    group.user_set.add(...) avec reverse=True (instance = group).
+    """
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+
+    if action == "post_clear":
+        if reverse:
+            EffectiveLockAccess.objects.filter(permission__group=instance).delete()
+        else:
+            EffectiveLockAccess.objects.filter(
+                user=instance, permission__group__isnull=False).delete()
+    else:
+        if reverse:
+            group_ids, user_ids = [instance.pk], pk_set
+        else:
+            group_ids, user_ids = pk_set, [instance.pk]
+
+        if action == "post_add":
+            grant_group_memberships(group_ids, user_ids)
+        else:
+            revoke_group_memberships(group_ids, user_ids)
+
+    _invalidate()
+
+
+@receiver(m2m_changed, sender=Lock_Group.locks.through)
+def lock_group_locks_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    lock_group.locks.add(...) arrive avec reverse=False (instance = lock group),
+    lock.groups.add(...) avec reverse=True (instance = lock).
+    """
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+
+    if action == "post_clear":
+        if reverse:
+            EffectiveLockAccess.objects.filter(
+                lock=instance, permission__lock_group__isnull=False).delete()
+        else:
+            EffectiveLockAccess.objects.filter(
+                permission__lock_group=instance).delete()
+    else:
+        if reverse:
+            lock_group_ids, lock_ids = pk_set, [instance.pk]
+        else:
+            lock_group_ids, lock_ids = [instance.pk], pk_set
+
+        if action == "post_add":
+            grant_lock_group_memberships(lock_group_ids, lock_ids)
+        else:
+            revoke_lock_group_memberships(lock_group_ids, lock_ids)
+
+    _invalidate()
+
+
+@receiver(post_save, sender=UserBadgeCode)
+@receiver(post_save, sender=UserKeypadCode)
+def credential_saved(sender, instance, **kwargs):
+    """Nouveau code (set_code) : empreintes par serrure, tant que le code brut est connu."""
+    raw_code = getattr(instance, '_raw_code', None)
+    if raw_code is None:
+        return
+    instance._raw_code = None
+    store_lock_fingerprints(instance.user_id, CREDENTIAL_METHODS[sender], raw_code)
+
+
+@receiver(post_delete, sender=UserBadgeCode)
+@receiver(post_delete, sender=UserKeypadCode)
+def credential_deleted(sender, instance, **kwargs):
+    LockCredentialFingerprint.objects.filter(
+        user_id=instance.user_id, method=CREDENTIAL_METHODS[sender]).delete()
@@ -1,15 +1,24 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.contrib.auth.models import User, Group
-from django.core.exceptions import ValidationError
+from django.core.exceptions import ImproperlyConfigured, ValidationError
 from django.utils import timezone
 from rest_framework.test import APIClient
 from rest_framework import status
 from datetime import timedelta
+from unittest import mock
 
 # Imports from your apps
-from .models import LockPermission
-from .utils import user_has_access_to_lock
+from .models import LockPermission, EffectiveLockAccess, LockAccessList, LockCredentialFingerprint
+from .utils import user_has_access_to_lock, rebuild_effective_access
+from .access_lists import (
+    HEADER, ENTRY, compile_access_lists, lock_fingerprint, lock_fingerprint_key, lock_signing_key,
+    prune_access_list_history, request_signature)
+from auth.utils import get_user_by_badge_code
 from locks.models import Lock, Lock_Group
+from users.models import UserBadgeCode, UserKeypadCode, code_fingerprint
+import hashlib
+import hmac
+import time
 
 
 class LockPermissionModelTest(TestCase):
@@ -132,6 +141,289 @@ class AccessControlUtilsTest(TestCase):
         self.assertFalse(user_has_access_to_lock(self.user, self.lock))
 
 
+class AccessDecisionCacheTest(TestCase):
+    """
+    Tests for the cached access decisions in user_has_access_to_lock.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='cache_user')
+        self.group = Group.objects.create(name='cache_group')
+        self.lock = Lock.objects.create(name='Cache Lock', id_lock=400)
+        self.lock_group = Lock_Group.objects.create(
+            name='Cache LG', id_group=400)
+
+    def test_repeated_check_hits_cache(self):
+        LockPermission.objects.create(user=self.user, lock=self.lock)
+        self.assertTrue(user_has_access_to_lock(self.user, self.lock))
+        with self.assertNumQueries(0):
+            self.assertTrue(user_has_access_to_lock(self.user, self.lock))
+
+    def test_permission_delete_invalidates(self):
+        perm = LockPermission.objects.create(user=self.user, lock=self.lock)
+        self.assertTrue(user_has_access_to_lock(self.user, self.lock))
+        perm.delete()
+        self.assertFalse(user_has_access_to_lock(self.user, self.lock))
+
+    def test_group_membership_invalidates(self):
+        LockPermission.objects.create(group=self.group, lock=self.lock)
+        self.assertFalse(user_has_access_to_lock(self.user, self.lock))
+
+        self.user.groups.add(self.group)
+        self.assertTrue(user_has_access_to_lock(self.user, self.lock))
+
+        self.group.user_set.remove(self.user)
+        self.assertFalse(user_has_access_to_lock(self.user, self.lock))
+
+    def test_lock_group_membership_invalidates(self):
+        LockPermission.objects.create(
+            user=self.user, lock_group=self.lock_group)
+        self.assertFalse(user_has_access_to_lock(self.user, self.lock))
+
+        self.lock_group.locks.add(self.lock)
+        self.assertTrue(user_has_access_to_lock(self.user, self.lock))
+
+    def test_cached_decision_expires_at_time_boundary(self):
+        now = timezone.now()
+        LockPermission.objects.create(
+            user=self.user,
+            lock=self.lock,
+            start_date=now + timedelta(hours=1),
+            end_date=now + timedelta(hours=2)
+        )
+        self.assertFalse(user_has_access_to_lock(self.user, self.lock))
+
+        with mock.patch('permissions.utils.timezone.now',
+                        return_value=now + timedelta(minutes=90)):
+            self.assertTrue(user_has_access_to_lock(self.user, self.lock))
+
+        with mock.patch('permissions.utils.timezone.now',
+                        return_value=now + timedelta(hours=3)):
+            self.assertFalse(user_has_access_to_lock(self.user, self.lock))
+
+
+class EffectiveLockAccessTest(TestCase):
+    """
+    Tests for the flattened EffectiveLockAccess table.
+    """
+
+    def setUp(self):
+        self.alice = User.objects.create_user(username='eff_alice')
+        self.bob = User.objects.create_user(username='eff_bob')
+        self.group = Group.objects.create(name='eff_group')
+        self.lock_a = Lock.objects.create(name='Eff Lock A', id_lock=500)
+        self.lock_b = Lock.objects.create(name='Eff Lock B', id_lock=501)
+        self.lock_group = Lock_Group.objects.create(
+            name='Eff LG', id_group=500)
+
+    def _rows(self):
+        return set(EffectiveLockAccess.objects.values_list(
+            'permission_id', 'user_id', 'lock_id'))
+
+    def _assert_matches_rebuild(self):
+        incremental = self._rows()
+        rebuild_effective_access()
+        self.assertEqual(incremental, self._rows())
+
+    def test_group_to_lock_group_is_flattened(self):
+        self.group.user_set.add(self.alice, self.bob)
+        self.lock_group.locks.add(self.lock_a)
+        perm = LockPermission.objects.create(
+            group=self.group, lock_group=self.lock_group)
+
+        self.assertEqual(self._rows(), {
+            (perm.id, self.alice.id, self.lock_a.id_lock),
+            (perm.id, self.bob.id, self.lock_a.id_lock),
+        })
+
+        self.lock_b.groups.add(self.lock_group)
+        self.bob.groups.remove(self.group)
+        self.assertEqual(self._rows(), {
+            (perm.id, self.alice.id, self.lock_a.id_lock),
+            (perm.id, self.alice.id, self.lock_b.id_lock),
+        })
+        self._assert_matches_rebuild()
+
+    def test_clear_and_delete(self):
+        self.alice.groups.add(self.group)
+        self.lock_group.locks.add(self.lock_a, self.lock_b)
+        LockPermission.objects.create(group=self.group, lock=self.lock_a)
+        direct = LockPermission.objects.create(
+            user=self.alice, lock_group=self.lock_group)
+
+        self.alice.groups.clear()
+        self.assertEqual(self._rows(), {
+            (direct.id, self.alice.id, self.lock_a.id_lock),
+            (direct.id, self.alice.id, self.lock_b.id_lock),
+        })
+
+        self.lock_group.locks.clear()
+        self.assertEqual(self._rows(), set())
+
+        self.lock_group.locks.add(self.lock_b)
+        direct.delete()
+        self.assertEqual(self._rows(), set())
+        self._assert_matches_rebuild()
+
+    def test_dates_follow_permission_updates(self):
+        perm = LockPermission.objects.create(user=self.alice, lock=self.lock_a)
+        end = timezone.now() - timedelta(hours=1)
+        perm.end_date = end
+        perm.save()
+
+        access = EffectiveLockAccess.objects.get(permission=perm)
+        self.assertEqual(access.end_date, end)
+        self.assertFalse(user_has_access_to_lock(self.alice, self.lock_a))
+
+    def test_lock_access_view(self):
+        staff = User.objects.create_user('eff_staff', is_staff=True)
+        self.group.user_set.add(self.alice, self.bob)
+        LockPermission.objects.create(group=self.group, lock=self.lock_a)
+
+        client = APIClient()
+        client.force_authenticate(user=staff)
+        response = client.get(f'/permissions/locks/{self.lock_a.id_lock}/access/')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [a['username'] for a in response.data['accesses']],
+            ['eff_alice', 'eff_bob'])
+
+
+@override_settings(ACCESS_LIST_SIGNING_KEY='test-signing', ACCESS_LIST_FINGERPRINT_KEY='test-fingerprint')
+class LockAccessListTest(TestCase):
+    """
+    Tests for the offline access lists synced to the locks.
+    """
+
+    def setUp(self):
+        self.lock = Lock.objects.create(
+            name='TAL Lock', id_lock=700, auth_methods=['badge'])
+        self.alice = User.objects.create_user(username='tal_alice')
+        self.bob = User.objects.create_user(username='tal_bob')
+        UserBadgeCode.objects.create(user=self.alice, code_hash='alice-badge')
+        UserKeypadCode.objects.create(user=self.alice, code_hash='123456')
+        UserBadgeCode.objects.create(user=self.bob, code_hash='bob-badge')
+        self.client = APIClient()
+
+    def _sync(self, since=0, lock_id=None, signed_by=None, timestamp=None):
+        lock_id = lock_id or self.lock.id_lock
+        timestamp = timestamp or int(time.time())
+        return self.client.get(
+            f'/permissions/locks/{lock_id}/access-list/', {'since': since},
+            HTTP_X_LOCK_TIMESTAMP=str(timestamp),
+            HTTP_X_LOCK_SIGNATURE=request_signature(signed_by or lock_id, since, timestamp),
+        )
+
+    def _parse(self, bundle):
+        body, signature = bundle[:-32], bundle[-32:]
+        expected = hmac.new(lock_signing_key(self.lock.id_lock), body, hashlib.sha256).digest()
+        self.assertEqual(signature, expected)
+
+        magic, lock_id, from_version, to_version, flags, added, removed = HEADER.unpack_from(body)
+        self.assertEqual((magic, lock_id), (b'TAL1', self.lock.id_lock))
+        entries = [
+            ENTRY.unpack_from(body, HEADER.size + index * ENTRY.size)
+            for index in range(added + removed)
+        ]
+        self.assertEqual(len(body), HEADER.size + len(entries) * ENTRY.size)
+        return from_version, to_version, flags, entries[:added], entries[added:]
+
+    def _badge(self, raw_code, end=0):
+        return (1, bytes.fromhex(lock_fingerprint(self.lock.id_lock, raw_code))[:16], 0, end)
+
+    def test_full_bundle_then_delta(self):
+        LockPermission.objects.create(user=self.alice, lock=self.lock)
+        compile_access_lists([self.lock])
+
+        response = self._sync()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'application/octet-stream')
+        _, version, flags, added, removed = self._parse(response.content)
+        # Serrure en badge seulement : pas d'entrée clavier
+        self.assertEqual((version, flags), (1, 1))
+        self.assertEqual(added, [self._badge('alice-badge')])
+        self.assertEqual(removed, [])
+
+        self.assertEqual(self._sync(since=1).status_code, status.HTTP_204_NO_CONTENT)
+
+        LockPermission.objects.filter(user=self.alice).delete()
+        end = timezone.now() + timedelta(days=1)
+        LockPermission.objects.create(user=self.bob, lock=self.lock, end_date=end)
+        compile_access_lists([self.lock])
+
+        from_version, version, flags, added, removed = self._parse(self._sync(since=1).content)
+        self.assertEqual((from_version, version, flags), (1, 2, 0))
+        self.assertEqual(added, [self._badge('bob-badge', int(end.timestamp()))])
+        self.assertEqual(removed, [self._badge('alice-badge')])
+
+    def test_sync_does_not_compile(self):
+        LockPermission.objects.create(user=self.alice, lock=self.lock)
+        response = self._sync()
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(response['X-Access-List-Version'], '0')
+        self.assertFalse(LockAccessList.objects.exists())
+
+    def test_sync_requires_lock_signature(self):
+        compile_access_lists([self.lock])
+        other = Lock.objects.create(name='Other', id_lock=701)
+
+        # Signée par une autre serrure, expirée, absente
+        self.assertEqual(self._sync(signed_by=other.id_lock).status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(
+            self._sync(timestamp=int(time.time()) - 3600).status_code, status.HTTP_401_UNAUTHORIZED)
+        response = self.client.get(f'/permissions/locks/{self.lock.id_lock}/access-list/')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_fingerprints_are_per_lock(self):
+        other = Lock.objects.create(name='Other', id_lock=701, auth_methods=['badge'])
+        self.assertNotEqual(lock_fingerprint(self.lock.id_lock, 'alice-badge'),
+                            lock_fingerprint(other.id_lock, 'alice-badge'))
+        self.assertNotEqual(lock_fingerprint(self.lock.id_lock, 'alice-badge'),
+                            code_fingerprint('alice-badge'))
+
+        # Serrure créée après le code : empreinte au prochain login
+        self.assertFalse(LockCredentialFingerprint.objects.filter(lock=other).exists())
+        self.assertEqual(get_user_by_badge_code('alice-badge'), self.alice)
+        self.assertEqual(
+            LockCredentialFingerprint.objects.get(lock=other, user=self.alice, method='badge').fingerprint,
+            lock_fingerprint(other.id_lock, 'alice-badge'))
+
+        # Nouveau code : l'ancienne empreinte est remplacée
+        code = self.alice.badge_codes
+        code.set_code('alice-new-badge')
+        code.save()
+        self.assertEqual(
+            LockCredentialFingerprint.objects.get(lock=self.lock, user=self.alice, method='badge').fingerprint,
+            lock_fingerprint(self.lock.id_lock, 'alice-new-badge'))
+
+    @override_settings(ACCESS_LIST_FINGERPRINT_KEY=None)
+    def test_disabled_without_keys(self):
+        self.assertEqual(self.client.get(
+            f'/permissions/locks/{self.lock.id_lock}/access-list/').status_code, 503)
+        with self.assertRaises(ImproperlyConfigured):
+            lock_fingerprint_key(self.lock.id_lock)
+
+    def test_unchanged_compile_keeps_version(self):
+        LockPermission.objects.create(user=self.alice, lock=self.lock)
+        self.assertEqual(compile_access_lists([self.lock]), 1)
+        self.assertEqual(compile_access_lists([self.lock]), 0)
+        self.assertEqual(self.lock.access_list.version, 1)
+
+    def test_pruned_history_falls_back_to_full_bundle(self):
+        LockPermission.objects.create(user=self.alice, lock=self.lock)
+        compile_access_lists([self.lock])
+        LockPermission.objects.create(user=self.bob, lock=self.lock)
+        LockPermission.objects.filter(user=self.alice).delete()
+        compile_access_lists([self.lock])
+
+        self.assertEqual(prune_access_list_history(timezone.now() + timedelta(seconds=1)), 1)
+
+        _, version, flags, added, removed = self._parse(self._sync(since=1).content)
+        self.assertEqual((version, flags), (2, 1))
+        self.assertEqual(added, [self._badge('bob-badge')])
+
+
 class LockPermissionAPITest(TestCase):
     """
     Tests for views.py: LockPermissionView (GET and POST).
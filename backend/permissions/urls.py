@@ -1,5 +1,7 @@
 from django.urls import path
-from .views import LockPermissionView
+from .views import LockPermissionView, LockAccessView, LockAccessListView
 urlpatterns = [
-    path("", LockPermissionView.as_view(), name="lock_permission")
+    path("", LockPermissionView.as_view(), name="lock_permission"),
+    path("locks/<int:lock_id>/access/", LockAccessView.as_view(), name="lock_access"),
+    path("locks/<int:lock_id>/access-list/", LockAccessListView.as_view(), name="lock_access_list"),
 ]
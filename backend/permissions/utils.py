@@ -1,6 +1,72 @@
+import time
+from collections import defaultdict
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db import connection, transaction
 from django.utils import timezone
-from django.db.models import Q
-from .models import LockPermission
+from locks.models import Lock_Group
+from .models import LockPermission, EffectiveLockAccess
+
+ACCESS_CACHE_ALIAS = "access"
+ACCESS_CACHE_GENERATION_KEY = "access:generation"
+
+
+def _access_cache_generation(cache):
+    """
+    Current generation of the access cache. Every cached decision is keyed
+    with it, so bumping the generation invalidates all decisions at once,
+    for every worker sharing the cache.
+    """
+    generation = cache.get(ACCESS_CACHE_GENERATION_KEY)
+    if generation is None:
+        # Clé absente (premier appel ou éviction) : on repart d'une valeur
+        # jamais utilisée pour ne pas retomber sur d'anciennes décisions.
+        cache.add(ACCESS_CACHE_GENERATION_KEY,
+                  time.time_ns(), timeout=None)
+        generation = cache.get(ACCESS_CACHE_GENERATION_KEY)
+    return generation
+
+
+def invalidate_access_cache():
+    """Drop every cached access decision (see permissions.signals)."""
+    cache = caches[ACCESS_CACHE_ALIAS]
+    try:
+        cache.incr(ACCESS_CACHE_GENERATION_KEY)
+    except ValueError:
+        _access_cache_generation(cache)
+
+
+def _access_windows(user, lock):
+    """
+    (start_date, end_date) of every permission granting `user` access to
+    `lock`, read from the flattened EffectiveLockAccess table.
+    """
+    return EffectiveLockAccess.objects.filter(
+        user=user, lock=lock
+    ).values_list("start_date", "end_date")
+
+
+def _evaluate_access(windows, now):
+    """
+    Returns (allowed, valid_until): whether one of the windows is open at
+    `now`, and the earliest upcoming start/end date after which the answer
+    may change (None if it never does).
+    """
+    allowed = False
+    valid_until = None
+
+    for start_date, end_date in windows:
+        # (Start is in the past OR Start is infinite) AND
+        # (End is in the future OR End is infinite)
+        if (start_date is None or start_date <= now) and (end_date is None or end_date >= now):
+            allowed = True
+
+        for boundary in (start_date, end_date):
+            if boundary is not None and boundary > now:
+                if valid_until is None or boundary < valid_until:
+                    valid_until = boundary
+
+    return allowed, valid_until
 
 
 def user_has_access_to_lock(user, lock):
@@ -11,33 +77,163 @@ def user_has_access_to_lock(user, lock):
     1. Structural match: User/Group <-> Lock/LockGroup
     2. Temporal match: Current time must be within start_date and end_date
        (if they exist).
-    """
 
-    # 1. Get the current server time
+    Decisions are cached per (user, lock) until the next start/end date of
+    the matching permissions, so repeated swipes do not hit the database.
+    """
     now = timezone.now()
+    cache = caches[ACCESS_CACHE_ALIAS]
+    cache_key = f"access:{_access_cache_generation(cache)}:{user.pk}:{lock.pk}"
+
+    cached = cache.get(cache_key)
+    if cached is not None:
+        allowed, valid_until = cached
+        if valid_until is None or now < valid_until:
+            return allowed
+
+    allowed, valid_until = _evaluate_access(_access_windows(user, lock), now)
+
+    timeout = cache.default_timeout
+    if valid_until is not None:
+        timeout = min(timeout, max(1, int((valid_until - now).total_seconds()) + 1))
+    cache.set(cache_key, (allowed, valid_until), timeout=timeout)
+
+    return allowed
+
 
-    user_groups = user.groups.all()
-    lock_groups = lock.groups.all()
+# --- EffectiveLockAccess maintenance ---
 
-    # 2. Define the structural access patterns (Who matches What)
-    # This remains the same as your original code
-    structural_conditions = (
-        Q(user=user, lock=lock) |
-        Q(group__in=user_groups, lock=lock) |
-        Q(user=user, lock_group__in=lock_groups) |
-        Q(group__in=user_groups, lock_group__in=lock_groups)
+def _create_effective_accesses(permissions, user_ids=None, lock_ids=None):
+    """
+    Expand `permissions` into EffectiveLockAccess rows, optionally restricted
+    to some users and/or locks. Group and lock group memberships are loaded
+    with one query each, whatever the number of permissions.
+    """
+    permissions = list(permissions)
+    if not permissions:
+        return 0
+
+    group_ids = {p.group_id for p in permissions if p.group_id}
+    lock_group_ids = {p.lock_group_id for p in permissions if p.lock_group_id}
+
+    members = defaultdict(list)
+    if group_ids:
+        memberships = User.groups.through.objects.filter(group_id__in=group_ids)
+        if user_ids is not None:
+            memberships = memberships.filter(user_id__in=user_ids)
+        for group_id, user_id in memberships.values_list("group_id", "user_id"):
+            members[group_id].append(user_id)
+
+    group_locks = defaultdict(list)
+    if lock_group_ids:
+        memberships = Lock_Group.locks.through.objects.filter(
+            lock_group_id__in=lock_group_ids)
+        if lock_ids is not None:
+            memberships = memberships.filter(lock_id__in=lock_ids)
+        for lock_group_id, lock_id in memberships.values_list("lock_group_id", "lock_id"):
+            group_locks[lock_group_id].append(lock_id)
+
+    rows = []
+    for permission in permissions:
+        users = [permission.user_id] if permission.user_id else members[permission.group_id]
+        locks = [permission.lock_id] if permission.lock_id else group_locks[permission.lock_group_id]
+
+        if user_ids is not None:
+            users = [u for u in users if u in user_ids]
+        if lock_ids is not None:
+            locks = [l for l in locks if l in lock_ids]
+
+        rows.extend(
+            EffectiveLockAccess(
+                permission_id=permission.pk,
+                user_id=user_id,
+                lock_id=lock_id,
+                start_date=permission.start_date,
+                end_date=permission.end_date,
+            )
+            for user_id in users
+            for lock_id in locks
+        )
+
+    EffectiveLockAccess.objects.bulk_create(
+        rows, batch_size=1000, ignore_conflicts=True)
+    return len(rows)
+
+
+def refresh_effective_access_for_permissions(permissions):
+    """Recompute the flattened rows of the given LockPermission objects."""
+    permissions = list(permissions)
+    EffectiveLockAccess.objects.filter(permission__in=permissions).delete()
+    _create_effective_accesses(permissions)
+
+
+def grant_group_memberships(group_ids, user_ids):
+    """Users `user_ids` just joined groups `group_ids`."""
+    _create_effective_accesses(
+        LockPermission.objects.filter(group_id__in=group_ids),
+        user_ids=set(user_ids),
     )
 
-    # 3. Define the temporal validity (When is it valid)
-    # Logic:
-    # (Start is in the past OR Start is infinite) AND (End is in the future OR End is infinite)
-    temporal_conditions = (
-        (Q(start_date__lte=now) | Q(start_date__isnull=True)) &
-        (Q(end_date__gte=now) | Q(end_date__isnull=True))
+
+def revoke_group_memberships(group_ids, user_ids):
+    """Users `user_ids` just left groups `group_ids`."""
+    EffectiveLockAccess.objects.filter(
+        permission__group_id__in=group_ids, user_id__in=user_ids
+    ).delete()
+
+
+def grant_lock_group_memberships(lock_group_ids, lock_ids):
+    """Locks `lock_ids` were just added to lock groups `lock_group_ids`."""
+    _create_effective_accesses(
+        LockPermission.objects.filter(lock_group_id__in=lock_group_ids),
+        lock_ids=set(lock_ids),
     )
 
-    # 4. Combine both conditions
-    # The permission must match the structure AND be valid right now
-    return LockPermission.objects.filter(
-        structural_conditions & temporal_conditions
-    ).exists()
+
+def revoke_lock_group_memberships(lock_group_ids, lock_ids):
+    """Locks `lock_ids` were just removed from lock groups `lock_group_ids`."""
+    EffectiveLockAccess.objects.filter(
+        permission__lock_group_id__in=lock_group_ids, lock_id__in=lock_ids
+    ).delete()
+
+
+def rebuild_effective_access():
+    """
+    Rebuild the whole EffectiveLockAccess table from LockPermission in a
+    single INSERT ... SELECT. Returns the number of rows created.
+    """
+    access_table = EffectiveLockAccess._meta.db_table
+    permission_table = LockPermission._meta.db_table
+    user_groups_table = User.groups.through._meta.db_table
+    group_locks_table = Lock_Group.locks.through._meta.db_table
+
+    sql = f"""
+        INSERT INTO {access_table} (permission_id, user_id, lock_id, start_date, end_date)
+        SELECT p.id, p.user_id, p.lock_id, p.start_date, p.end_date
+        FROM {permission_table} p
+        WHERE p.user_id IS NOT NULL AND p.lock_id IS NOT NULL
+        UNION ALL
+        SELECT p.id, p.user_id, gl.lock_id, p.start_date, p.end_date
+        FROM {permission_table} p
+        JOIN {group_locks_table} gl ON gl.lock_group_id = p.lock_group_id
+        WHERE p.user_id IS NOT NULL
+        UNION ALL
+        SELECT p.id, ug.user_id, p.lock_id, p.start_date, p.end_date
+        FROM {permission_table} p
+        JOIN {user_groups_table} ug ON ug.group_id = p.group_id
+        WHERE p.lock_id IS NOT NULL
+        UNION ALL
+        SELECT p.id, ug.user_id, gl.lock_id, p.start_date, p.end_date
+        FROM {permission_table} p
+        JOIN {user_groups_table} ug ON ug.group_id = p.group_id
+        JOIN {group_locks_table} gl ON gl.lock_group_id = p.lock_group_id
+    """
+
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {access_table}")
+            cursor.execute(sql)
+            created = cursor.rowcount
+
+    invalidate_access_cache()
+    return created
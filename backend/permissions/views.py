@@ -1,9 +1,15 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
+from rest_framework.permissions import AllowAny
+from django.http import HttpResponse
 from django.contrib.auth.models import User, Group
+from django.shortcuts import get_object_or_404
+from django.db.models import Q
+from django.utils import timezone
 from locks.models import Lock, Lock_Group
-from .models import LockPermission
+from .models import LockPermission, EffectiveLockAccess, LockAccessList
 from .serializers import LockPermissionSerializer
+from .access_lists import access_lists_enabled, build_bundle, verify_request
 from django.db import transaction
 from django.core.exceptions import ObjectDoesNotExist
 
@@ -230,3 +236,99 @@ class LockPermissionView(APIView):
             "message": success_message,
             "details": results
         }, status=status_code)
+
+
+class LockAccessView(APIView):
+    """
+    Who can open this door: users with an effective access to a lock,
+    whether granted directly or through a user group / lock group.
+
+    Query parameters:
+    - active: 'true' to only return accesses valid right now
+    """
+
+    def get(self, request, lock_id):
+        user = request.user
+
+        if not (user.is_authenticated and user.is_staff):
+            return Response(
+                {"error": "Unauthorized to fetch lock access"},
+                status=401
+            )
+
+        lock = get_object_or_404(Lock, id_lock=lock_id)
+        accesses = EffectiveLockAccess.objects.filter(lock=lock)
+
+        if request.query_params.get('active') == 'true':
+            now = timezone.now()
+            accesses = accesses.filter(
+                (Q(start_date__lte=now) | Q(start_date__isnull=True)) &
+                (Q(end_date__gte=now) | Q(end_date__isnull=True))
+            )
+
+        accesses = accesses.order_by('user__username', 'start_date').values(
+            'user_id', 'user__username', 'permission_id', 'start_date', 'end_date'
+        )
+
+        return Response({
+            "lock": lock.name,
+            "accesses": [
+                {
+                    "user": access['user_id'],
+                    "username": access['user__username'],
+                    "permission": access['permission_id'],
+                    "start_date": access['start_date'],
+                    "end_date": access['end_date'],
+                }
+                for access in accesses
+            ]
+        }, status=200)
+
+
+class LockAccessListView(APIView):
+    """
+    Access list of a lock, for offline decisions (see
+    permissions.access_lists). Returns a signed binary bundle with the
+    changes since the lock's version, or 204 when it is up to date. The
+    list is the one last compiled by the compile_access_lists command.
+
+    Query parameters:
+    - since: version the lock currently has (0 or absent: full list)
+
+    Headers (the request must come from the lock itself):
+    - X-Lock-Timestamp: epoch seconds, within ACCESS_LIST_MAX_CLOCK_SKEW
+    - X-Lock-Signature: access_lists.request_signature of the lock id,
+      since and timestamp
+    """
+    # Pas de session : la serrure s'authentifie par la signature de sa requête
+    authentication_classes = []
+    permission_classes = [AllowAny]
+
+    def get(self, request, lock_id):
+        if not access_lists_enabled():
+            return Response({"error": "Offline access lists are not configured"}, status=503)
+
+        try:
+            since = int(request.query_params.get('since') or 0)
+        except ValueError:
+            return Response({"error": "since must be an integer"}, status=400)
+        if since < 0:
+            return Response({"error": "since must be an integer"}, status=400)
+
+        if not verify_request(
+            lock_id, since,
+            request.headers.get('X-Lock-Timestamp'), request.headers.get('X-Lock-Signature'),
+        ):
+            return Response({"error": "Invalid or expired lock signature"}, status=401)
+
+        lock = get_object_or_404(Lock, id_lock=lock_id)
+        # Pas encore compilée : liste vide en version 0
+        access_list = LockAccessList.objects.filter(lock=lock).first() or LockAccessList(lock=lock)
+
+        if since == access_list.version:
+            response = HttpResponse(status=204)
+        else:
+            response = HttpResponse(
+                build_bundle(access_list, since), content_type='application/octet-stream')
+        response['X-Access-List-Version'] = str(access_list.version)
+        return response
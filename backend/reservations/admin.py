@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Reservation
+from .models import Reservation, ReservationSeries
 
 # On crée une classe de configuration pour l'admin
 class ReservationAdmin(admin.ModelAdmin):
@@ -26,5 +26,6 @@ class ReservationAdmin(admin.ModelAdmin):
 
 # On enregistre le modèle Reservation avec sa configuration personnalisée
 admin.site.register(Reservation, ReservationAdmin)
+admin.site.register(ReservationSeries)
 
 # Register your models here.
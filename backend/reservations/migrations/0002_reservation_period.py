@@ -0,0 +1,53 @@
+# Generated by Django 6.0 on 2026-10-17 19:41
+
+import django.contrib.postgres.constraints
+import django.contrib.postgres.fields.ranges
+import django.db.models.expressions
+from django.db import migrations, models
+
+
+# Chevauchements approuvés passés entre deux vérifications concurrentes : la
+# contrainte ne peut pas être créée tant qu'il en reste. En repasser un en
+# attente laisserait sa permission (LockPermission) ouverte, donc on s'arrête
+# et on les liste : rejeter une réservation de chaque paire, puis relancer.
+APPROVED_OVERLAPS = """
+    SELECT earlier.id, later.id, later.lock_id
+    FROM reservations_reservation AS later
+    JOIN reservations_reservation AS earlier
+      ON earlier.lock_id = later.lock_id
+     AND earlier.id < later.id
+     AND earlier.period && later.period
+    WHERE earlier.status = 'approved' AND later.status = 'approved'
+    ORDER BY later.lock_id, earlier.id, later.id
+"""
+
+
+def refuse_approved_overlaps(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(APPROVED_OVERLAPS)
+        overlaps = cursor.fetchall()
+    if overlaps:
+        pairs = ", ".join(f"{earlier}/{later} (lock {lock})" for earlier, later, lock in overlaps)
+        raise RuntimeError(
+            "Approved reservations overlap, reject one reservation of each pair "
+            f"before migrating: {pairs}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservations', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reservation',
+            name='period',
+            field=models.GeneratedField(db_persist=True, expression=models.Func(models.Func(models.Value('UTC'), models.ExpressionWrapper(django.db.models.expressions.CombinedExpression(models.F('date'), '+', models.F('start_time')), output_field=models.DateTimeField()), function='timezone', output_field=models.DateTimeField()), models.Func(models.Func(models.Value('UTC'), models.ExpressionWrapper(django.db.models.expressions.CombinedExpression(models.F('date'), '+', models.F('start_time')), output_field=models.DateTimeField()), function='timezone', output_field=models.DateTimeField()), models.Func(models.Value('UTC'), models.ExpressionWrapper(django.db.models.expressions.CombinedExpression(models.F('date'), '+', models.F('end_time')), output_field=models.DateTimeField()), function='timezone', output_field=models.DateTimeField()), function='GREATEST', output_field=models.DateTimeField()), models.Value('[)'), function='tstzrange', output_field=django.contrib.postgres.fields.ranges.DateTimeRangeField()), output_field=django.contrib.postgres.fields.ranges.DateTimeRangeField()),
+        ),
+        migrations.RunPython(refuse_approved_overlaps, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='reservation',
+            constraint=django.contrib.postgres.constraints.ExclusionConstraint(condition=models.Q(('status', 'approved')), expressions=[(models.Func(models.F('lock'), models.F('lock'), models.Value('[]'), function='int4range', output_field=django.contrib.postgres.fields.ranges.IntegerRangeField()), '='), ('period', '&&')], name='exclude_overlapping_approved_reservations'),
+        ),
+    ]
@@ -1,5 +1,60 @@
 from django.db import models
 from django.conf import settings
+from django.contrib.postgres.constraints import ExclusionConstraint
+from django.contrib.postgres.fields import DateTimeRangeField, IntegerRangeField, RangeOperators
+from django.db.models import ExpressionWrapper, F, Func, Q, Value
+
+
+def _utc_datetime(date_field, time_field):
+    # date + heure (timestamp sans fuseau) interprétée en UTC, comme make_aware (TIME_ZONE = 'UTC')
+    return Func(
+        Value('UTC'),
+        ExpressionWrapper(F(date_field) + F(time_field), output_field=models.DateTimeField()),
+        function='timezone',
+        output_field=models.DateTimeField(),
+    )
+
+
+class ReservationSeries(models.Model):
+    """
+    Réservation récurrente (ex: un cours chaque semaine du semestre),
+    développée en une Reservation par occurrence (voir reservations.utils).
+    """
+
+    FREQUENCY_CHOICES = [
+        ('daily', 'Quotidienne'),
+        ('weekly', 'Hebdomadaire'),
+    ]
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="reservation_series"
+    )
+    lock = models.ForeignKey(
+        'locks.Lock',
+        on_delete=models.CASCADE,
+        related_name="reservation_series"
+    )
+
+    frequency = models.CharField(max_length=10, choices=FREQUENCY_CHOICES)
+    # Tous les `interval` jours / semaines
+    interval = models.PositiveSmallIntegerField(default=1)
+
+    # Première occurrence, puis fin de la série : date OU nombre d'occurrences
+    start_date = models.DateField()
+    until = models.DateField(blank=True, null=True)
+    count = models.PositiveSmallIntegerField(blank=True, null=True)
+
+    start_time = models.TimeField()
+    end_time = models.TimeField()
+
+    notes = models.TextField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.user.username} - {self.lock.name} ({self.frequency} from {self.start_date})"
+
 
 class Reservation(models.Model):
     
@@ -21,6 +76,15 @@ class Reservation(models.Model):
         related_name="reservations"
     )
 
+    # Série dont la réservation est une occurrence
+    series = models.ForeignKey(
+        ReservationSeries,
+        on_delete=models.CASCADE,
+        blank=True,
+        null=True,
+        related_name="occurrences"
+    )
+
     # --- Détails de la réservation ---
     
     # Le jour de la réservation
@@ -32,6 +96,22 @@ class Reservation(models.Model):
     # L'heure de fin (ex: 15:30)
     end_time = models.TimeField()
     
+    # Créneau [début, fin) calculé par PostgreSQL à partir de date / heures :
+    # c'est sur lui que porte la contrainte d'exclusion (voir Meta). Une fin
+    # avant le début (anciennes lignes) donne un créneau vide.
+    period = models.GeneratedField(
+        expression=Func(
+            _utc_datetime('date', 'start_time'),
+            Func(_utc_datetime('date', 'start_time'), _utc_datetime('date', 'end_time'),
+                 function='GREATEST', output_field=models.DateTimeField()),
+            Value('[)'),
+            function='tstzrange',
+            output_field=DateTimeRangeField(),
+        ),
+        output_field=DateTimeRangeField(),
+        db_persist=True,
+    )
+
     # Le statut (contrôlé par l'admin)
     status = models.CharField(
         max_length=10, 
@@ -57,6 +137,22 @@ class Reservation(models.Model):
         
         unique_together = ('lock', 'date', 'start_time')
 
+        constraints = [
+            # Deux réservations approuvées d'une même salle ne se chevauchent
+            # jamais, même approuvées en même temps. La serrure est comparée
+            # comme intervalle [id, id] : l'opérateur = des ranges est indexable
+            # en GiST sans l'extension btree_gist.
+            ExclusionConstraint(
+                name='exclude_overlapping_approved_reservations',
+                expressions=[
+                    (Func(F('lock'), F('lock'), Value('[]'), function='int4range',
+                          output_field=IntegerRangeField()), RangeOperators.EQUAL),
+                    ('period', RangeOperators.OVERLAPS),
+                ],
+                condition=Q(status='approved'),
+            ),
+        ]
+
     def __str__(self):
         # Pour un affichage clair dans l'admin Django
         return f"{self.user.username} - {self.lock.name} ({self.date} {self.start_time}) - [{self.status}]"
\ No newline at end of file
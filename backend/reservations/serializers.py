@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import Reservation
+from .models import Reservation, ReservationSeries
 # On a besoin des serializers de User et Lock pour les afficher
 from users.serializers import UserSerializer
 from locks.serializers import LockSerializer 
@@ -32,4 +32,39 @@ class CreateReservationSerializer(serializers.ModelSerializer):
     class Meta:
         model = Reservation
         # L'utilisateur n'envoie que ces champs
-        fields = ['lock', 'date', 'start_time', 'end_time', 'notes']
\ No newline at end of file
+        fields = ['lock', 'date', 'start_time', 'end_time', 'notes']
+
+    def validate(self, data):
+        if data['end_time'] <= data['start_time']:
+            raise serializers.ValidationError({"end_time": "End time must be after start time."})
+        return data
+
+
+class ReservationSeriesSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ReservationSeries
+        fields = [
+            'id',
+            'lock',
+            'frequency',
+            'interval',
+            'start_date',
+            'until',
+            'count',
+            'start_time',
+            'end_time',
+            'notes',
+            'created_at',
+        ]
+        read_only_fields = ['created_at']
+
+    def validate(self, data):
+        if (data.get('until') is None) == (data.get('count') is None):
+            raise serializers.ValidationError("Exactly one of 'until' and 'count' must be set.")
+        if data.get('until') is not None and data['until'] < data['start_date']:
+            raise serializers.ValidationError({"until": "Must not be before start_date."})
+        if data.get('interval', 1) < 1:
+            raise serializers.ValidationError({"interval": "Must be at least 1."})
+        if data['end_time'] <= data['start_time']:
+            raise serializers.ValidationError({"end_time": "End time must be after start time."})
+        return data
@@ -1,3 +1,374 @@
-from django.test import TestCase
+import importlib
+import threading
+from datetime import date, time, timedelta
+from types import SimpleNamespace
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+from rest_framework.test import APIClient
+from locks.models import Lock
+from permissions.models import LockPermission
+from .models import Reservation
+from .utils import free_intervals, reservation_bounds, series_dates, sweep_approvals
+from permissions.models import EffectiveLockAccess
+from permissions.utils import user_has_access_to_lock
 
-# Create your tests here.
+
+class ReservationConflictTests(TestCase):
+    """
+    Chevauchements de réservations, refusés par la contrainte d'exclusion.
+    """
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser('resa_admin', 'admin@test.com', 'pw')
+        self.user = User.objects.create_user('resa_user', password='pw')
+        self.lock = Lock.objects.create(name='Salle 1', is_reservable=True)
+        self.day = date.today() + timedelta(days=1)
+        self.client = APIClient()
+
+    def _reservation(self, start, end, status='pending', lock=None):
+        return Reservation.objects.create(
+            user=self.user, lock=lock or self.lock, date=self.day,
+            start_time=time(start), end_time=time(end), status=status)
+
+    def _approve(self, reservation):
+        self.client.force_authenticate(user=self.admin)
+        return self.client.patch(
+            f'/reservations/{reservation.id}/status/', {'status': 'approved'}, format='json')
+
+    def test_approving_overlap_is_refused(self):
+        first = self._reservation(10, 12)
+        second = self._reservation(11, 13)
+        adjacent = self._reservation(12, 14)
+
+        self.assertEqual(self._approve(first).status_code, status.HTTP_200_OK)
+        self.assertEqual(self._approve(second).status_code, status.HTTP_409_CONFLICT)
+        # [10h, 12h) et [12h, 14h) ne se chevauchent pas
+        self.assertEqual(self._approve(adjacent).status_code, status.HTTP_200_OK)
+
+        second.refresh_from_db()
+        self.assertEqual(second.status, 'pending')
+        self.assertEqual(LockPermission.objects.filter(user=self.user).count(), 2)
+
+    def test_rejecting_removes_permission(self):
+        reservation = self._reservation(10, 12)
+        self._approve(reservation)
+        response = self.client.patch(
+            f'/reservations/{reservation.id}/status/', {'status': 'rejected'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(LockPermission.objects.filter(user=self.user).exists())
+
+    def test_rejecting_keeps_hand_granted_permission(self):
+        # Permission donnée à la main sur la même fenêtre, sans lien avec la réservation
+        reservation = self._reservation(10, 12, status='approved')
+        start, end = reservation_bounds(self.day, time(10), time(12))
+        hand_granted = LockPermission.objects.create(
+            user=self.user, lock=self.lock, start_date=start, end_date=end)
+
+        self.client.force_authenticate(user=self.admin)
+        response = self.client.patch(
+            f'/reservations/{reservation.id}/status/', {'status': 'rejected'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(LockPermission.objects.filter(id=hand_granted.id).exists())
+        self.assertTrue(EffectiveLockAccess.objects.filter(permission=hand_granted).exists())
+
+    def test_approving_twice_grants_one_permission(self):
+        reservation = self._reservation(10, 12)
+        self._approve(reservation)
+        self.assertEqual(self._approve(reservation).status_code, status.HTTP_200_OK)
+        self.assertEqual(list(LockPermission.objects.values_list('reservation', flat=True)), [reservation.id])
+
+    def test_migration_refuses_existing_overlaps(self):
+        migration = importlib.import_module('reservations.migrations.0002_reservation_period')
+        schema_editor = SimpleNamespace(connection=connection)
+        # Chevauchement antérieur à la contrainte (supprimée le temps du test)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "ALTER TABLE reservations_reservation "
+                "DROP CONSTRAINT exclude_overlapping_approved_reservations")
+        first = self._reservation(10, 12, status='approved')
+        second = self._reservation(11, 13, status='approved')
+        self._reservation(12, 14, status='pending')
+
+        with self.assertRaisesMessage(RuntimeError, f"{first.id}/{second.id} (lock {self.lock.id_lock})"):
+            migration.refuse_approved_overlaps(None, schema_editor)
+
+        second.status = 'rejected'
+        second.save()
+        migration.refuse_approved_overlaps(None, schema_editor)
+
+    def test_request_on_approved_slot_is_refused(self):
+        self._reservation(10, 12, status='approved')
+        self.client.force_authenticate(user=self.user)
+        data = {'lock': self.lock.id_lock, 'date': self.day, 'start_time': '11:30', 'end_time': '12:30'}
+
+        response = self.client.post('/reservations/', data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+        data['start_time'], data['end_time'] = '15:00', '14:00'
+        response = self.client.post('/reservations/', data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class AvailabilityTests(TestCase):
+    """
+    Créneaux libres des salles réservables, calculés en une requête.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user('dispo_user', password='pw')
+        self.room_a = Lock.objects.create(name='Salle A', is_reservable=True)
+        self.room_b = Lock.objects.create(name='Salle B', is_reservable=True)
+        Lock.objects.create(name='Porte', is_reservable=False)
+        self.day = date.today() + timedelta(days=1)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def _reservation(self, lock, start, end, status='pending'):
+        Reservation.objects.create(
+            user=self.user, lock=lock, date=self.day,
+            start_time=time(*start), end_time=time(*end), status=status)
+
+    def test_free_intervals_merges_overlapping_busy(self):
+        busy = [(1, 3), (2, 5), (5, 6), (8, 9), (12, 15)]
+        self.assertEqual(free_intervals(busy, 0, 10), [(0, 1), (6, 8), (9, 10)])
+        self.assertEqual(free_intervals([], 0, 10), [(0, 10)])
+        self.assertEqual(free_intervals([(0, 10)], 2, 4), [])
+
+    def test_availability_per_room(self):
+        self._reservation(self.room_a, (9,), (10,), status='approved')
+        self._reservation(self.room_a, (9, 30), (11,))
+        self._reservation(self.room_a, (14,), (14, 20))
+        self._reservation(self.room_a, (16,), (17,), status='rejected')
+        start, end = reservation_bounds(self.day, time(8), time(18))
+
+        # salles + réservations
+        with self.assertNumQueries(2):
+            response = self.client.get('/reservations/availability/', {
+                'start': start.isoformat().replace('+00:00', 'Z'),
+                'end': end.isoformat().replace('+00:00', 'Z'),
+                'min_duration': 30,
+            })
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        rooms = {room['name']: room['free'] for room in response.data['locks']}
+        self.assertEqual(set(rooms), {'Salle A', 'Salle B'})
+        self.assertEqual(
+            [(slot['start'].hour, slot['end'].hour) for slot in rooms['Salle A']],
+            [(8, 9), (11, 14), (14, 18)])
+        self.assertEqual(rooms['Salle B'], [{'start': start, 'end': end}])
+
+    def test_invalid_range(self):
+        response = self.client.get('/reservations/availability/', {
+            'start': '2026-01-01T10:00:00Z', 'end': '2026-03-01T10:00:00Z'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ReservationSeriesTests(TestCase):
+    """
+    Réservations récurrentes : développement, conflits et permissions en bloc.
+    """
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser('serie_admin', 'admin@test.com', 'pw')
+        self.user = User.objects.create_user('serie_user', password='pw')
+        self.lock = Lock.objects.create(name='Amphi', is_reservable=True)
+        self.monday = date(2030, 1, 7)
+        self.client = APIClient()
+
+    def _series(self, user, **data):
+        self.client.force_authenticate(user=user)
+        payload = {
+            'lock': self.lock.id_lock, 'frequency': 'weekly', 'start_date': self.monday,
+            'start_time': '08:00', 'end_time': '10:00', **data,
+        }
+        return self.client.post('/reservations/series/', payload, format='json')
+
+    def test_series_dates(self):
+        self.assertEqual(
+            series_dates('weekly', 2, self.monday, count=3),
+            [self.monday, date(2030, 1, 21), date(2030, 2, 4)])
+        self.assertEqual(len(series_dates('daily', 1, self.monday, until=date(2030, 1, 13))), 7)
+        with self.assertRaises(ValueError):
+            series_dates('daily', 1, self.monday, until=date(2032, 1, 1))
+
+    def test_admin_series_is_approved_with_permissions(self):
+        response = self._series(self.admin, count=15)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.data['occurrences']), 15)
+        self.assertEqual(Reservation.objects.filter(status='approved', series__isnull=False).count(), 15)
+        self.assertEqual(LockPermission.objects.filter(user=self.admin).count(), 15)
+        self.assertEqual(EffectiveLockAccess.objects.filter(user=self.admin, lock=self.lock).count(), 15)
+
+    def test_user_series_is_pending(self):
+        response = self._series(self.user, frequency='daily', until=date(2030, 1, 11))
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Reservation.objects.filter(status='pending').count(), 5)
+        self.assertFalse(LockPermission.objects.exists())
+        self.assertFalse(user_has_access_to_lock(self.user, self.lock))
+
+    def test_conflicting_series_creates_nothing(self):
+        Reservation.objects.create(
+            user=self.user, lock=self.lock, date=date(2030, 1, 21),
+            start_time=time(9), end_time=time(11), status='approved')
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self._series(self.user, count=10)
+        # Une seule requête pour vérifier les 10 occurrences
+        checks = [q for q in queries if q['sql'].startswith('SELECT') and 'reservations_reservation"' in q['sql']]
+        self.assertEqual(len(checks), 1)
+
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response.data['dates'], [date(2030, 1, 21)])
+        self.assertEqual(Reservation.objects.count(), 1)
+
+    def test_series_over_rejected_slot_conflicts(self):
+        # unique_together (lock, date, start_time) couvre aussi les refusées
+        Reservation.objects.create(
+            user=self.user, lock=self.lock, date=date(2030, 1, 14),
+            start_time=time(8), end_time=time(9), status='rejected')
+
+        response = self._series(self.user, count=3)
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response.data['dates'], [date(2030, 1, 14)])
+        self.assertEqual(Reservation.objects.count(), 1)
+
+    def test_series_overlapping_permission_creates_nothing(self):
+        # Permission permanente donnée à la main : LockPermission.clean refuserait les créneaux
+        LockPermission.objects.create(user=self.admin, lock=self.lock)
+
+        response = self._series(self.admin, count=3)
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertFalse(Reservation.objects.exists())
+        self.assertEqual(LockPermission.objects.count(), 1)
+
+    def test_series_validation(self):
+        response = self._series(self.user, count=3, until=date(2030, 2, 1))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self._series(self.user, frequency='daily', until=date(2031, 6, 1))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class BulkReservationStatusTests(TestCase):
+    """
+    Approbation / refus groupés, avec résolution des conflits du lot.
+    """
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser('lot_admin', 'admin@test.com', 'pw')
+        self.user = User.objects.create_user('lot_user', password='pw')
+        self.room_a = Lock.objects.create(name='Salle A', is_reservable=True)
+        self.room_b = Lock.objects.create(name='Salle B', is_reservable=True)
+        self.day = date.today() + timedelta(days=1)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.admin)
+
+    def _reservation(self, lock, start, end, status='pending'):
+        return Reservation.objects.create(
+            user=self.user, lock=lock, date=self.day,
+            start_time=time(start), end_time=time(end), status=status)
+
+    def test_sweep_approvals(self):
+        candidates = [(1, 'a', 0, 2), (2, 'a', 1, 3), (3, 'a', 2, 4), (4, 'a', 5, 9), (5, 'b', 1, 3)]
+        approved = [('a', 6, 7), ('b', 3, 4)]
+        self.assertEqual(sweep_approvals(candidates, approved), ([1, 3, 5], [2, 4]))
+
+    def test_bulk_approve_and_reject(self):
+        approved = self._reservation(self.room_a, 8, 9, status='approved')
+        LockPermission.objects.create(
+            user=self.user, lock=self.room_a, start_date=reservation_bounds(self.day, time(8), time(9))[0],
+            end_date=reservation_bounds(self.day, time(8), time(9))[1], reservation=approved)
+        first = self._reservation(self.room_a, 10, 12)
+        overlapping = self._reservation(self.room_a, 11, 13)
+        other_room = self._reservation(self.room_b, 11, 13)
+        # Chevauche `approved`, libéré par le refus du même lot
+        freed = self._reservation(self.room_a, 7, 9)
+
+        response = self.client.post('/reservations/status/', {
+            'approve': [first.id, overlapping.id, other_room.id, freed.id, 999999],
+            'reject': [approved.id],
+        }, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['approved'], sorted([first.id, other_room.id, freed.id]))
+        self.assertEqual(response.data['rejected'], [approved.id])
+        self.assertEqual(response.data['conflicts'], [overlapping.id])
+        self.assertEqual(response.data['missing'], [999999])
+
+        statuses = dict(Reservation.objects.values_list('id', 'status'))
+        self.assertEqual(statuses[overlapping.id], 'pending')
+        self.assertEqual(statuses[approved.id], 'rejected')
+        self.assertEqual(LockPermission.objects.filter(user=self.user).count(), 3)
+        self.assertEqual(EffectiveLockAccess.objects.filter(user=self.user).count(), 3)
+
+    def test_bulk_approve_overlapping_permission_stays_pending(self):
+        start, end = reservation_bounds(self.day, time(9), time(11))
+        LockPermission.objects.create(user=self.user, lock=self.room_a, start_date=start, end_date=end)
+        blocked = self._reservation(self.room_a, 10, 12)
+        other_room = self._reservation(self.room_b, 10, 12)
+
+        response = self.client.post(
+            '/reservations/status/', {'approve': [blocked.id, other_room.id]}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['approved'], [other_room.id])
+        self.assertEqual(response.data['conflicts'], [blocked.id])
+        self.assertEqual(Reservation.objects.get(id=blocked.id).status, 'pending')
+        self.assertEqual(LockPermission.objects.filter(lock=self.room_a).count(), 1)
+
+    def test_bulk_reject_revokes_only_reservation_permissions(self):
+        reservation = self._reservation(self.room_a, 10, 12)
+        self.client.post('/reservations/status/', {'approve': [reservation.id]}, format='json')
+        hand_granted = LockPermission.objects.create(user=self.user, lock=self.room_b)
+        self.assertEqual(LockPermission.objects.get(lock=self.room_a).reservation, reservation)
+
+        response = self.client.post('/reservations/status/', {'reject': [reservation.id]}, format='json')
+        self.assertEqual(response.data['rejected'], [reservation.id])
+        self.assertEqual(list(LockPermission.objects.all()), [hand_granted])
+        self.assertEqual(list(EffectiveLockAccess.objects.values_list('lock', flat=True)), [self.room_b.id_lock])
+        self.assertFalse(user_has_access_to_lock(self.user, self.room_a))
+
+    def test_bulk_status_requires_admin(self):
+        self.client.force_authenticate(user=self.user)
+        response = self.client.post('/reservations/status/', {'approve': [1]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class ConcurrentApprovalTests(TransactionTestCase):
+    """Deux admins approuvent en même temps deux demandes qui se chevauchent."""
+
+    def test_only_one_overlapping_approval_wins(self):
+        admin = User.objects.create_superuser('resa_admin', 'admin@test.com', 'pw')
+        user = User.objects.create_user('resa_user', password='pw')
+        lock = Lock.objects.create(name='Salle 1', is_reservable=True)
+        day = date.today() + timedelta(days=1)
+        reservations = [
+            Reservation.objects.create(user=user, lock=lock, date=day, start_time=time(10), end_time=time(12)),
+            Reservation.objects.create(user=user, lock=lock, date=day, start_time=time(11), end_time=time(13)),
+        ]
+
+        barrier = threading.Barrier(2)
+        codes = []
+
+        def approve(reservation):
+            client = APIClient()
+            client.force_authenticate(user=admin)
+            barrier.wait()
+            try:
+                response = client.patch(
+                    f'/reservations/{reservation.id}/status/', {'status': 'approved'}, format='json')
+                codes.append(response.status_code)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=approve, args=(r,)) for r in reservations]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(codes), [status.HTTP_200_OK, status.HTTP_409_CONFLICT])
+        self.assertEqual(Reservation.objects.filter(status='approved').count(), 1)
+        self.assertEqual(LockPermission.objects.count(), 1)
@@ -3,12 +3,18 @@ from .views import (
     ReservationListView, 
     AllReservationsListView, 
     UpdateReservationStatusView,
-    AvailableLocksView  # <-- 1. Importer la nouvelle vue
+    AvailableLocksView,  # <-- 1. Importer la nouvelle vue
+    AvailabilityView,
+    ReservationSeriesView,
+    BulkReservationStatusView,
 )
 
 urlpatterns = [
     path('', ReservationListView.as_view(), name='reservation-list-create'),
+    path('series/', ReservationSeriesView.as_view(), name='reservation-series-create'),
     path('all/', AllReservationsListView.as_view(), name='all-reservations-list'),
     path('<int:reservation_id>/status/', UpdateReservationStatusView.as_view(), name='update-reservation-status'),
+    path('status/', BulkReservationStatusView.as_view(), name='bulk-reservation-status'),
     path('available/', AvailableLocksView.as_view(), name='available-locks'),
+    path('availability/', AvailabilityView.as_view(), name='availability'),
 ]
\ No newline at end of file
@@ -0,0 +1,388 @@
+from bisect import bisect_right
+from collections import defaultdict
+from datetime import datetime, timedelta
+from itertools import groupby
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.backends.postgresql.psycopg_any import DateTimeTZRange
+from django.utils import timezone
+from django.utils.timezone import make_aware
+from permissions.models import LockPermission
+from permissions.utils import refresh_effective_access_for_permissions, invalidate_access_cache
+from .models import Reservation
+
+# Nom de la contrainte d'exclusion de Reservation (voir models.py)
+CONFLICT_CONSTRAINT = 'exclude_overlapping_approved_reservations'
+
+# Occurrences maximum d'une ReservationSeries (un an de réservations quotidiennes)
+MAX_SERIES_OCCURRENCES = 366
+
+
+class ReservationConflict(Exception):
+    """Some occurrences of a series overlap existing reservations."""
+
+    def __init__(self, dates):
+        super().__init__(f"{len(dates)} occurrence(s) conflict with existing reservations")
+        self.dates = dates
+
+
+def reservation_bounds(date, start_time, end_time):
+    """Aware (start, end) datetimes of a slot, as stored in Reservation.period."""
+    return (
+        make_aware(datetime.combine(date, start_time)),
+        make_aware(datetime.combine(date, end_time)),
+    )
+
+
+def reservation_period(date, start_time, end_time):
+    return DateTimeTZRange(*reservation_bounds(date, start_time, end_time), bounds='[)')
+
+
+def approved_conflicts(lock_id, period, exclude_id=None):
+    """Approved reservations of `lock_id` overlapping `period`."""
+    conflicts = Reservation.objects.filter(
+        lock_id=lock_id, status='approved', period__overlap=period)
+    if exclude_id is not None:
+        conflicts = conflicts.exclude(id=exclude_id)
+    return conflicts
+
+
+def is_reservation_conflict(error):
+    """Whether IntegrityError `error` comes from the overlap exclusion constraint."""
+    cause = error.__cause__
+    return (
+        getattr(cause, 'pgcode', None) == '23P01'  # exclusion_violation
+        and getattr(getattr(cause, 'diag', None), 'constraint_name', None) == CONFLICT_CONSTRAINT
+    )
+
+
+def free_intervals(busy, start, end):
+    """
+    Gaps of [start, end) not covered by `busy`, a list of (start, end)
+    intervals sorted by start (they may overlap). Single pass: the busy
+    intervals are merged on the fly.
+    """
+    free = []
+    cursor = start
+    for busy_start, busy_end in busy:
+        if busy_end <= cursor:
+            continue
+        if busy_start >= end:
+            break
+        if busy_start > cursor:
+            free.append((cursor, busy_start))
+        cursor = max(cursor, busy_end)
+    if cursor < end:
+        free.append((cursor, end))
+    return free
+
+
+def compute_availability(lock_ids, start, end, min_duration=None):
+    """
+    {lock id: free (start, end) intervals within [start, end)} for
+    `lock_ids`, pending and approved reservations counting as busy (as in
+    AvailableLocksView). One query whatever the number of locks and
+    reservations; intervals shorter than `min_duration` are dropped.
+    """
+    reservations = Reservation.objects.filter(
+        lock_id__in=lock_ids,
+        status__in=['approved', 'pending'],
+        period__overlap=DateTimeTZRange(start, end, bounds='[)'),
+    ).exclude(period__isempty=True).order_by('lock_id', 'period').values_list('lock_id', 'period')
+
+    busy = {
+        lock_id: [(period.lower, period.upper) for _, period in rows]
+        for lock_id, rows in groupby(reservations.iterator(), key=lambda row: row[0])
+    }
+
+    availability = {}
+    for lock_id in lock_ids:
+        free = free_intervals(busy.get(lock_id, []), start, end)
+        if min_duration is not None:
+            free = [(lower, upper) for lower, upper in free if upper - lower >= min_duration]
+        availability[lock_id] = free
+    return availability
+
+
+# --- Réservations récurrentes ---
+
+def series_dates(frequency, interval, start_date, until=None, count=None):
+    """
+    Dates of the occurrences of a series, every `interval` days ('daily')
+    or weeks ('weekly') from `start_date`, up to `until` (included) or for
+    `count` occurrences. Raises ValueError past MAX_SERIES_OCCURRENCES.
+    """
+    step = timedelta(days=interval * (7 if frequency == 'weekly' else 1))
+    dates = []
+    day = start_date
+    while (count is None or len(dates) < count) and (until is None or day <= until):
+        if len(dates) == MAX_SERIES_OCCURRENCES:
+            raise ValueError(f"A series cannot have more than {MAX_SERIES_OCCURRENCES} occurrences.")
+        dates.append(day)
+        day += step
+    return dates
+
+
+def find_slot_conflicts(lock_id, slots):
+    """
+    Slots among `slots` ((date, start_time, end_time), sorted by date, one
+    per day at most) that overlap an approved reservation of `lock_id`, or
+    whose date and start time another reservation already holds, whatever
+    its status (unique_together also covers rejected reservations).
+
+    One query covering the dates of all the slots; each approved
+    reservation is then matched to the slots it overlaps by bisection.
+    """
+    if not slots:
+        return []
+    bounds = [reservation_bounds(*slot) for slot in slots]
+    starts = [start for start, _ in bounds]
+
+    existing = Reservation.objects.filter(
+        lock_id=lock_id,
+        date__range=(slots[0][0], slots[-1][0]),
+    ).values_list('date', 'start_time', 'status', 'period')
+
+    taken = {(date, start_time) for date, start_time, _, _ in existing}
+    conflicts = {index for index, slot in enumerate(slots) if slot[:2] in taken}
+    for _, _, status, period in existing:
+        if status != 'approved' or period.isempty:
+            continue
+        index = max(bisect_right(starts, period.lower) - 1, 0)
+        while index < len(slots) and bounds[index][0] < period.upper:
+            if bounds[index][1] > period.lower:
+                conflicts.add(index)
+            index += 1
+
+    return [slots[index][0] for index in sorted(conflicts)]
+
+
+def is_slot_taken(error):
+    """Whether IntegrityError `error` comes from Reservation's (lock, date, start_time) unique constraint."""
+    cause = error.__cause__
+    return (
+        getattr(cause, 'pgcode', None) == '23505'  # unique_violation
+        and getattr(getattr(cause, 'diag', None), 'table_name', None) == Reservation._meta.db_table
+    )
+
+
+def permission_overlaps(reservations):
+    """
+    Reservations among `reservations` whose permission window would overlap
+    an existing permission of the same user on the same lock, i.e. that
+    LockPermission.clean would refuse. One query whatever the number of
+    reservations.
+    """
+    if not reservations:
+        return []
+    existing = defaultdict(list)
+    for user_id, lock_id, start_date, end_date in LockPermission.objects.filter(
+        user_id__in={r.user_id for r in reservations},
+        lock_id__in={r.lock_id for r in reservations},
+    ).values_list('user_id', 'lock_id', 'start_date', 'end_date'):
+        existing[user_id, lock_id].append((start_date, end_date))
+
+    overlapping = []
+    for reservation in reservations:
+        start, end = reservation_bounds(
+            reservation.date, reservation.start_time, reservation.end_time)
+        # Même condition que LockPermission.clean (None = illimité)
+        if any(
+            (other_end is None or other_end > start) and (other_start is None or other_start < end)
+            for other_start, other_end in existing[reservation.user_id, reservation.lock_id]
+        ):
+            overlapping.append(reservation)
+    return overlapping
+
+
+def grant_reservation_permissions(reservations):
+    """
+    Create the LockPermission window of each approved reservation, linked
+    to it, with one INSERT. bulk_create skips LockPermission.save, so its
+    overlap check is applied here (permission_overlaps; windows of approved
+    reservations of a lock never overlap each other): raises
+    ValidationError, creating nothing, like save would. The signals are
+    skipped too, so the flattened accesses and the access cache are
+    refreshed here.
+    """
+    if not reservations:
+        return []
+    if permission_overlaps(reservations):
+        raise ValidationError(
+            "This permission overlaps with an existing time slot for this user/lock.")
+    permissions = []
+    for reservation in reservations:
+        start_date, end_date = reservation_bounds(
+            reservation.date, reservation.start_time, reservation.end_time)
+        permissions.append(LockPermission(
+            user_id=reservation.user_id,
+            lock_id=reservation.lock_id,
+            start_date=start_date,
+            end_date=end_date,
+            reservation=reservation,
+        ))
+    permissions = LockPermission.objects.bulk_create(permissions, batch_size=1000)
+    refresh_effective_access_for_permissions(permissions)
+    _invalidate_access()
+    return permissions
+
+
+def revoke_reservation_permissions(reservations):
+    """
+    Delete the permissions granted by `reservations` (LockPermission.reservation),
+    never a hand-granted one covering the same window. Goes through the ORM:
+    the EffectiveLockAccess rows follow by cascade and the delete signals
+    invalidate the access cache. Returns the number deleted.
+    """
+    if not reservations:
+        return 0
+    _, deleted = LockPermission.objects.filter(reservation__in=reservations).delete()
+    return deleted.get(LockPermission._meta.label, 0)
+
+
+def _invalidate_access():
+    # Comme permissions.signals : maintenant, et au commit pour les autres workers
+    invalidate_access_cache()
+    transaction.on_commit(invalidate_access_cache)
+
+
+def book_series(series, status):
+    """
+    Expand `series` (saved) into reservations with `status`, granting their
+    permissions when approved. Raises ReservationConflict, without creating
+    anything, if an occurrence conflicts with an existing reservation.
+    """
+    dates = series_dates(series.frequency, series.interval, series.start_date,
+                         until=series.until, count=series.count)
+    slots = [(date, series.start_time, series.end_time) for date in dates]
+
+    with transaction.atomic():
+        conflicts = find_slot_conflicts(series.lock_id, slots)
+        if conflicts:
+            raise ReservationConflict(conflicts)
+
+        reservations = Reservation.objects.bulk_create([
+            Reservation(
+                user_id=series.user_id,
+                lock_id=series.lock_id,
+                series=series,
+                date=date,
+                start_time=series.start_time,
+                end_time=series.end_time,
+                status=status,
+                notes=series.notes,
+            )
+            for date in dates
+        ], batch_size=1000)
+
+        if status == 'approved':
+            grant_reservation_permissions(reservations)
+    return reservations
+
+
+
+# --- Approbation groupée ---
+
+def sweep_approvals(candidates, approved):
+    """
+    Choose which `candidates` ((id, lock_id, start, end)) can be approved
+    together, given the already `approved` intervals ((lock_id, start,
+    end), non-overlapping per lock). Returns (accepted ids, conflicting ids).
+
+    Candidates overlapping an approved interval are dropped first
+    (bisection); the rest are swept per lock by start time, a candidate
+    being accepted when it starts after every accepted one has ended: among
+    overlapping candidates, the one starting first (then the oldest) wins.
+    """
+    approved_by_lock = defaultdict(list)
+    for lock_id, start, end in approved:
+        approved_by_lock[lock_id].append((start, end))
+    for intervals in approved_by_lock.values():
+        intervals.sort()
+
+    accepted, conflicts = [], []
+    busy_until = {}
+    for reservation_id, lock_id, start, end in sorted(candidates, key=lambda c: (c[1], c[2], c[0])):
+        if end <= start:  # créneau vide : ne chevauche rien
+            accepted.append(reservation_id)
+            continue
+
+        intervals = approved_by_lock[lock_id]
+        index = max(bisect_right(intervals, (start, end)) - 1, 0)
+        overlaps_approved = any(
+            other_start < end and other_end > start
+            for other_start, other_end in intervals[index:index + 2]
+        )
+        if overlaps_approved or (lock_id in busy_until and start < busy_until[lock_id]):
+            conflicts.append(reservation_id)
+        else:
+            accepted.append(reservation_id)
+            busy_until[lock_id] = end
+    return accepted, conflicts
+
+
+def update_reservation_statuses(approve_ids, reject_ids):
+    """
+    Approve and reject reservations in bulk, in one transaction: the rows
+    are locked, conflicts (with approved reservations and within the batch)
+    resolved by sweep_approvals, reservations whose permission would
+    overlap another permission of the user (permission_overlaps) left
+    pending with the conflicts, statuses changed with one UPDATE each and
+    permissions created / deleted in bulk. Returns the ids per outcome.
+    """
+    approve_ids, reject_ids = set(approve_ids), set(reject_ids) - set(approve_ids)
+
+    with transaction.atomic():
+        reservations = {
+            reservation.id: reservation
+            for reservation in Reservation.objects.select_for_update()
+            .filter(id__in=approve_ids | reject_ids).order_by('id')
+        }
+
+        to_reject = [reservations[i] for i in sorted(reject_ids & set(reservations))
+                     if reservations[i].status != 'rejected']
+        to_approve = [reservations[i] for i in sorted(approve_ids & set(reservations))
+                      if reservations[i].status != 'approved']
+
+        candidates = []
+        for reservation in to_approve:
+            start, end = reservation_bounds(
+                reservation.date, reservation.start_time, reservation.end_time)
+            candidates.append((reservation.id, reservation.lock_id, start, end))
+
+        approved = []
+        if candidates:
+            window = DateTimeTZRange(
+                min(c[2] for c in candidates), max(c[3] for c in candidates), bounds='[)')
+            approved = [
+                (lock_id, period.lower, period.upper)
+                for lock_id, period in Reservation.objects.filter(
+                    lock_id__in={c[1] for c in candidates},
+                    status='approved',
+                    period__overlap=window,
+                ).exclude(id__in=reject_ids).exclude(period__isempty=True).values_list('lock_id', 'period')
+            ]
+        accepted, conflicts = sweep_approvals(candidates, approved)
+        accepted = [reservations[i] for i in accepted]
+
+        now = timezone.now()
+        revoke_reservation_permissions([r for r in to_reject if r.status == 'approved'])
+        # Permission qui chevaucherait une autre permission de l'utilisateur
+        # sur la serrure (refusée par LockPermission.clean) : reste en attente
+        blocked = {r.id for r in permission_overlaps(accepted)}
+        accepted = [r for r in accepted if r.id not in blocked]
+        conflicts = sorted(set(conflicts) | blocked)
+        Reservation.objects.filter(id__in=[r.id for r in to_reject]).update(
+            status='rejected', updated_at=now)
+        Reservation.objects.filter(id__in=[r.id for r in accepted]).update(
+            status='approved', updated_at=now)
+        grant_reservation_permissions(accepted)
+
+    changed = {r.id for r in to_reject} | {r.id for r in accepted}
+    return {
+        "approved": sorted(r.id for r in accepted),
+        "rejected": sorted(r.id for r in to_reject),
+        "conflicts": sorted(conflicts),
+        "unchanged": sorted(set(reservations) - changed - set(conflicts)),
+        "missing": sorted((approve_ids | reject_ids) - set(reservations)),
+    }
@@ -3,9 +3,12 @@ from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from django.shortcuts import get_object_or_404
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
 from django.db.models import Q # <-- 1. Import Q pour les requêtes
-from django.utils.timezone import make_aware # Pour gérer les fuseaux horaires
-from datetime import datetime # Pour combiner date et heure
+from django.utils.dateparse import parse_datetime
+from django.utils.timezone import make_aware
+from datetime import timedelta
 
 # --- 2. CORRECTION DES IMPORTS ---
 from .models import Reservation  # Lock n'est pas ici
@@ -13,8 +16,17 @@ from locks.models import Lock    # Il faut l'importer de son app 'locks'
 from locks.serializers import LockSerializer # Importé pour la vue 'available'
 # -----------------------------------
 
-from .serializers import ReservationSerializer, CreateReservationSerializer
-from permissions.models import LockPermission
+from .serializers import ReservationSerializer, CreateReservationSerializer, ReservationSeriesSerializer
+from .utils import (
+    reservation_period, approved_conflicts, is_reservation_conflict, is_slot_taken,
+    compute_availability, book_series, ReservationConflict, update_reservation_statuses,
+    grant_reservation_permissions, revoke_reservation_permissions)
+
+# Réservations maximum par appel de BulkReservationStatusView
+MAX_STATUS_BATCH = 1000
+
+# Fenêtre maximale d'une recherche de disponibilités
+MAX_AVAILABILITY_RANGE = timedelta(days=31)
 
 
 class ReservationListView(APIView):
@@ -26,7 +38,8 @@ class ReservationListView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        reservations = Reservation.objects.filter(user=request.user)
+        reservations = Reservation.objects.filter(user=request.user).select_related(
+            'user__keypad_codes', 'user__badge_codes', 'lock__state')
         serializer = ReservationSerializer(reservations, many=True)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
@@ -35,37 +48,84 @@ class ReservationListView(APIView):
         if serializer.is_valid():
             # --- 3. UTILISER id_lock ---
             lock_id = serializer.validated_data['lock'].id_lock
-            date = serializer.validated_data['date']
-            start_time = serializer.validated_data['start_time']
-            end_time = serializer.validated_data['end_time']
-            
-            conflicts = Reservation.objects.filter(
-                lock_id=lock_id,
-                date=date,
-                status='approved'
-            ).filter(
-                Q(start_time__lt=end_time) & Q(end_time__gt=start_time)
+            period = reservation_period(
+                serializer.validated_data['date'],
+                serializer.validated_data['start_time'],
+                serializer.validated_data['end_time'],
             )
-            
-            if conflicts.exists():
+
+            # La demande reste en attente : la contrainte d'exclusion ne porte
+            # que sur les réservations approuvées, elle protège l'approbation
+            if approved_conflicts(lock_id, period).exists():
                 return Response(
                     {"error": "This time slot is already booked and approved."},
                     status=status.HTTP_409_CONFLICT
                 )
-                
+
             reservation = serializer.save(user=request.user)
             full_data = ReservationSerializer(reservation).data
             return Response(full_data, status=status.HTTP_201_CREATED)
         
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+
+class ReservationSeriesView(APIView):
+    """
+    POST: Crée une réservation récurrente (quotidienne / hebdomadaire,
+    jusqu'à `until` ou pour `count` occurrences), en une transaction.
+
+    Occurrences are pending, or approved right away (with their lock
+    permissions) when requested by an admin. Nothing is created if one
+    occurrence conflicts with an existing reservation, or takes the date
+    and start time of any other one (409, with the conflicting dates), or
+    if its permission would overlap one of the user's (409).
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        serializer = ReservationSeriesSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        reservation_status = 'approved' if request.user.is_staff else 'pending'
+        try:
+            with transaction.atomic():
+                series = serializer.save(user=request.user)
+                reservations = book_series(series, reservation_status)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except ReservationConflict as e:
+            return Response(
+                {"error": "Some occurrences conflict with existing reservations.", "dates": e.dates},
+                status=status.HTTP_409_CONFLICT
+            )
+        except IntegrityError as e:
+            # Approuvée ou réservée entre la vérification et l'insertion
+            if not (is_reservation_conflict(e) or is_slot_taken(e)):
+                raise
+            return Response(
+                {"error": "Some occurrences conflict with existing reservations."},
+                status=status.HTTP_409_CONFLICT
+            )
+        except ValidationError as e:
+            # Chevauche une permission existante de l'utilisateur sur la serrure
+            return Response({"error": " ".join(e.messages)}, status=status.HTTP_409_CONFLICT)
+
+        return Response({
+            **ReservationSeriesSerializer(series).data,
+            "status": reservation_status,
+            "occurrences": [reservation.date for reservation in reservations],
+        }, status=status.HTTP_201_CREATED)
+
+
 # --- VUES POUR LES ADMINS ---
 
 class AllReservationsListView(APIView):
     permission_classes = [IsAdminUser]
 
     def get(self, request):
-        reservations = Reservation.objects.all()
+        reservations = Reservation.objects.all().select_related(
+            'user__keypad_codes', 'user__badge_codes', 'lock__state')
         serializer = ReservationSerializer(reservations, many=True)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
@@ -84,79 +144,83 @@ class UpdateReservationStatusView(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # 1. Logique si on APPROUVE
-        if new_status == 'approved':
-            lock_id = reservation.lock.id_lock
-            date = reservation.date
-            start_time = reservation.start_time
-            end_time = reservation.end_time
-            
-            # Vérification des conflits (inchangée)
-            conflicts = Reservation.objects.filter(
-                lock_id=lock_id,
-                date=date,
-                status='approved'
-            ).filter(
-                Q(start_time__lt=end_time) & Q(end_time__gt=start_time)
-            ).exclude(id=reservation_id)
-            
-            if conflicts.exists():
-                return Response(
-                    {"error": "Cannot approve. This time slot conflicts with another approved reservation."},
-                    status=status.HTTP_409_CONFLICT
-                )
+        previous_status = reservation.status
 
-            # --- CRÉATION DE LA PERMISSION ---
-            try:
-                # On combine la date et l'heure pour créer un DateTime complet
-                start_datetime = datetime.combine(date, start_time)
-                end_datetime = datetime.combine(date, end_time)
-                
-                # On s'assure que le datetime est "conscient" du fuseau horaire (Aware)
-                # (Important si ton Django est configuré avec USE_TZ = True)
-                start_aware = make_aware(start_datetime)
-                end_aware = make_aware(end_datetime)
-
-                # On crée (ou met à jour) la permission
-                # On utilise get_or_create pour éviter les doublons si on clique 2x sur approve
-                LockPermission.objects.get_or_create(
-                    user=reservation.user,
-                    lock=reservation.lock,
-                    start_date=start_aware,
-                    end_date=end_aware,
-                    defaults={
-                        # Tu peux ajouter d'autres champs par défaut ici si nécessaire
-                    }
-                )
-            except Exception as e:
-                return Response(
-                    {"error": f"Failed to create lock permission: {str(e)}"},
-                    status=status.HTTP_500_INTERNAL_SERVER_ERROR
-                )
+        # Statut et permission changent ensemble ; un chevauchement avec une
+        # autre réservation approuvée (même approuvée en parallèle) est refusé
+        # par la contrainte d'exclusion, qui annule toute la transaction.
+        try:
+            with transaction.atomic():
+                reservation.status = new_status
+                reservation.save()
+
+                # 1. Logique si on APPROUVE (une seule permission par
+                # réservation, même si on clique 2x sur approve)
+                if new_status == 'approved':
+                    if not reservation.permissions.exists():
+                        grant_reservation_permissions([reservation])
+
+                # 2. Logique si on REFUSE (ou annule une approbation) : on
+                # supprime la permission créée par cette réservation
+                elif previous_status == 'approved':
+                    revoke_reservation_permissions([reservation])
+        except IntegrityError as e:
+            if not is_reservation_conflict(e):
+                raise
+            return Response(
+                {"error": "Cannot approve. This time slot conflicts with another approved reservation."},
+                status=status.HTTP_409_CONFLICT
+            )
+        except ValidationError as e:
+            # Chevauche une permission existante de l'utilisateur sur la serrure
+            return Response(
+                {"error": f"Failed to create lock permission: {' '.join(e.messages)}"},
+                status=status.HTTP_409_CONFLICT
+            )
 
-        # 2. Logique si on REFUSE (ou annule une approbation)
-        elif new_status == 'rejected':
-            # Si la réservation était déjà approuvée, il faut SUPPRIMER la permission existante
-            if reservation.status == 'approved':
-                start_datetime = datetime.combine(reservation.date, reservation.start_time)
-                end_datetime = datetime.combine(reservation.date, reservation.end_time)
-                start_aware = make_aware(start_datetime)
-                end_aware = make_aware(end_datetime)
-
-                LockPermission.objects.filter(
-                    user=reservation.user,
-                    lock=reservation.lock,
-                    start_date=start_aware,
-                    end_date=end_aware
-                ).delete()
-
-        # Sauvegarde du nouveau statut de la réservation
-        reservation.status = new_status
-        reservation.save()
-        
         serializer = ReservationSerializer(reservation)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
+class BulkReservationStatusView(APIView):
+    """
+    POST: Approuve / refuse des réservations en bloc.
+
+    Body: {"approve": [ids], "reject": [ids]}. Everything happens in one
+    transaction (see reservations.utils.update_reservation_statuses):
+    requests conflicting with an approved reservation, or with an earlier
+    request of the same batch, are left pending and listed in "conflicts".
+    """
+    permission_classes = [IsAdminUser]
+
+    def post(self, request):
+        approve_ids = request.data.get('approve', [])
+        reject_ids = request.data.get('reject', [])
+
+        if not isinstance(approve_ids, list) or not isinstance(reject_ids, list) \
+                or not all(isinstance(i, int) for i in approve_ids + reject_ids):
+            return Response(
+                {"error": "Invalid data format. 'approve' and 'reject' must be lists of ids."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(approve_ids) + len(reject_ids) > MAX_STATUS_BATCH:
+            return Response(
+                {"error": f"At most {MAX_STATUS_BATCH} reservations per call."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            results = update_reservation_statuses(approve_ids, reject_ids)
+        except IntegrityError as e:
+            # Une autre approbation est passée entre-temps : rien n'est modifié
+            if not is_reservation_conflict(e):
+                raise
+            return Response(
+                {"error": "A concurrent approval conflicts with this batch. Nothing was changed."},
+                status=status.HTTP_409_CONFLICT
+            )
+
+        return Response(results, status=status.HTTP_200_OK)
+
 # --- VUE POUR LE FORMULAIRE DE L'UTILISATEUR ---
 
 class AvailableLocksView(APIView):
@@ -190,7 +254,7 @@ class AvailableLocksView(APIView):
             conflicting_lock_ids = conflicting_reservations.values_list('lock_id', flat=True).distinct()
 
             # On ne prend que les serrures 'réservables'
-            available_locks = Lock.objects.filter(is_reservable=True)
+            available_locks = Lock.objects.filter(is_reservable=True).select_related('state')
             
             # On retire celles qui ont un conflit
             available_locks = available_locks.exclude(id_lock__in=conflicting_lock_ids)
@@ -199,4 +263,60 @@ class AvailableLocksView(APIView):
             return Response({"locks": serializer.data}, status=status.HTTP_200_OK)
 
         except Exception as e:
-            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+
+class AvailabilityView(APIView):
+    """
+    Free time of the reservable rooms between `start` and `end`, in one
+    request (see reservations.utils.compute_availability).
+
+    Query parameters:
+    - start, end: ISO datetimes (at most MAX_AVAILABILITY_RANGE apart)
+    - locks: comma-separated lock ids (default: every reservable lock)
+    - min_duration: minimum free slot length, in minutes
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        try:
+            start = parse_datetime(request.query_params.get('start') or '')
+            end = parse_datetime(request.query_params.get('end') or '')
+            if start is None or end is None:
+                raise ValueError("start and end must be ISO datetimes")
+            if start.tzinfo is None:
+                start = make_aware(start)
+            if end.tzinfo is None:
+                end = make_aware(end)
+            if not start < end <= start + MAX_AVAILABILITY_RANGE:
+                raise ValueError(f"end must be after start, within {MAX_AVAILABILITY_RANGE.days} days")
+
+            min_duration = request.query_params.get('min_duration')
+            if min_duration is not None:
+                min_duration = timedelta(minutes=int(min_duration))
+
+            locks = Lock.objects.filter(is_reservable=True).order_by('id_lock')
+            lock_ids = request.query_params.get('locks')
+            if lock_ids:
+                locks = locks.filter(id_lock__in=[int(lock_id) for lock_id in lock_ids.split(',')])
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        locks = list(locks.values('id_lock', 'name'))
+        availability = compute_availability(
+            [lock['id_lock'] for lock in locks], start, end, min_duration)
+
+        return Response({
+            "start": start,
+            "end": end,
+            "locks": [
+                {
+                    **lock,
+                    "free": [
+                        {"start": lower, "end": upper}
+                        for lower, upper in availability[lock['id_lock']]
+                    ],
+                }
+                for lock in locks
+            ],
+        }, status=status.HTTP_200_OK)
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+from users.models import UserKeypadCode, UserBadgeCode
+from users.utils import update_user_keypad_code, update_user_badge_code
+
+
+class Command(BaseCommand):
+    help = (
+        "Liste les codes keypad/badge sans empreinte indexée. Les codes bruts "
+        "ne sont pas récupérables depuis le hash : ils sont complétés au "
+        "prochain login réussi, ou régénérés avec --rotate-keypad/--rotate-badge."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rotate-keypad',
+            action='store_true',
+            help='Génère un nouveau code keypad pour chaque code non indexé'
+        )
+        parser.add_argument(
+            '--rotate-badge',
+            action='store_true',
+            help='Génère un nouveau code badge pour chaque code non indexé'
+        )
+
+    def handle(self, *args, **options):
+        targets = [
+            ('keypad', UserKeypadCode, update_user_keypad_code, options['rotate_keypad']),
+            ('badge', UserBadgeCode, update_user_badge_code, options['rotate_badge']),
+        ]
+
+        for label, model, rotate, should_rotate in targets:
+            legacy = model.objects.filter(
+                code_fingerprint__isnull=True).select_related("user")
+            count = legacy.count()
+            self.stdout.write(f'{count} code(s) {label} sans empreinte.')
+
+            if not (should_rotate and count):
+                continue
+
+            for code in legacy:
+                new_code = rotate(code.user)
+                self.stdout.write(f'{code.user.username} : nouveau code {label} {new_code}')
+
+            self.stdout.write(self.style.SUCCESS(
+                f'{count} code(s) {label} régénéré(s).'))
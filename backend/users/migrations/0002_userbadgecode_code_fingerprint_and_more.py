@@ -0,0 +1,23 @@
+# Generated by Django 6.0 on 2026-10-17 18:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userbadgecode',
+            name='code_fingerprint',
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name='userkeypadcode',
+            name='code_fingerprint',
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True),
+        ),
+    ]
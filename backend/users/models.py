@@ -1,25 +1,46 @@
+import hashlib
+import hmac
 from django.db import models
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.auth.hashers import make_password, check_password
 
 User = get_user_model()
 
 
+def code_fingerprint(raw_code):
+    """
+    Keyed HMAC-SHA256 of a raw badge/keypad code.
+
+    Stored next to the PBKDF2 hash so a login can resolve the candidate row
+    with one indexed lookup and verify a single hash, instead of running
+    check_password against every row.
+    """
+    key = (settings.CREDENTIAL_INDEX_KEY or settings.SECRET_KEY).encode()
+    return hmac.new(key, str(raw_code).encode(), hashlib.sha256).hexdigest()
+
+
 class UserKeypadCode(models.Model):
     user = models.OneToOneField(
         User, on_delete=models.CASCADE, related_name='keypad_codes'
     )
     code_hash = models.CharField(max_length=128)
+    # NULL pour les codes créés avant l'index (remplis au prochain login)
+    code_fingerprint = models.CharField(
+        max_length=64, unique=True, blank=True, null=True)
 
     def set_code(self, raw_code):
         self.code_hash = make_password(raw_code)
+        self.code_fingerprint = code_fingerprint(raw_code)
+        # Gardé jusqu'au save pour les empreintes par serrure (permissions.signals)
+        self._raw_code = raw_code
 
     def check_code(self, raw_code):
         return check_password(raw_code, self.code_hash)
 
     def save(self, *args, **kwargs):
         if not self.code_hash.startswith("pbkdf2_"):
-            self.code_hash = make_password(self.code_hash)
+            self.set_code(self.code_hash)
         super().save(*args, **kwargs)
 
     def __str__(self):
@@ -31,16 +52,22 @@ class UserBadgeCode(models.Model):
         User, on_delete=models.CASCADE, related_name='badge_codes'
     )
     code_hash = models.CharField(max_length=128)
+    # NULL pour les codes créés avant l'index (remplis au prochain login)
+    code_fingerprint = models.CharField(
+        max_length=64, unique=True, blank=True, null=True)
 
     def set_code(self, raw_code):
         self.code_hash = make_password(raw_code)
+        self.code_fingerprint = code_fingerprint(raw_code)
+        # Gardé jusqu'au save pour les empreintes par serrure (permissions.signals)
+        self._raw_code = raw_code
 
     def check_code(self, raw_code):
         return check_password(raw_code, self.code_hash)
 
     def save(self, *args, **kwargs):
         if not self.code_hash.startswith("pbkdf2_"):
-            self.code_hash = make_password(self.code_hash)
+            self.set_code(self.code_hash)
         super().save(*args, **kwargs)
 
     def __str__(self):
@@ -1,7 +1,6 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import Group
-from .models import UserKeypadCode, UserBadgeCode
 
 
 User = get_user_model()
@@ -16,11 +15,20 @@ class UserSerializer(serializers.ModelSerializer):
         fields = ("id", "username", "is_staff",
                   "is_superuser", "email", "has_keypad_code", "has_badge_code")
 
+    # Les listes passent par users.utils.with_credential_flags (annotations
+    # Exists) ; sinon une requête par utilisateur, ou aucune si les codes
+    # ont été chargés par select_related.
     def get_has_keypad_code(self, obj):
-        return UserKeypadCode.objects.filter(user=obj).exists()
+        flag = getattr(obj, "keypad_code_exists", None)
+        if flag is None:
+            flag = hasattr(obj, "keypad_codes")
+        return flag
 
     def get_has_badge_code(self, obj):
-        return UserBadgeCode.objects.filter(user=obj).exists()
+        flag = getattr(obj, "badge_code_exists", None)
+        if flag is None:
+            flag = hasattr(obj, "badge_codes")
+        return flag
 
 
 class GroupSerializer(serializers.ModelSerializer):
@@ -37,7 +45,11 @@ class GroupSerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'members_count']
 
     def get_members_count(self, obj):
-        return obj.user_set.count()
+        # Annoté par GroupView (Count) ; sinon une requête
+        count = getattr(obj, "user_count", None)
+        if count is None:
+            count = obj.user_set.count()
+        return count
 
 
 class AddUserToGroupSerializer(serializers.Serializer):
@@ -7,6 +7,9 @@ from rest_framework.test import APITestCase
 from rest_framework import status
 from django.contrib.auth.models import User
 from django.contrib.auth.models import Group
+from .models import UserKeypadCode, UserBadgeCode
+from .utils import CodeSpaceExhausted, generate_safe_6digit_code
+from unittest.mock import patch
 
 class GroupManagementTests(APITestCase):
     
@@ -60,6 +63,28 @@ class GroupManagementTests(APITestCase):
         self.assertTrue(group.user_set.filter(id=self.normal_user.id).exists())
         print("✅ AC2: Adding members passed")
 
+    def test_bulk_membership_reports_skipped_and_missing(self):
+        """
+        Ajout / retrait groupés : déjà membres et IDs inconnus sont signalés.
+        """
+        group = Group.objects.create(name="Service Bulk")
+        group.user_set.add(self.normal_user)
+        users = User.objects.bulk_create([User(username=f"bulk_{i}") for i in range(100)])
+        user_ids = [u.id for u in users] + [self.normal_user.id, 999999]
+
+        response = self.client.post(f'/users/groups/{group.id}/add_user/', {"user_ids": user_ids}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data["users_added"]), 100)
+        self.assertEqual(response.data["users_skipped"], ["alice"])
+        self.assertEqual(response.data["missing_ids"], [999999])
+        self.assertEqual(group.user_set.count(), 101)
+
+        response = self.client.delete(
+            f'/users/groups/{group.id}/remove_user/', {"user_ids": user_ids}, format='json')
+        self.assertEqual(len(response.data["users_removed"]), 101)
+        self.assertEqual(group.user_set.count(), 0)
+        print("✅ AC5: Bulk membership passed")
+
     def test_ac3_admin_can_delete_group(self):
         """
         Critère 3 : L'admin doit pouvoir supprimer un groupe.
@@ -74,6 +99,31 @@ class GroupManagementTests(APITestCase):
         self.assertEqual(Group.objects.count(), initial_count - 1)
         print("✅ AC3: Group deletion passed")
 
+    def test_group_list_and_members_constant_queries(self):
+        """
+        Liste des groupes et des membres en un nombre fixe de requêtes.
+        """
+        groups = [Group.objects.create(name=f"Groupe {i}") for i in range(10)]
+        for i in range(12):
+            member = User.objects.create_user(username=f"membre_{i}", password="pw")
+            member.groups.add(groups[0], groups[i % 10])
+            UserBadgeCode.objects.create(user=member, code_hash=f"badge-{i}")
+
+        with self.assertNumQueries(1):
+            response = self.client.get('/users/groups/')
+        counts = {g["name"]: g["members_count"] for g in response.data["groups"]}
+        self.assertEqual(counts["Groupe 0"], 12)
+        self.assertEqual(counts["Groupe 1"], 2)
+
+        # groupe (annoté) + une page de membres
+        with self.assertNumQueries(2):
+            response = self.client.get(f'/users/groups/{groups[0].id}/users/', {"limit": 5})
+        self.assertEqual(response.data["members_count"], 12)
+        self.assertEqual(len(response.data["members"]), 5)
+        self.assertTrue(all(m["has_badge_code"] for m in response.data["members"]))
+        self.assertIn("X-Next-Cursor", response)
+        print("✅ AC4: Group listing passed")
+
 
 
 class UserCRUDTests(APITestCase):
@@ -155,3 +205,79 @@ class UserCRUDTests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertFalse(User.objects.filter(id=target_user.id).exists())
         print("✅ User CRUD: Deletion passed")
+
+    def test_list_users_constant_queries(self):
+        """
+        La liste des utilisateurs ne doit pas faire une requête par utilisateur.
+        """
+        for i in range(20):
+            user = User.objects.create_user(username=f"liste_{i}", password="pw")
+            if i % 2:
+                UserKeypadCode.objects.create(user=user, code_hash=f"{i:06}")
+            if i % 3 == 0:
+                UserBadgeCode.objects.create(user=user, code_hash=f"badge-{i}")
+
+        # Une seule requête : utilisateurs annotés avec Exists()
+        with self.assertNumQueries(1):
+            response = self.client.get('/users/')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        flags = {u["username"]: (u["has_keypad_code"], u["has_badge_code"]) for u in response.data["users"]}
+        self.assertEqual(flags["liste_3"], (True, True))
+        self.assertEqual(flags["liste_4"], (False, False))
+        self.assertEqual(flags["admin_crud"], (False, False))
+        print("✅ User CRUD: Listing passed")
+
+    def test_list_users_search_and_pages(self):
+        """
+        Recherche sur username / email, et pagination par curseur avec `limit`.
+        """
+        for i in range(5):
+            User.objects.create_user(username=f"page_{i}", email=f"p{i}@exemple.fr", password="pw")
+        User.objects.create_user(username="autre", email="autre@test.com", password="pw")
+
+        response = self.client.get('/users/', {"search": "EXEMPLE", "limit": 3})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([u["username"] for u in response.data["users"]], ["page_0", "page_1", "page_2"])
+
+        response = self.client.get('/users/', {"search": "exemple", "limit": 3, "cursor": response["X-Next-Cursor"]})
+        self.assertEqual([u["username"] for u in response.data["users"]], ["page_3", "page_4"])
+        self.assertNotIn("X-Next-Cursor", response)
+
+        response = self.client.get('/users/', {"limit": "abc"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        print("✅ User CRUD: Search and pagination passed")
+
+
+class KeypadCodeGenerationTests(TestCase):
+    """
+    Génération des codes clavier : jamais 000000, jamais un code déjà pris.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='holder', password='password123')
+
+    def test_zero_code_never_generated(self):
+        with patch('users.utils.secrets.randbelow', return_value=0):
+            self.assertEqual(generate_safe_6digit_code(), "000001")
+        print("✅ Keypad codes: 000000 never generated")
+
+    def test_taken_code_redrawn(self):
+        code = UserKeypadCode(user=self.user)
+        code.set_code("000042")
+        code.save()
+
+        with patch('users.utils.secrets.randbelow', side_effect=[41, 41, 99]):
+            self.assertEqual(generate_safe_6digit_code(), "000100")
+        print("✅ Keypad codes: taken code redrawn")
+
+    def test_exhausted_code_space_raises(self):
+        code = UserKeypadCode(user=self.user)
+        code.set_code("000042")
+        code.save()
+
+        with patch('users.utils.secrets.randbelow', return_value=41), \
+                patch('users.utils.MAX_CODE_ATTEMPTS', 3):
+            with self.assertRaises(CodeSpaceExhausted):
+                generate_safe_6digit_code()
+        print("✅ Keypad codes: exhaustion raises a clear error")
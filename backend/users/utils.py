@@ -1,25 +1,46 @@
 import secrets
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, OuterRef, Q
 from auth.utils import get_user_by_keypad_code, get_user_by_badge_code
 from .models import UserKeypadCode, UserBadgeCode
 
+User = get_user_model()
 
-def generate_safe_6digit_code():
-    max_value = 1000000  # exclusive
-    random_int = secrets.randbelow(max_value)
 
-    code = f"{random_int:06}"
-    while get_user_by_keypad_code(code):
-        code = f"{secrets.randbelow(max_value):06}"
+MAX_CODE_ATTEMPTS = 100
 
-    return code
+
+class CodeSpaceExhausted(Exception):
+    """No free keypad code was found within MAX_CODE_ATTEMPTS draws."""
+
+
+def generate_safe_6digit_code():
+    """
+    A random 6-digit code no user holds yet. 000000 is never drawn: the
+    keypad login rejects it (see auth.utils.get_user_by_keypad_code).
+    Raises CodeSpaceExhausted when MAX_CODE_ATTEMPTS draws are all taken.
+    """
+    for _ in range(MAX_CODE_ATTEMPTS):
+        code = f"{secrets.randbelow(999999) + 1:06}"
+        if not get_user_by_keypad_code(code):
+            return code
+    raise CodeSpaceExhausted("No free keypad code found, the code space is (nearly) exhausted.")
 
 
 def update_user_keypad_code(user):
-    code = generate_safe_6digit_code()
-    user_code, created = UserKeypadCode.objects.get_or_create(user=user)
-    user_code.set_code(code)
-    user_code.save()
-    return code
+    for _ in range(MAX_CODE_ATTEMPTS):
+        code = generate_safe_6digit_code()
+        user_code = UserKeypadCode.objects.filter(user=user).first() or UserKeypadCode(user=user)
+        user_code.set_code(code)
+        try:
+            with transaction.atomic():
+                user_code.save()
+        except IntegrityError:
+            # Même code attribué en parallèle (empreinte unique) : on en tire un autre
+            continue
+        return code
+    raise CodeSpaceExhausted("No free keypad code could be saved.")
 
 
 def generate_safe_token():
@@ -31,7 +52,50 @@ def generate_safe_token():
 
 def update_user_badge_code(user):
     code = generate_safe_token()
-    user_code, created = UserBadgeCode.objects.get_or_create(user=user)
+    user_code = UserBadgeCode.objects.filter(user=user).first() or UserBadgeCode(user=user)
     user_code.set_code(code)
     user_code.save()
     return code
+
+
+def with_credential_flags(users):
+    """
+    Annotate `users` with keypad_code_exists / badge_code_exists (read by
+    UserSerializer), so serializing a list costs no query per user.
+    """
+    return users.annotate(
+        keypad_code_exists=Exists(UserKeypadCode.objects.filter(user=OuterRef("pk"))),
+        badge_code_exists=Exists(UserBadgeCode.objects.filter(user=OuterRef("pk"))),
+    )
+
+
+def search_users(users, search):
+    """Users whose username or email contains `search` (case insensitive)."""
+    return users.filter(Q(username__icontains=search) | Q(email__icontains=search))
+
+
+def update_group_members(group, user_ids, add=True):
+    """
+    Add (or remove) the users `user_ids` to (from) `group` in one
+    statement, whatever their number; the m2m_changed signals still fire
+    once. Returns (changed, skipped, missing): the (id, username) changed,
+    the (id, username) already in (or not in) the group, and the ids
+    matching no user.
+    """
+    requested = set(user_ids)
+    usernames = dict(User.objects.filter(id__in=requested).values_list("id", "username"))
+    members = set(group.user_set.filter(id__in=usernames).values_list("id", flat=True))
+    changed = set(usernames) - members if add else members
+
+    if changed:
+        with transaction.atomic():
+            if add:
+                group.user_set.add(*changed)
+            else:
+                group.user_set.remove(*changed)
+
+    return (
+        sorted((user_id, usernames[user_id]) for user_id in changed),
+        sorted((user_id, usernames[user_id]) for user_id in set(usernames) - changed),
+        sorted(requested - set(usernames)),
+    )
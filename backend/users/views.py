@@ -6,22 +6,72 @@ from .serializers import UserSerializer, UserRegistrationSerializer
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import Group
 from .serializers import GroupSerializer
+from django.db.models import Count
 from django.shortcuts import get_object_or_404
 from .serializers import AddUserToGroupSerializer
 from .serializers import UserUpdateSerializer
-from .utils import update_user_keypad_code, update_user_badge_code
+from django.db import transaction
+from .utils import (
+    CodeSpaceExhausted, update_user_keypad_code, update_user_badge_code, with_credential_flags,
+    search_users, update_group_members)
 
 User = get_user_model()
 
+MAX_PAGE_SIZE = 1000
+
+
+def _user_list_response(request, users, key, extra=None):
+    """
+    Response listing `users` (ordered by id, with the credential flags)
+    under `key`, next to the `extra` fields.
+
+    Query parameters:
+    - search: filter on username / email (case insensitive)
+    - limit: page size; without it every user is returned. The
+      X-Next-Cursor header of a page is passed as `cursor` to get the
+      next one (keyset on id).
+    """
+    users = with_credential_flags(users).order_by("id")
+    search = request.query_params.get("search")
+    if search:
+        users = search_users(users, search)
+
+    limit = request.query_params.get("limit")
+    if limit is None:
+        return Response({**(extra or {}), key: UserSerializer(users, many=True).data}, status=200)
+
+    try:
+        limit = min(int(limit), MAX_PAGE_SIZE)
+        cursor = request.query_params.get("cursor")
+        if limit < 1:
+            raise ValueError("Invalid limit.")
+        if cursor:
+            users = users.filter(id__gt=int(cursor))
+    except ValueError:
+        return Response({"error": "Invalid limit or cursor."}, status=400)
+
+    page = list(users[:limit + 1])
+    has_next = len(page) > limit
+    page = page[:limit]
+
+    response = Response({**(extra or {}), key: UserSerializer(page, many=True).data}, status=200)
+    if has_next:
+        next_cursor = str(page[-1].id)
+        params = request.query_params.copy()
+        params["cursor"] = next_cursor
+        response["X-Next-Cursor"] = next_cursor
+        response["Link"] = f'<{request.build_absolute_uri(request.path)}?{params.urlencode()}>; rel="next"'
+    return response
+
 
 class UsersView(APIView):
     def get(self, request):
+        """Users, ordered by id (search and pagination: see _user_list_response)."""
         user = request.user
-        if user.is_authenticated and user.is_staff:
-            users = User.objects.all()
-            return Response({"users": UserSerializer(users, many=True).data}, status=200)
+        if not (user.is_authenticated and user.is_staff):
+            return Response({"error": "Unauthorized to fetch users"}, status=401)
 
-        return Response({"error": "Unauthorized to fetch users"}, status=401)
+        return _user_list_response(request, User.objects.all(), "users")
 
     def post(self, request):
         user = request.user
@@ -33,17 +83,22 @@ class UsersView(APIView):
         serializer = UserRegistrationSerializer(data=request.data)
 
         if serializer.is_valid():
-            user = serializer.save()
             message = "Successfully created user."
             keypad, badge = None, None
+            try:
+                # Pas d'utilisateur à moitié créé si aucun code n'est libre
+                with transaction.atomic():
+                    user = serializer.save()
 
-            if request.data.get("keypad"):
-                keypad = update_user_keypad_code(user)
-                message += f" Keypad code : {keypad}."
+                    if request.data.get("keypad"):
+                        keypad = update_user_keypad_code(user)
+                        message += f" Keypad code : {keypad}."
 
-            if request.data.get("badge"):
-                badge = update_user_badge_code(user)
-                message += f" Badge code : {badge}."
+                    if request.data.get("badge"):
+                        badge = update_user_badge_code(user)
+                        message += f" Badge code : {badge}."
+            except CodeSpaceExhausted as e:
+                return Response({"error": str(e)}, status=503)
 
             return Response({
                 'message': message,
@@ -81,7 +136,10 @@ class UsersView(APIView):
             }
 
             if request.data.get("keypad"):
-                new_code = update_user_keypad_code(updated_user)
+                try:
+                    new_code = update_user_keypad_code(updated_user)
+                except CodeSpaceExhausted as e:
+                    return Response({"error": str(e)}, status=503)
                 response_data["message"] += f" New keypad code generated: {
                     new_code}."
 
@@ -115,7 +173,7 @@ class GroupView(APIView):
     def get(self, request):
         user = request.user
         if user.is_authenticated and user.is_staff:
-            groups = Group.objects.all()
+            groups = Group.objects.annotate(user_count=Count("user")).order_by("id")
             serializer = GroupSerializer(groups, many=True)
             return Response({"groups": serializer.data}, status=status.HTTP_200_OK)
 
@@ -152,22 +210,22 @@ class AddUserToGroupView(APIView):
         serializer = AddUserToGroupSerializer(data=request.data)
 
         if serializer.is_valid():
-            user_ids = serializer.validated_data['user_ids']
-            users = User.objects.filter(id__in=user_ids)
+            added, skipped, missing = update_group_members(
+                group, serializer.validated_data['user_ids'])
 
-            if not users.exists():
+            if not (added or skipped):
                 return Response(
                     {"error": "Aucun utilisateur trouvé avec ces IDs."},
                     status=status.HTTP_404_NOT_FOUND
                 )
 
-            for user in users:
-                group.user_set.add(user)
-
             return Response({
-                "message": f"{users.count()} utilisateur(s) ajouté(s) au groupe '{group.name}'.",
+                "message": f"{len(added)} utilisateur(s) ajouté(s) au groupe '{group.name}'.",
                 "group": group.name,
-                "users_added": [user.username for user in users]
+                "users_added": [username for _, username in added],
+                # Déjà membres / IDs inconnus
+                "users_skipped": [username for _, username in skipped],
+                "missing_ids": missing,
             }, status=status.HTTP_200_OK)
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -182,14 +240,13 @@ class GroupUsersView(APIView):
                 status=status.HTTP_401_UNAUTHORIZED
             )
 
-        group = get_object_or_404(Group, id=group_id)
-        users = group.user_set.all()
-        serializer = UserSerializer(users, many=True)
-        return Response({
+        group = get_object_or_404(
+            Group.objects.annotate(user_count=Count("user")), id=group_id)
+        # Recherche et pagination des membres : voir _user_list_response
+        return _user_list_response(request, group.user_set.all(), "members", {
             "group": group.name,
-            "members_count": users.count(),
-            "members": serializer.data
-        }, status=status.HTTP_200_OK)
+            "members_count": group.user_count,
+        })
 
 
 class RemoveUserFromGroupView(APIView):
@@ -206,22 +263,22 @@ class RemoveUserFromGroupView(APIView):
             data=request.data)  # on réutilise le même serializer
 
         if serializer.is_valid():
-            user_ids = serializer.validated_data['user_ids']
-            users = User.objects.filter(id__in=user_ids)
+            removed, skipped, missing = update_group_members(
+                group, serializer.validated_data['user_ids'], add=False)
 
-            if not users.exists():
+            if not (removed or skipped):
                 return Response(
                     {"error": "Aucun utilisateur trouvé avec ces IDs."},
                     status=status.HTTP_404_NOT_FOUND
                 )
 
-            for user in users:
-                group.user_set.remove(user)
-
             return Response({
-                "message": f"{users.count()} utilisateur(s) retiré(s) du groupe '{group.name}'.",
+                "message": f"{len(removed)} utilisateur(s) retiré(s) du groupe '{group.name}'.",
                 "group": group.name,
-                "users_removed": [user.username for user in users]
+                "users_removed": [username for _, username in removed],
+                # Pas membres / IDs inconnus
+                "users_skipped": [username for _, username in skipped],
+                "missing_ids": missing,
             }, status=status.HTTP_200_OK)
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)